@@ -0,0 +1,138 @@
+import json
+import math
+import struct
+import time
+
+# Binary alert, version 1 (all big-endian):
+#   magic "FSAL" | version u8 | device id length u8 | flags u16 (reserved, 0)
+#   | battery level float32 (NaN if unknown) | timestamp u64 (ms since epoch)
+#   | device id (UTF-8) | JPEG bytes
+ALERT_MAGIC = b'FSAL'
+ALERT_VERSION = 1
+_HEADER = struct.Struct('!4sBBHfQ')
+
+JPEG_MAGIC = b'\xff\xd8'
+
+# Spool records are a format tag followed by the alert as it arrived; the
+# MQTT v5 variant also keeps its user properties:
+#   tag | properties length u16 | user properties (JSON object) | JPEG bytes
+RECORD_BINARY = b'B'
+RECORD_JSON = b'J'
+RECORD_PROPERTIES = b'P'
+_PROPERTIES_LENGTH = struct.Struct('!H')
+
+
+class AlertFormatError(ValueError):
+    """Raised when an alert payload cannot be decoded."""
+
+
+def encode_alert(device_id: str, image: bytes, battery_level: float | None = None,
+                 timestamp_ms: int | None = None) -> bytes:
+    device = device_id.encode('utf-8')
+    if len(device) > 255:
+        raise AlertFormatError("Device id is longer than 255 bytes")
+    header = _HEADER.pack(ALERT_MAGIC, ALERT_VERSION, len(device), 0,
+                          math.nan if battery_level is None else battery_level,
+                          int(time.time() * 1000) if timestamp_ms is None else timestamp_ms)
+    return b''.join((header, device, image))
+
+
+def decode_binary_alert(payload: bytes) -> dict:
+    """Decodes a binary alert. The image is a memoryview into `payload`, not a copy."""
+    if len(payload) < _HEADER.size:
+        raise AlertFormatError("Binary alert is shorter than its header")
+    magic, version, device_len, _, battery_level, timestamp_ms = _HEADER.unpack_from(payload)
+    if magic != ALERT_MAGIC:
+        raise AlertFormatError("Not a binary alert")
+    if version != ALERT_VERSION:
+        raise AlertFormatError(f"Unsupported binary alert version {version}")
+    image_start = _HEADER.size + device_len
+    view = memoryview(payload)
+    return {
+        "device_id": bytes(view[_HEADER.size:image_start]).decode('utf-8'),
+        "battery_level": None if math.isnan(battery_level) else round(battery_level, 3),
+        "timestamp": timestamp_ms / 1000,
+        "image": view[image_start:],
+    }
+
+
+def decode_properties_alert(payload: bytes, properties) -> dict | None:
+    """
+    Decodes the MQTT v5 variant: the payload is the raw JPEG and the metadata
+    travels as user properties. Returns None if the message is not of that form.
+    """
+    user_properties = dict(getattr(properties, "UserProperty", None) or ())
+    if "device_id" not in user_properties or not payload.startswith(JPEG_MAGIC):
+        return None
+    return _properties_alert(user_properties, memoryview(payload))
+
+
+def _properties_alert(user_properties: dict, image: memoryview) -> dict:
+    battery_level = user_properties.get("battery_level")
+    timestamp = user_properties.get("timestamp")
+    return {
+        "device_id": user_properties["device_id"],
+        "battery_level": float(battery_level) if battery_level else None,
+        "timestamp": float(timestamp) if timestamp else None,
+        "image": image,
+    }
+
+
+def decode_alert(payload: bytes, properties=None) -> dict:
+    """
+    Decodes an alert in any supported format, picked by its first bytes:
+    binary ("FSAL"), raw JPEG with MQTT v5 user properties, or the legacy
+    JSON document with a base64 "image_data" field.
+    """
+    if payload.startswith(ALERT_MAGIC):
+        return decode_binary_alert(payload)
+    if properties is not None:
+        alert = decode_properties_alert(payload, properties)
+        if alert is not None:
+            return alert
+    try:
+        return json.loads(payload)
+    except ValueError as e:
+        raise AlertFormatError(f"Unrecognized alert payload: {e}") from e
+
+
+def spool_record(payload: bytes, properties=None) -> tuple:
+    """
+    Returns the parts of the spool record for an alert as it arrived: a format
+    tag and the payload untouched, plus the user properties for the MQTT v5
+    variant. Only the first bytes are looked at; decoding happens when the
+    record is drained, off the MQTT network thread.
+    """
+    if payload.startswith(ALERT_MAGIC):
+        return (RECORD_BINARY, payload)
+    user_properties = dict(getattr(properties, "UserProperty", None) or ())
+    if "device_id" in user_properties and payload.startswith(JPEG_MAGIC):
+        encoded = json.dumps(user_properties).encode('utf-8')
+        if len(encoded) > 0xFFFF:
+            raise AlertFormatError("User properties are too long")
+        return (RECORD_PROPERTIES, _PROPERTIES_LENGTH.pack(len(encoded)), encoded, payload)
+    return (RECORD_JSON, payload)
+
+
+def decode_spool_record(record: bytes) -> dict:
+    """
+    Decodes a record written from spool_record(). Legacy JSON alerts keep
+    their base64 "image_data"; it is decoded on the alert pipeline.
+    """
+    tag, view = record[:1], memoryview(record)[1:]
+    if tag == RECORD_BINARY:
+        return decode_binary_alert(view)
+    if tag == RECORD_PROPERTIES:
+        (length,) = _PROPERTIES_LENGTH.unpack_from(view)
+        start = _PROPERTIES_LENGTH.size + length
+        user_properties = json.loads(bytes(view[_PROPERTIES_LENGTH.size:start]))
+        return _properties_alert(user_properties, view[start:])
+    if tag == RECORD_JSON:
+        try:
+            alert = json.loads(bytes(view))
+        except ValueError as e:
+            raise AlertFormatError(f"Unrecognized alert payload: {e}") from e
+        if not isinstance(alert, dict) or not alert.get("device_id"):
+            raise AlertFormatError("Alert has no device id")
+        return alert
+    raise AlertFormatError(f"Unknown spool record format {tag!r}")
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AlertPipeline:
+    """
+    Runs alert processing on its own asyncio loop, off paho's network thread.
+
+    Alerts are routed to one of `workers` bounded queues by a stable hash of
+    their device id. Each queue is drained by a single worker task, so alerts
+    of one device are handled in order while different devices proceed
+    concurrently. Blocking backend calls are expected to go through
+    `run_blocking`, which uses a thread pool sized for the workers.
+    """
+
+    def __init__(self, handler, workers: int = 8, queue_size: int = 256, submit_timeout: float = 5.0):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.submit_timeout = submit_timeout
+        self.dropped = 0
+        self.loop = asyncio.new_event_loop()
+        # Every worker may have an upload, a metadata write and a notification in flight
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=workers * 3, thread_name_prefix="alert"))
+        self._queues = []
+        self._tasks = []
+        self._thread = threading.Thread(target=self._run, name="alert-pipeline", daemon=True)
+
+    def start(self):
+        ready = threading.Event()
+        self.loop.call_soon(ready.set)
+        self._thread.start()
+        ready.wait()
+        asyncio.run_coroutine_threadsafe(self._start_workers(), self.loop).result()
+
+    def stop(self, timeout: float = 10.0):
+        """Waits for queued alerts to be processed, then stops the loop."""
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(timeout)
+        finally:
+            asyncio.run_coroutine_threadsafe(self._cancel_workers(), self.loop).result(timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _start_workers(self):
+        per_worker = max(1, self.queue_size // self.workers)
+        self._queues = [asyncio.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self._tasks = [self.loop.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def _cancel_workers(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _drain(self):
+        for queue in self._queues:
+            await queue.join()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            device_id, alert = await queue.get()
+            try:
+                await self.handler(alert)
+            except Exception as e:
+                print(f"[Alert pipeline] Error processing alert from {device_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def submit(self, device_id: str, alert) -> bool:
+        """
+        Queues an alert from any thread. Blocks while the device's queue is full,
+        which holds back paho (and so the broker) instead of growing memory;
+        gives up after `submit_timeout` seconds and returns False.
+        """
+        queue = self._queues[zlib.crc32(device_id.encode()) % self.workers]
+        # The timeout runs on the loop, so whether the put happened is decided there,
+        # atomically, rather than raced against a cancel from this thread
+        future = asyncio.run_coroutine_threadsafe(self._put(queue, (device_id, alert)), self.loop)
+        try:
+            queued = future.result(self.submit_timeout + 5)
+        except TimeoutError:
+            # Loop unresponsive; the put may still have completed just now
+            queued = not future.cancel() and future.exception() is None and future.result()
+        if not queued:
+            self.dropped += 1
+            print(f"[Alert pipeline] Queue full, could not queue alert from {device_id}")
+        return queued
+
+    async def _put(self, queue: asyncio.Queue, item) -> bool:
+        try:
+            await asyncio.wait_for(queue.put(item), self.submit_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def run_blocking(self, func, *args):
+        """Runs a blocking backend call in the pipeline's thread pool."""
+        return await self.loop.run_in_executor(None, func, *args)
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
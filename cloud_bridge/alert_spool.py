@@ -0,0 +1,243 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+# Record: payload length u32 | crc32 of the payload u32 | state u8 | payload.
+# The header is written after the payload, so a record torn by a crash has
+# length 0 (or a bad checksum) and marks the end of the segment.
+_RECORD = struct.Struct('!IIB')
+_STATE_OFFSET = 8
+STATE_PENDING = 0
+STATE_DONE = 1
+
+SEGMENT_PREFIX = "spool-"
+SEGMENT_SUFFIX = ".seg"
+
+
+class _Segment:
+    def __init__(self, path: str, index: int, size: int):
+        self.path = path
+        self.index = index
+        exists = os.path.exists(path)
+        self.file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self.file.truncate(size)
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.write_offset = 0
+        self.outstanding = 0
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class AlertSpool:
+    """
+    Append-only on-disk spool for alerts, so they survive backend outages and
+    bridge restarts without holding up MQTT.
+
+    Alerts are appended to fixed-size, memory-mapped segment files with a
+    checksum per record, and handed out again in order by `next`. A record is
+    marked done by `ack` once the backend has it; `retry` puts it back at the
+    front and pauses hand-out with exponential backoff, so a backend outage
+    costs one failed attempt per backoff step rather than one per alert.
+    `requeue` puts it back without pausing.
+    Segments are deleted once all their records are done. At most
+    `max_segments` segments are kept; when they are full `append` refuses the
+    alert. On startup, pending records of existing segments are recovered and
+    a torn tail from a crash is discarded.
+
+    Delivery is at least once: an alert processed just before a crash, but
+    not yet marked done, is handed out again.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024, max_segments: int = 64,
+                 sync: bool = True, max_backoff: float = 60.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.sync = sync
+        self.max_backoff = max_backoff
+        self.appended = 0
+        self.drained = 0
+        self.rejected = 0
+        self.recovered = 0
+        self.backlog = 0
+        self.backlog_bytes = 0
+        self._segments = {}
+        self._ready = deque()   # (segment index, offset) of records to hand out
+        self._acks = deque(maxlen=100000)  # monotonic times of recent acks, for the drain rate
+        self._backoff = 0.0
+        self._paused_until = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{index:08d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        indexes = sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                         if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        for index in indexes:
+            segment = _Segment(self._segment_path(index), index, self.segment_size)
+            offset = 0
+            while offset + _RECORD.size <= segment.size:
+                length, crc, state = _RECORD.unpack_from(segment.map, offset)
+                end = offset + _RECORD.size + length
+                if length == 0 or end > segment.size:
+                    break
+                if zlib.crc32(segment.map[offset + _RECORD.size:end]) != crc:
+                    print(f"[Alert spool] Corrupt record in {segment.path} at {offset}, discarding the rest")
+                    break
+                if state == STATE_PENDING:
+                    self._ready.append((index, offset))
+                    segment.outstanding += 1
+                    self.backlog += 1
+                    self.backlog_bytes += length
+                offset = end
+            segment.write_offset = offset
+            # Anything after the last good record is garbage to be overwritten
+            segment.map[offset:offset + _RECORD.size] = bytes(min(_RECORD.size, segment.size - offset))
+            self._segments[index] = segment
+        self.recovered = self.backlog
+        for index in indexes[:-1]:
+            if self._segments[index].outstanding == 0:
+                self._remove_segment(index)
+        if not self._segments:
+            self._segments[0] = _Segment(self._segment_path(0), 0, self.segment_size)
+
+    def _active(self) -> _Segment:
+        return self._segments[max(self._segments)]
+
+    def _remove_segment(self, index: int):
+        segment = self._segments.pop(index)
+        segment.close()
+        os.remove(segment.path)
+
+    def append(self, *parts) -> bool:
+        """
+        Persists an alert, given as one or more buffers that are stored back to
+        back as one record. Returns False if it does not fit in the spool's disk budget.
+        """
+        length = sum(len(part) for part in parts)
+        size = _RECORD.size + length
+        with self._cond:
+            segment = self._active()
+            if segment.write_offset + size > segment.size:
+                if size > self.segment_size or len(self._segments) >= self.max_segments:
+                    self.rejected += 1
+                    return False
+                index = segment.index + 1
+                segment = self._segments[index] = _Segment(self._segment_path(index), index, self.segment_size)
+            offset = segment.write_offset
+            start = offset + _RECORD.size
+            crc = 0
+            for part in parts:
+                segment.map[start:start + len(part)] = part
+                crc = zlib.crc32(part, crc)
+                start += len(part)
+            _RECORD.pack_into(segment.map, offset, length, crc, STATE_PENDING)
+            if self.sync:
+                page_start = offset - offset % mmap.ALLOCATIONGRANULARITY
+                segment.map.flush(page_start, offset + size - page_start)
+            segment.write_offset = offset + size
+            segment.outstanding += 1
+            self.appended += 1
+            self.backlog += 1
+            self.backlog_bytes += length
+            self._ready.append((segment.index, offset))
+            self._cond.notify()
+        return True
+
+    def next(self, timeout: float = None) -> tuple | None:
+        """
+        Blocks until a record may be handed out and returns (record_id, payload),
+        or None on timeout or once the spool is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                now = time.monotonic()
+                if self._ready and now >= self._paused_until:
+                    break
+                wait = None if deadline is None else deadline - now
+                if self._ready:
+                    wait = self._paused_until - now if wait is None else min(wait, self._paused_until - now)
+                if wait is not None and wait <= 0:
+                    return None
+                self._cond.wait(wait)
+            record_id = self._ready.popleft()
+            segment = self._segments[record_id[0]]
+            offset = record_id[1]
+            length = _RECORD.unpack_from(segment.map, offset)[0]
+            payload = segment.map[offset + _RECORD.size:offset + _RECORD.size + length]
+        return record_id, payload
+
+    def ack(self, record_id: tuple):
+        """Marks a record as done; its segment is deleted once nothing in it is pending."""
+        index, offset = record_id
+        with self._cond:
+            segment = self._segments.get(index)
+            if segment is None:
+                return
+            segment.map[offset + _STATE_OFFSET] = STATE_DONE
+            segment.outstanding -= 1
+            self.backlog -= 1
+            self.backlog_bytes -= _RECORD.unpack_from(segment.map, offset)[0]
+            self.drained += 1
+            self._acks.append(time.monotonic())
+            self._backoff = 0.0
+            if segment.outstanding == 0 and index != max(self._segments):
+                self._remove_segment(index)
+
+    def retry(self, record_id: tuple):
+        """Puts a record back at the front and holds off hand-out for a while."""
+        with self._cond:
+            self._ready.appendleft(record_id)
+            self._backoff = min(self.max_backoff, self._backoff * 2 or 1.0)
+            self._paused_until = time.monotonic() + self._backoff
+            self._cond.notify()
+
+    def requeue(self, record_id: tuple):
+        """Puts a record back at the front without backoff, e.g. when it could not be handed on locally."""
+        with self._cond:
+            self._ready.appendleft(record_id)
+            self._cond.notify()
+
+    def drain_rate(self, window: float = 10.0) -> float:
+        """Acked records per second over the last `window` seconds."""
+        with self._cond:
+            cutoff = time.monotonic() - window
+            while self._acks and self._acks[0] < cutoff:
+                self._acks.popleft()
+            return len(self._acks) / window
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.backlog,
+            "backlog_bytes": self.backlog_bytes,
+            "segments": len(self._segments),
+            "appended": self.appended,
+            "drained": self.drained,
+            "rejected": self.rejected,
+            "recovered": self.recovered,
+            "drain_rate": self.drain_rate(),
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            for segment in self._segments.values():
+                segment.map.flush()
+                segment.close()
+            self._segments.clear()
@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import Future
+from backends.firebase.backend_interface import BackendService
+from backends.firebase.status_writer import DeviceStatusWriter
+from backends.firebase.image_uploader import ImageUploader
+from backends.fake.fake_object_store import FakeObjectStore
+from backends.fake.fake_messaging import FakeMessaging
+from backends.firebase.notification_dispatcher import NotificationDispatcher
+from backends.firebase.command_router import CommandRouter
+
+class FakeBackend(BackendService):
+    """
+    In-memory stand-in for FirebaseBackend, for benchmarks and local runs.
+    Each call sleeps for a configurable latency to mimic the network round
+    trips of Storage, Firestore and FCM, and records what it was given.
+    Images, metadata and notifications go through the same ImageUploader,
+    DeviceStatusWriter and NotificationDispatcher as FirebaseBackend, backed
+    by FakeObjectStore, a dict and FakeMessaging. `notifications` records
+    every alert handed to send_fcm_notification; what was actually sent ends
+    up in `messaging.sent`. Commands are injected with `push_commands`.
+    """
+
+    def __init__(self, on_command_callback=None, upload_latency=0.05, write_latency=0.02, notify_latency=0.03,
+                 write_window=0.1, upload_workers=8, notify_cooldown=30.0):
+        super().__init__(on_command_callback)
+        self.upload_latency = upload_latency
+        self.write_latency = write_latency
+        self.notify_latency = notify_latency
+        self.devices = {}
+        self.notifications = []
+        self._lock = threading.Lock()
+        self.object_store = FakeObjectStore(upload_latency=upload_latency)
+        self.images = self.object_store.objects
+        self.image_uploader = ImageUploader(self.object_store, max_workers=upload_workers)
+        self.status_writer = DeviceStatusWriter(self._commit_device_status, window=write_window,
+                                                always_write=("lastUpdated",))
+        self.messaging = FakeMessaging(latency=notify_latency)
+        self.notifier = NotificationDispatcher(self.messaging, self._build_notification, cooldown=notify_cooldown)
+        self.command_router = CommandRouter({
+            command: self._command_handler(command) for command in ("start_stream", "stop_stream", "update_firmware")
+        })
+
+    def upload_image(self, device_id: str, image_data: bytes) -> str:
+        return self.image_uploader.upload(device_id, image_data)
+
+    def save_alert_metadata(self, device_id: str, image_url: str, battery_level: float) -> Future:
+        return self.status_writer.update(device_id, {
+            "id": device_id,
+            "batteryLevel": battery_level,
+            "lastImageUrl": image_url,
+            "lastUpdated": time.time(),
+        })
+
+    def _commit_device_status(self, changes: dict):
+        time.sleep(self.write_latency)
+        with self._lock:
+            for device_id, fields in changes.items():
+                self.devices.setdefault(device_id, {}).update(fields)
+
+    def send_fcm_notification(self, device_id: str, image_url: str):
+        self.notifier.notify(device_id, image_url)
+        with self._lock:
+            self.notifications.append((time.time(), device_id, image_url))
+
+    def _build_notification(self, device_id: str, image_url: str, count: int) -> dict:
+        return {"topic": f"alerts_{device_id}", "image_url": image_url, "count": count}
+
+    def close(self):
+        self.image_uploader.close()
+        self.status_writer.close()
+        self.notifier.close()
+
+    def _command_handler(self, command: str):
+        def handle(device_id: str):
+            if self._on_command_callback:
+                self._on_command_callback(command, device_id)
+        return handle
+
+    def push_commands(self, changes):
+        """Feeds (kind, device_id, data, version) changes as the commands listener would."""
+        self.command_router.on_snapshot(changes)
+
+    def listen_for_commands(self, device_id: str = None, callback=None):
+        pass
@@ -0,0 +1,98 @@
+"""
+Local stub of the MediaMTX config API used by MediaControlClient
+(/v3/config/paths/list, /add/<name>, /delete/<name>).
+
+    python fake_mediamtx.py --port 9997 --delay-ms 50
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeMediaMTX(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), delay: float = 0.0):
+        super().__init__(address, _Handler)
+        self.delay = delay
+        self.paths = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str):
+        server = self.server
+        time.sleep(server.delay)
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length)) if length else {}
+        with server.lock:
+            server.requests.append((method, url.path))
+            if method == "GET" and url.path == "/v3/config/paths/list":
+                query = parse_qs(url.query)
+                page = int(query.get("page", ["0"])[0])
+                per_page = int(query.get("itemsPerPage", ["100"])[0])
+                names = sorted(server.paths)
+                items = [server.paths[name] for name in names[page * per_page:(page + 1) * per_page]]
+                page_count = max(1, -(-len(names) // per_page))
+                return self._reply(200, {"itemCount": len(names), "pageCount": page_count, "items": items})
+            if method == "POST" and url.path.startswith("/v3/config/paths/add/"):
+                name = url.path[len("/v3/config/paths/add/"):]
+                if name in server.paths:
+                    return self._reply(400, {"error": "path already exists"})
+                server.paths[name] = dict(body, name=name)
+                return self._reply(200)
+            if method == "DELETE" and url.path.startswith("/v3/config/paths/delete/"):
+                name = url.path[len("/v3/config/paths/delete/"):]
+                if server.paths.pop(name, None) is None:
+                    return self._reply(404, {"error": "path not found"})
+                return self._reply(200)
+        self._reply(404, {"error": "not found"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub MediaMTX config API.")
+    parser.add_argument("--port", type=int, default=9997)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = FakeMediaMTX(("0.0.0.0", args.port), delay=args.delay_ms / 1000)
+    print(f"Fake MediaMTX listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
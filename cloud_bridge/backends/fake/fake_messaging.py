@@ -0,0 +1,27 @@
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeMessaging:
+    """
+    Stand-in for firebase_admin.messaging's send_each. Records every message
+    and sleeps once per call to mimic the batch round trip.
+    """
+
+    def __init__(self, latency=0.03):
+        self.latency = latency
+        self.sent = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_each(self, messages: list):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            self.sent.extend(messages)
+        return SimpleNamespace(
+            responses=[SimpleNamespace(success=True, message_id=str(i), exception=None) for i in range(len(messages))],
+            success_count=len(messages),
+            failure_count=0,
+        )
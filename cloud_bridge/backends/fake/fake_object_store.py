@@ -0,0 +1,29 @@
+import random
+import threading
+import time
+
+
+class FakeObjectStore:
+    """
+    In-memory object store for ImageUploader. Sleeps to mimic request round
+    trips and can fail a fraction of uploads to exercise retries. Uploads are
+    create-only, like GCSObjectStore's.
+    """
+
+    def __init__(self, upload_latency=0.05, failure_rate=0.0):
+        self.upload_latency = upload_latency
+        self.failure_rate = failure_rate
+        self.objects = {}
+        self.upload_calls = 0
+        self._lock = threading.Lock()
+
+    def upload(self, name: str, data) -> bool:
+        time.sleep(self.upload_latency)
+        with self._lock:
+            self.upload_calls += 1
+            if random.random() < self.failure_rate:
+                raise ConnectionError("Simulated upload failure")
+            if name in self.objects:
+                return False
+            self.objects[name] = bytes(data)
+            return True
@@ -6,8 +6,33 @@ class BackendService(ABC):
         self._on_command_callback = on_command_callback
 
     @abstractmethod
+    def upload_image(self, device_id: str, image_data: bytes) -> str:
+        """Uploads an alert image and returns the URL it is stored under."""
+        pass
+
+    @abstractmethod
+    def save_alert_metadata(self, device_id: str, image_url: str, battery_level: float):
+        """
+        Stores the alert metadata for a device. May return a Future that
+        resolves once the write is durable, if the backend buffers writes.
+        """
+        pass
+
+    @abstractmethod
+    def send_fcm_notification(self, device_id: str, image_url: str):
+        """Notifies the users watching a device about a new alert."""
+        pass
+
     def save_alert(self, device_id: str, image_data: bytes, battery_level: float):
         """Saves an alert to the backend, including the image and metadata."""
+        image_url = self.upload_image(device_id, image_data)
+        pending = self.save_alert_metadata(device_id, image_url, battery_level)
+        if pending is not None:
+            pending.result()
+        return image_url
+
+    def close(self):
+        """Flushes buffered writes and releases resources."""
         pass
 
     @abstractmethod
@@ -0,0 +1,61 @@
+import threading
+
+
+class CommandRouter:
+    """
+    Routes changes of `commands/{device_id}` documents to command handlers.
+
+    Fed by one collection-level listener rather than one listener per device,
+    so a device whose command document appears after startup is routed like
+    any other. The router keeps a table of known devices and the version
+    (update time) of the last document it saw for each; a change that is not
+    newer than that, e.g. one redelivered when the listener reconnects, is
+    ignored. The first snapshot only fills the table, so commands already
+    sitting in Firestore are not replayed on every restart.
+
+    With `owns`, only devices for which it returns True are routed, so that
+    sharded bridges each handle their own slice of the fleet.
+    """
+
+    def __init__(self, handlers: dict, owns=None):
+        self.handlers = handlers
+        self.owns = owns
+        self.devices = {}  # device_id -> version of the last document seen
+        self.dispatched = 0
+        self.duplicates = 0
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def on_snapshot(self, changes):
+        """Takes (kind, device_id, data, version) tuples; kind is "added", "modified" or "removed"."""
+        with self._lock:
+            baseline = not self._initialized
+            self._initialized = True
+            to_dispatch = []
+            for kind, device_id, data, version in changes:
+                if self.owns is not None and not self.owns(device_id):
+                    continue
+                if kind == "removed":
+                    self.devices.pop(device_id, None)
+                    continue
+                last = self.devices.get(device_id)
+                if last is not None and version is not None and version <= last:
+                    self.duplicates += 1
+                    continue
+                self.devices[device_id] = version
+                if not baseline and data and 'command' in data:
+                    to_dispatch.append((device_id, data['command']))
+        for device_id, command in to_dispatch:
+            self.dispatch(device_id, command)
+
+    def dispatch(self, device_id: str, command: str):
+        handler = self.handlers.get(command)
+        if handler is None:
+            print(f"[Commands listener] Unknown command for {device_id}: {command}")
+            return
+        print(f"[Commands listener] Received command for {device_id}: {command}")
+        self.dispatched += 1
+        try:
+            handler(device_id)
+        except Exception as e:
+            print(f"[Commands listener] Error handling {command} for {device_id}: {e}")
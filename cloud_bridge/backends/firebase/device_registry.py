@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+def _plain(value):
+    """Converts a Firestore value to something JSON can hold, or None if it has no local meaning."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    # Sentinels such as SERVER_TIMESTAMP; the change feed brings back the real value
+    return None
+
+
+class DeviceRegistry:
+    """
+    In-memory view of the `devices` collection: the fields of each device
+    document (batteryLevel, lastImageUrl, lastUpdated, streaming,
+    firmwareVersion, ...) keyed by device id.
+
+    Entries are loaded lazily through `loader(device_id)` on a miss, kept
+    fresh by `apply_change` from a change feed, and evicted least recently
+    used beyond `max_entries` or `ttl` seconds after they were loaded. The
+    registry can be saved to and restored from a JSON snapshot, so a restarted
+    bridge only needs the changes since `high_water` (the newest lastUpdated
+    it has seen) rather than the whole collection.
+    """
+
+    def __init__(self, loader=None, max_entries: int = 10000, ttl: float = 3600.0):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.high_water = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # device_id -> (loaded_at, fields)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, device_id: str) -> dict | None:
+        """Returns the cached fields of a device without loading it."""
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return None
+            self._entries.move_to_end(device_id)
+            return dict(entry[1])
+
+    def get(self, device_id: str) -> dict | None:
+        """Returns the fields of a device, loading it on a miss. None if the device does not exist."""
+        fields = self.peek(device_id)
+        if fields is not None:
+            self.hits += 1
+            return fields
+        self.misses += 1
+        if self.loader is None:
+            return None
+        fields = self.loader(device_id)
+        if fields is None:
+            return None
+        return dict(self._store(device_id, fields, replace=True))
+
+    def update(self, device_id: str, fields: dict):
+        """Merges locally known fields, e.g. after a committed write."""
+        self._store(device_id, fields, replace=False)
+
+    def apply_change(self, kind: str, device_id: str, fields: dict | None):
+        """Applies a change feed entry; kind is "added", "modified" or "removed"."""
+        if kind == "removed":
+            with self._lock:
+                self._entries.pop(device_id, None)
+            return
+        self._store(device_id, fields or {}, replace=True)
+
+    def _store(self, device_id: str, fields: dict, replace: bool) -> dict:
+        plain = {k: v for k, v in _plain(fields).items() if v is not None or fields[k] is None}
+        with self._lock:
+            entry = self._entries.get(device_id)
+            if entry is not None and not replace:
+                entry[1].update(plain)
+                plain = entry[1]
+            self._entries[device_id] = (time.monotonic(), plain)
+            self._entries.move_to_end(device_id)
+            updated = plain.get("lastUpdated")
+            if isinstance(updated, float) and updated > self.high_water:
+                self.high_water = updated
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return plain
+
+    def save(self, path: str):
+        with self._lock:
+            snapshot = {
+                "high_water": self.high_water,
+                "devices": {device_id: dict(fields) for device_id, (_, fields) in self._entries.items()},
+            }
+        # The autosave thread and shutdown may save at the same time; one writer at a time per path
+        with self._save_lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, path)
+
+    def autosave(self, path: str, interval: float):
+        """Saves a snapshot every `interval` seconds from a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save(path)
+                except OSError as e:
+                    print(f"[Device registry] Saving snapshot to {path} failed: {e}")
+        threading.Thread(target=run, name="registry-autosave", daemon=True).start()
+
+    def load(self, path: str) -> bool:
+        """Restores a snapshot written by save(). Returns False if there is none."""
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            print(f"[Device registry] Ignoring unreadable snapshot {path}: {e}")
+            return False
+        now = time.monotonic()
+        with self._lock:
+            for device_id, fields in snapshot.get("devices", {}).items():
+                self._entries[device_id] = (now, fields)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.high_water = max(self.high_water, snapshot.get("high_water", 0.0))
+        return True
@@ -1,17 +1,25 @@
 
 import firebase_admin
 from firebase_admin import credentials, firestore, storage, messaging
-import uuid
 import os
-from threading import Thread
-import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
 from google.cloud.firestore_v1.watch import ChangeType
-import requests
+from google.cloud.firestore_v1.base_query import FieldFilter
 from .backend_interface import BackendService
+from .status_writer import DeviceStatusWriter
+from .image_uploader import ImageUploader
+from .object_store import GCSObjectStore
+from .notification_dispatcher import NotificationDispatcher
+from .command_router import CommandRouter
+from .media_control import MediaControlClient
+from .device_registry import DeviceRegistry
 
 class FirebaseBackend(BackendService):
-    def __init__(self, on_command_callback):
+    def __init__(self, on_command_callback, shard=None):
         super().__init__(on_command_callback)
+        # Only the shard owning a device acts on its commands
+        self.shard = shard
         service_account_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", None)
         if not service_account_path:
             raise ValueError("FIREBASE_SERVICE_ACCOUNT_PATH environment variable must be set.")
@@ -28,96 +36,147 @@ class FirebaseBackend(BackendService):
         firebase_admin.initialize_app(cred, {'storageBucket': storage_bucket})
         self.db = firestore.client()
         self.bucket = storage.bucket()
-        self.devices = []        
+        self.registry_path = os.getenv("DEVICE_REGISTRY_PATH", "device_registry.json")
+        if shard is not None and shard.sharded:
+            # Shards on one host must not autosave over each other's snapshots
+            root, ext = os.path.splitext(self.registry_path)
+            self.registry_path = f"{root}.shard-{shard.index}{ext}"
+        self.registry = DeviceRegistry(
+            self._load_device,
+            max_entries=int(os.getenv("DEVICE_REGISTRY_SIZE", "10000")),
+            ttl=float(os.getenv("DEVICE_REGISTRY_TTL_S", "3600")),
+        )
+        if self.registry.load(self.registry_path):
+            print(f"Restored {len(self.registry)} devices from {self.registry_path}")
+        self.registry.autosave(self.registry_path, float(os.getenv("DEVICE_REGISTRY_SAVE_S", "60")))
+        self.image_uploader = ImageUploader(
+            GCSObjectStore(self.bucket),
+            max_workers=int(os.getenv("UPLOAD_WORKERS", "8")),
+        )
+        self.status_writer = DeviceStatusWriter(
+            self._commit_device_status,
+            window=int(os.getenv("FIRESTORE_WRITE_WINDOW_MS", "100")) / 1000,
+            always_write=("lastUpdated",),
+            registry=self.registry,
+        )
+        # Started once the status writer exists, as the feed is reconciled with it
+        self._devices_watch = None
+        self.watch_devices()
+        self.notifier = NotificationDispatcher(
+            messaging,
+            self._build_notification,
+            cooldown=float(os.getenv("FCM_COOLDOWN_S", "30")),
+            rate=float(os.getenv("FCM_TOPIC_RATE_PER_MIN", "4")) / 60,
+            burst=float(os.getenv("FCM_TOPIC_BURST", "4")),
+        )
+        self.media = MediaControlClient(
+            self.mtxmedia_url,
+            reconcile_interval=float(os.getenv("MEDIA_RECONCILE_S", "60")),
+        )
+        self.command_router = CommandRouter({
+            "start_stream": self.start_stream,
+            "stop_stream": self.stop_stream,
+            "update_firmware": self.update_firmware,
+        }, owns=shard.owns if shard is not None else None)
+        self._commands_watch = None
         self.listen_for_commands()
 
-    def save_alert(self, device_id: str, image_data: bytes, battery_level: float):
-        # 1. Upload the image to Firebase Storage
-        filename = f"{device_id}/{uuid.uuid4()}.jpg"
-        blob = self.bucket.blob(filename)
-        blob.upload_from_string(image_data, content_type='image/jpeg')
-        image_url = filename
+    def _load_device(self, device_id: str) -> dict | None:
+        return self.db.collection("devices").document(device_id).get().to_dict()
 
+    def watch_devices(self):
+        # Only documents changed since the newest one we already know; without a snapshot that is
+        # everything from now on, and other devices are loaded on first use
+        since = self.registry.high_water or datetime.now(timezone.utc).timestamp()
+        query = self.db.collection("devices").where(
+            filter=FieldFilter("lastUpdated", ">=", datetime.fromtimestamp(since, timezone.utc)))
+        self._devices_watch = query.on_snapshot(self._on_devices_snapshot)
+
+    def _on_devices_snapshot(self, col_snapshot, changes, read_time):
+        kinds = {ChangeType.ADDED: "added", ChangeType.MODIFIED: "modified", ChangeType.REMOVED: "removed"}
+        for change in changes:
+            kind, fields = kinds[change.type], change.document.to_dict()
+            self.registry.apply_change(kind, change.document.id, fields)
+            # The feed may carry an older snapshot than our last commit, or another shard's write
+            self.status_writer.observe(change.document.id, None if kind == "removed" else fields)
+
+    def upload_image(self, device_id: str, image_data: bytes) -> str:
+        # Named by content hash, so a redelivered alert does not upload its image again
+        return self.image_uploader.upload(device_id, image_data)
+
+    def save_alert_metadata(self, device_id: str, image_url: str, battery_level: float) -> Future:
         data = {
             "id": device_id,
             "batteryLevel": battery_level,
             "lastImageUrl": image_url,
             "liveStreamUrl": f'rtsp://{self.host_ip}/live/{device_id}', 
             "lastUpdated": firestore.SERVER_TIMESTAMP,
-            "name": f"Nest Box {device_id}"
         }
-        # 2. Store the alert data in Firestore
-        self.db.collection("devices").document(device_id).set(
-            data
-        )
-        return image_url
+        # Only fields that changed since this bridge last wrote them are sent; a name is only given
+        # to devices that have no document yet, never overwritten
+        if self.registry.get(device_id) is None:
+            data["name"] = f"Nest Box {device_id}"
+        # Coalesced with other alerts in the same window; the Future resolves once the batch is committed
+        return self.status_writer.update(device_id, data)
+
+    def _commit_device_status(self, changes: dict):
+        batch = self.db.batch()
+        devices_ref = self.db.collection("devices")
+        for device_id, fields in changes.items():
+            batch.set(devices_ref.document(device_id), fields, merge=True)
+        batch.commit()
+
+    def close(self):
+        if self._devices_watch is not None:
+            self._devices_watch.unsubscribe()
+        if self._commands_watch is not None:
+            self._commands_watch.unsubscribe()
+        self.image_uploader.close()
+        self.status_writer.close()
+        self.notifier.close()
+        self.media.close()
+        try:
+            self.registry.save(self.registry_path)
+        except (OSError, ValueError) as e:
+            # The snapshot is only a warm start; losing it must not break shutdown
+            print(f"[Device registry] Saving snapshot to {self.registry_path} failed: {e}")
     
     def send_fcm_notification(self, device_id: str, image_url: str):
-        """Sends a push notification to the specified device."""
+        """Queues a push notification for the users watching the device."""
+        # Repeated alerts within the cooldown are folded into one notification
+        self.notifier.notify(device_id, image_url)
+
+    def _build_notification(self, device_id: str, image_url: str, count: int) -> messaging.Message:
         # The topic is a unique identifier for the device, which the Android app will subscribe to.
         topic = f'alerts_{device_id}'
-        
-        # Create the message payload
-        message = messaging.Message(
+        if count == 1:
+            body = f"A myna bird with eggs was detected in nest box {device_id}."
+        else:
+            body = f"A myna bird with eggs was detected {count} times in nest box {device_id}."
+        return messaging.Message(
             notification=messaging.Notification(
                 title="Myna Bird Detected!",
-                body=f"A myna bird with eggs was detected in nest box {device_id}."
+                body=body
             ),
             data={
                 "image_url": image_url,
-                "device_id": device_id
+                "device_id": device_id,
+                "count": str(count)
             },
             topic=topic
         )
-        
-        # Send the message
-        try:
-            response = messaging.send(message)
-            print(f"Successfully sent message to topic {topic}. Response: {response}")
-        except Exception as e:
-            print(f"Error sending message: {e}")
 
     def listen_for_commands(self):
-        # Get all device IDs from the Firestore collection
-        devices_ref = self.db.collection("devices")
-        devices_stream = devices_ref.stream()
-        self.devices = [doc.id for doc in devices_stream]
-        print(f"Listening for commands for devices: {self.devices}")
-        # Create a thread to run the listener to avoid blocking the main thread
-        listener_thread = Thread(target=self._run_listener)
-        listener_thread.daemon = True
-        listener_thread.start()
-
-    def _run_listener(self):
-
-        # A simple, single-document listener
-        def on_snapshot(doc_snapshot, changes, read_time):
-            if len(doc_snapshot) == 0:
-                return
-            try:
-                id = doc_snapshot[0].reference.path.split('/')[-1]
-            except Exception as e:
-                print(f"Error getting document ID: {e}")
-                return
-            for change in changes:
-                if change.type == ChangeType.MODIFIED:
-                    command_data = change.document.to_dict()
-                    if command_data and 'command' in command_data:
-                        command = command_data['command']
-                        print(f"[Commands listener] Received command for {id}: {command}")
-                        if command == "start_stream":
-                            self.start_stream(id)
-                        elif command == "stop_stream":
-                            self.stop_stream(id)
-                        elif command == "update_firmware":
-                            self.update_firmware(id)
-
-        
-        for device_id in self.devices:
-            doc_ref = self.db.collection("commands").document(device_id)
-            doc_ref.on_snapshot(on_snapshot)
-        while True:
-            time.sleep(1)
+        # One listener on the whole collection; its watch stream runs on the client's own thread
+        self._commands_watch = self.db.collection("commands").on_snapshot(self._on_commands_snapshot)
+        print("Listening for commands on the commands collection")
+
+    def _on_commands_snapshot(self, col_snapshot, changes, read_time):
+        kinds = {ChangeType.ADDED: "added", ChangeType.MODIFIED: "modified", ChangeType.REMOVED: "removed"}
+        self.command_router.on_snapshot(
+            (kinds[change.type], change.document.id, change.document.to_dict(), change.document.update_time)
+            for change in changes
+        )
 
     def call_command_callback(self, command: str, device_id: str):
         if self._on_command_callback:
@@ -126,29 +185,15 @@ class FirebaseBackend(BackendService):
     def start_stream(self, device_id: str):
         print(f"Starting stream for device {device_id}.")
         self.call_command_callback("start_stream", device_id)
-        path = f"{self.mtxmedia_url}/v3/config/paths/add/live/{device_id}"
-        data = { "name": f"live/{device_id}" }
-        try:
-            response = requests.post(path, json=data)
-            if response.status_code == 200:
-                print(f"Stream started successfully for device {device_id}.")
-            else:
-                print(f"Failed to start stream for device {device_id}. Status code: {response.status_code}, Response: {response.text}")
-        except requests.RequestException as e:
-            print(f"Error starting stream for device {device_id}: {e}")
+        self.registry.update(device_id, {"streaming": True})
+        # Applied to MediaMTX by the media control thread
+        self.media.set_streaming(device_id, True)
 
     def stop_stream(self, device_id: str):
         print(f"Stopping stream for device {device_id}.")
         self.call_command_callback("stop_stream", device_id)
-        path = f"{self.mtxmedia_url}/v3/config/paths/delete/live/{device_id}"
-        try:
-            response = requests.delete(path)
-            if response.status_code == 200:
-                print(f"Stream stopped successfully for device {device_id}.")
-            else:
-                print(f"Failed to stop stream for device {device_id}. Status code: {response.status_code}, Response: {response.text}")
-        except requests.RequestException as e:
-            print(f"Error stopping stream for device {device_id}: {e}")
+        self.registry.update(device_id, {"streaming": False})
+        self.media.set_streaming(device_id, False)
 
     def update_firmware(self, device_id: str):
         print(f"Updating firmware for device {device_id}.")
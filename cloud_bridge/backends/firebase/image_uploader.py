@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class ImageUploader:
+    """
+    Content-addressed image uploads on a bounded thread pool.
+
+    Images are stored as `<device_id>/<sha256>.jpg`, so a retransmitted alert
+    (e.g. a QoS 1 redelivery) maps to the object that is already there. A
+    recently uploaded name is answered from an in-memory LRU set; otherwise
+    the upload is create-only and the store reports an object that was already
+    there, so a duplicate costs one request and no existence check.
+    Identical uploads that are in flight at the same time share one attempt.
+
+    `store` needs `upload(name, data) -> bool`, returning False if the object
+    already existed. Failed uploads are retried with exponential backoff;
+    being create-only also makes a retry after an unacknowledged success
+    harmless (see GCSObjectStore).
+    """
+
+    def __init__(self, store, max_workers: int = 8, recent_size: int = 4096,
+                 retries: int = 3, retry_delay: float = 0.5):
+        self.store = store
+        self.recent_size = recent_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.uploads = 0
+        self.dedup_hits = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=1024)
+        self._recent = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+
+    @staticmethod
+    def object_name(device_id: str, image_data) -> str:
+        return f"{device_id}/{hashlib.sha256(image_data).hexdigest()}.jpg"
+
+    def upload(self, device_id: str, image_data) -> str:
+        """Uploads an image unless it is already stored and returns its object name."""
+        return self.submit(device_id, image_data).result()
+
+    def submit(self, device_id: str, image_data) -> Future:
+        name = self.object_name(device_id, image_data)
+        with self._lock:
+            if name in self._recent:
+                self._recent.move_to_end(name)
+                self.dedup_hits += 1
+                future = Future()
+                future.set_result(name)
+                return future
+            future = self._in_flight.get(name)
+            if future is not None:
+                self.dedup_hits += 1
+                return future
+            future = self._in_flight[name] = self._executor.submit(self._upload, name, image_data)
+        return future
+
+    def _upload(self, name: str, image_data) -> str:
+        start = time.perf_counter()
+        try:
+            created = self._upload_with_retries(name, image_data)
+            with self._lock:
+                if created:
+                    self.uploads += 1
+                    self._latencies.append(time.perf_counter() - start)
+                else:
+                    self.dedup_hits += 1
+            with self._lock:
+                self._recent[name] = None
+                if len(self._recent) > self.recent_size:
+                    self._recent.popitem(last=False)
+            return name
+        finally:
+            with self._lock:
+                self._in_flight.pop(name, None)
+
+    def _upload_with_retries(self, name: str, image_data) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                return self.store.upload(name, image_data)
+            except Exception as e:
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                print(f"[Image uploader] Upload of {name} failed ({e}), retrying in {delay:.1f} s")
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            requests = self.uploads + self.dedup_hits
+            return {
+                "uploads": self.uploads,
+                "dedup_hits": self.dedup_hits,
+                "dedup_hit_rate": self.dedup_hits / requests if requests else 0.0,
+                "failures": self.failures,
+                "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+                "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else None,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
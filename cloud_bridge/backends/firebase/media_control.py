@@ -0,0 +1,123 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+STREAM_PATH_PREFIX = "live/"
+
+
+class MediaControlClient:
+    """
+    Keeps MediaMTX's configured `live/<device_id>` paths in line with which
+    devices should be streaming.
+
+    `set_streaming` only records the desired state and wakes a worker thread,
+    so the caller (the Firestore listener) never waits on the media server.
+    The worker reconciles: one bulk `/v3/config/paths/list` call, then an add
+    or delete for each device whose path differs from its desired state.
+    Toggles that arrive while a pass is running are folded into the next one,
+    and a full pass also runs every `reconcile_interval` seconds to repair
+    drift, e.g. after MediaMTX restarts with its runtime config gone. Devices
+    that were never toggled are left alone.
+
+    Requests share one keep-alive session, with timeouts and retries with
+    backoff on connection errors and 5xx responses. Adds and deletes are
+    idempotent at this level, so retrying them is safe.
+    """
+
+    def __init__(self, base_url: str, timeout: tuple = (2.0, 5.0), retries: int = 3, backoff: float = 0.5,
+                 reconcile_interval: float = 60.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.reconcile_interval = reconcile_interval
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.passes = 0
+        self.requests = 0
+        self.failures = 0
+        self._desired = {}  # device_id -> should be streaming
+        self._dirty = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="media-control", daemon=True)
+        self._thread.start()
+
+    def set_streaming(self, device_id: str, streaming: bool):
+        with self._cond:
+            self._desired[device_id] = streaming
+            self._dirty = True
+            self._cond.notify()
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._dirty or self._closed, self.reconcile_interval)
+                if self._closed:
+                    return
+                self._dirty = False
+                desired = dict(self._desired)
+            try:
+                self.reconcile(desired)
+            except requests.RequestException as e:
+                # The next toggle or periodic pass tries again
+                print(f"[Media control] Reconciliation failed: {e}")
+
+    def reconcile(self, desired: dict):
+        """
+        Makes MediaMTX's stream paths match `desired` (device_id -> streaming).
+        A device that fails is logged and counted without holding up the
+        others; the next pass tries it again.
+        """
+        if not desired:
+            return
+        configured = self.list_paths()
+        for device_id, streaming in desired.items():
+            name = f"{STREAM_PATH_PREFIX}{device_id}"
+            try:
+                if streaming and name not in configured:
+                    self._request("post", f"/v3/config/paths/add/{name}", json={"name": name},
+                                  ok_if=(400, "already exists"))
+                    print(f"Stream started successfully for device {device_id}.")
+                elif not streaming and name in configured:
+                    self._request("delete", f"/v3/config/paths/delete/{name}", ok_if=(404, "not found"))
+                    print(f"Stream stopped successfully for device {device_id}.")
+            except requests.RequestException as e:
+                self.failures += 1
+                print(f"[Media control] Could not update stream of {device_id}: {e}")
+        self.passes += 1
+
+    def list_paths(self) -> set:
+        names = set()
+        page = 0
+        while True:
+            body = self._request("get", "/v3/config/paths/list", params={"page": page, "itemsPerPage": 1000}).json()
+            names.update(item["name"] for item in body.get("items", ()))
+            page += 1
+            if page >= body.get("pageCount", 1):
+                return names
+
+    def _request(self, method: str, path: str, ok_if: tuple = None, **kwargs) -> requests.Response:
+        """
+        `ok_if` = (status, text) accepts that error as success, e.g. a retried
+        add whose first attempt did go through and now reports "already exists".
+        """
+        self.requests += 1
+        response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        if response.status_code == 200:
+            return response
+        if ok_if is not None and response.status_code == ok_if[0] and ok_if[1] in response.text:
+            return response
+        raise requests.HTTPError(
+            f"{method.upper()} {path} returned {response.status_code}: {response.text}", response=response)
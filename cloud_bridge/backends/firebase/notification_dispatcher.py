@@ -0,0 +1,123 @@
+import threading
+import time
+
+# FCM accepts at most this many messages per send_each call
+MAX_BATCH_MESSAGES = 500
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class NotificationDispatcher:
+    """
+    Sends alert notifications off the alert path.
+
+    `notify` only records the alert. A dispatcher thread wakes every
+    `batch_window` seconds and sends one notification per device that has
+    pending alerts, is out of its `cooldown` and gets a token from its topic's
+    bucket (`rate` per second, up to `burst`). Alerts arriving in the meantime
+    are folded into that one notification, which carries how many there were
+    and the latest image. Notifications due in the same wake-up go out
+    together through `transport.send_each`.
+
+    `build_message(device_id, image_url, count)` turns a pending entry into
+    whatever the transport sends.
+    """
+
+    def __init__(self, transport, build_message, cooldown: float = 30.0, rate: float = 4 / 60,
+                 burst: float = 4, batch_window: float = 0.5, max_batch: int = MAX_BATCH_MESSAGES):
+        self.transport = transport
+        self.build_message = build_message
+        self.cooldown = cooldown
+        self.rate = rate
+        self.burst = burst
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.alerts = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self._pending = {}    # device_id -> [count, latest image url]
+        self._last_sent = {}  # device_id -> monotonic time of the last notification
+        self._buckets = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="fcm-dispatcher", daemon=True)
+        self._thread.start()
+
+    def notify(self, device_id: str, image_url: str):
+        with self._cond:
+            pending = self._pending.get(device_id)
+            if pending is None:
+                self._pending[device_id] = [1, image_url]
+            else:
+                pending[0] += 1
+                pending[1] = image_url
+            self.alerts += 1
+            self._cond.notify()
+
+    def close(self, timeout: float = 10.0):
+        """Sends what is due now and stops; alerts still in cooldown are dropped."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                closed = self._closed
+                if not closed:
+                    # Let alerts for other devices join this batch
+                    self._cond.wait_for(lambda: self._closed, self.batch_window)
+                due = self._take_due(time.monotonic())
+            self._send(due)
+            if closed:
+                return
+
+    def _take_due(self, now: float) -> list:
+        due = []
+        for device_id, (count, image_url) in list(self._pending.items()):
+            if now - self._last_sent.get(device_id, -self.cooldown) < self.cooldown:
+                continue
+            bucket = self._buckets.get(device_id)
+            if bucket is None:
+                bucket = self._buckets[device_id] = TokenBucket(self.rate, self.burst)
+            if not bucket.take(now):
+                continue
+            del self._pending[device_id]
+            self._last_sent[device_id] = now
+            due.append((device_id, image_url, count))
+        return due
+
+    def _send(self, due: list):
+        for start in range(0, len(due), self.max_batch):
+            chunk = due[start:start + self.max_batch]
+            messages = [self.build_message(*entry) for entry in chunk]
+            try:
+                response = self.transport.send_each(messages)
+            except Exception as e:
+                print(f"[FCM dispatcher] Sending {len(messages)} notification(s) failed: {e}")
+                self.failed += len(messages)
+                continue
+            self.batches += 1
+            for (device_id, _, count), result in zip(chunk, response.responses):
+                if result.success:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    print(f"[FCM dispatcher] Notification for {device_id} ({count} alert(s)) failed: {result.exception}")
@@ -0,0 +1,47 @@
+from google.api_core.exceptions import PreconditionFailed
+from google.cloud.storage.exceptions import InvalidResponse
+from google.cloud.storage.retry import DEFAULT_RETRY
+
+# Images larger than this go through a resumable session, which resumes from
+# the last chunk the server persisted. Must be a multiple of 256 KiB.
+RESUMABLE_CHUNK_SIZE = 256 * 1024
+
+
+class GCSObjectStore:
+    """
+    ImageUploader store on top of a Firebase Storage bucket. The bucket's
+    client keeps one authorized HTTP session that all uploads share.
+
+    Uploads are create-only: content-addressed objects never change, so an
+    object that is already stored, or a retry of an upload that did land,
+    fails the precondition and is reported as a duplicate. An image of up to
+    one chunk is sent as a single multipart request and retried whole; a
+    resumable session would resend that same chunk after a failure and cost
+    an extra round trip to open. Larger images use a resumable session, in
+    which a failed chunk is retried without resending what already landed.
+    """
+
+    def __init__(self, bucket, content_type: str = 'image/jpeg'):
+        self.bucket = bucket
+        self.content_type = content_type
+
+    def upload(self, name: str, data) -> bool:
+        """Stores an object unless it exists. Returns False if it was already there."""
+        blob = self.bucket.blob(name)
+        try:
+            if len(data) <= RESUMABLE_CHUNK_SIZE:
+                # The Storage client only accepts bytes; binary alerts hand over a memoryview
+                blob.upload_from_string(bytes(data), content_type=self.content_type,
+                                        if_generation_match=0, retry=DEFAULT_RETRY)
+            else:
+                with blob.open("wb", chunk_size=RESUMABLE_CHUNK_SIZE, content_type=self.content_type,
+                               if_generation_match=0, retry=DEFAULT_RETRY) as f:
+                    f.write(data)
+        except PreconditionFailed:
+            return False
+        except InvalidResponse as e:
+            # Resumable sessions report HTTP errors unconverted
+            if getattr(e.response, "status_code", None) != 412:
+                raise
+            return False
+        return True
@@ -0,0 +1,144 @@
+import threading
+from concurrent.futures import Future
+
+# Firestore rejects batches with more writes than this
+MAX_BATCH_WRITES = 500
+
+
+class DeviceStatusWriter:
+    """
+    Write-behind buffer for per-device status documents.
+
+    Updates for the same device arriving within `window` seconds are merged
+    into one write, and all devices touched in a window are flushed together
+    by a single `commit(changes)` call, where `changes` maps device ids to the
+    fields to merge into their documents. Fields whose value has not changed
+    since the last successful commit are left out, except for `always_write`
+    fields such as server timestamps; devices left with nothing to write cost
+    no round trip at all.
+
+    The diff is against what this writer itself committed, never against a
+    cache of the document, which may lag behind Firestore. Documents read
+    back from Firestore (e.g. from a change feed) are passed to `observe`:
+    fields someone else has changed since are forgotten, so the next update
+    writes them again. If a DeviceRegistry is given, committed fields are
+    also merged into it.
+
+    `update` returns a Future that resolves once the commit holding the update
+    has succeeded, or fails with the commit's exception.
+    """
+
+    def __init__(self, commit, window: float = 0.1, max_batch: int = MAX_BATCH_WRITES,
+                 always_write: tuple = (), registry=None):
+        self._commit = commit
+        self.window = window
+        self.max_batch = max_batch
+        self.always_write = set(always_write)
+        self.registry = registry
+        self.updates = 0
+        self.commits = 0
+        self.writes = 0
+        self._pending = {}  # device_id -> (fields, futures)
+        self._written = {}  # device_id -> fields as of the last successful commit
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+        self._thread.start()
+
+    def update(self, device_id: str, fields: dict) -> Future:
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Status writer is closed")
+            pending = self._pending.get(device_id)
+            if pending is None:
+                pending = self._pending[device_id] = ({}, [])
+            pending[0].update(fields)
+            pending[1].append(future)
+            self.updates += 1
+            self._cond.notify()
+        return future
+
+    def close(self, timeout: float = 10.0):
+        """Flushes whatever is pending and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # Give other updates for the same devices one window to pile up
+                self._cond.wait_for(lambda: self._closed, self.window)
+                pending, self._pending = self._pending, {}
+            self._flush(pending)
+
+    def _flush(self, pending: dict):
+        changes = {}
+        futures = {}
+        for device_id, (fields, device_futures) in pending.items():
+            written = self._last_written(device_id)
+            changed = {k: v for k, v in fields.items()
+                       if k in self.always_write or k not in written or written[k] != v}
+            if changed:
+                changes[device_id] = changed
+                futures[device_id] = device_futures
+            else:
+                for future in device_futures:
+                    future.set_result(None)
+
+        device_ids = list(changes)
+        for start in range(0, len(device_ids), self.max_batch):
+            chunk = {device_id: changes[device_id] for device_id in device_ids[start:start + self.max_batch]}
+            try:
+                self._commit(chunk)
+            except Exception as e:
+                print(f"[Status writer] Commit of {len(chunk)} device(s) failed: {e}")
+                for device_id in chunk:
+                    # The document may or may not have been written; send everything next time
+                    self.forget(device_id)
+                    for future in futures[device_id]:
+                        future.set_exception(e)
+                continue
+            self.commits += 1
+            self.writes += len(chunk)
+            for device_id, fields in chunk.items():
+                self._committed(device_id, fields)
+                for future in futures[device_id]:
+                    future.set_result(None)
+
+    def observe(self, device_id: str, fields: dict | None):
+        """
+        Reconciles with the device document as read from Firestore (None if it
+        was deleted). Fields whose stored value differs from what this writer
+        last committed are forgotten; stale and foreign snapshots alike then
+        cost one redundant write instead of a lost one.
+        """
+        with self._cond:
+            written = self._written.get(device_id)
+            if written is None:
+                return
+            if fields is None:
+                del self._written[device_id]
+                return
+            for key in [k for k, v in written.items() if k in fields and fields[k] != v]:
+                del written[key]
+
+    def forget(self, device_id: str):
+        with self._cond:
+            self._written.pop(device_id, None)
+
+    def _last_written(self, device_id: str) -> dict:
+        with self._cond:
+            return dict(self._written.get(device_id, {}))
+
+    def _committed(self, device_id: str, fields: dict):
+        with self._cond:
+            self._written.setdefault(device_id, {}).update(
+                (k, v) for k, v in fields.items() if k not in self.always_write)
+        if self.registry is not None:
+            self.registry.update(device_id, fields)
@@ -0,0 +1,60 @@
+"""
+Wire size and bridge-side CPU cost per alert: legacy JSON/base64 vs binary.
+
+Decoding mirrors what the bridge does before handing the image to the
+backend (json.loads + b64decode, or header parse + memoryview slice).
+
+    python bench_alert_format.py --sizes 20000,60000,150000
+"""
+import argparse
+import base64
+import json
+import random
+import time
+
+from alert_format import decode_alert, encode_alert
+
+
+def legacy_payload(device_id: str, image: bytes) -> bytes:
+    return json.dumps({
+        "device_id": device_id,
+        "image_data": base64.b64encode(image).decode('utf-8'),
+        "battery_level": 3.87,
+    }).encode()
+
+
+def decode_legacy(payload: bytes) -> bytes:
+    alert = decode_alert(payload)
+    return base64.b64decode(alert["image_data"])
+
+
+def decode_binary(payload: bytes) -> memoryview:
+    return decode_alert(payload)["image"]
+
+
+def per_call_us(func, payload: bytes, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func(payload)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare alert payload formats.")
+    parser.add_argument("--sizes", type=str, default="20000,60000,150000", help="JPEG sizes in bytes")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    device_id = "fs32-a1b2c3d4e5f6"
+    print(f"{'jpeg':>8} | {'json bytes':>10} {'decode us':>9} | {'bin bytes':>10} {'decode us':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        image = b'\xff\xd8' + random.randbytes(size - 4) + b'\xff\xd9'
+        legacy = legacy_payload(device_id, image)
+        binary = encode_alert(device_id, image, 3.87)
+        assert decode_legacy(legacy) == image and decode_binary(binary) == image
+        print(f"{size:8d} | {len(legacy):10d} {per_call_us(decode_legacy, legacy, args.iterations):9.1f} "
+              f"| {len(binary):10d} {per_call_us(decode_binary, binary, args.iterations):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
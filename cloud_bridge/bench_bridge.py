@@ -0,0 +1,143 @@
+"""
+Alert throughput benchmark for the cloud bridge.
+
+Runs CloudBridge in-process against FakeBackend and a local MQTT broker
+(e.g. `mosquitto -p 1883`), floods it with dummy_nestbox-style alerts from
+several publishers and reports how long the bridge takes to store and
+notify all of them, for each alert worker count.
+
+Before that, and without the broker, it spools a burst of alerts from a
+single device and checks that their status writes were coalesced: about
+one Firestore commit per write window, not one per alert.
+
+    python bench_bridge.py --devices 50 --alerts-per-device 4 --workers 1,8,32
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import paho.mqtt.client as mqtt
+
+from alert_format import encode_alert, spool_record
+from backends.fake.fake_backend import FakeBackend
+from cloud_bridge import CloudBridge
+
+
+def make_image(image_size: int) -> bytes:
+    return b'\xff\xd8' + random.randbytes(image_size - 4) + b'\xff\xd9'
+
+
+def make_payload(device_id: str, image_size: int) -> bytes:
+    image = make_image(image_size)
+    return json.dumps({
+        "device_id": device_id,
+        "image_data": base64.b64encode(image).decode('utf-8'),
+        "battery_level": round(random.uniform(3.5, 4.2), 2),
+    }).encode()
+
+
+def run(args, workers: int):
+    os.environ["ALERT_WORKERS"] = str(workers)
+    os.environ["SPOOL_DIR"] = tempfile.mkdtemp(prefix="bench-spool-")
+    backend = FakeBackend(upload_latency=args.upload_ms / 1000,
+                          write_latency=args.write_ms / 1000,
+                          notify_latency=args.notify_ms / 1000,
+                          write_window=args.write_window_ms / 1000)
+    bridge = CloudBridge(backend)
+    bridge.start_processing()
+    bridge.client.connect(args.host, args.port, 60)
+    bridge.client.loop_start()
+
+    publishers = []
+    for i in range(args.publishers):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"bench-pub-{i}-{random.randint(0, 1 << 30)}")
+        client.connect(args.host, args.port, 60)
+        client.loop_start()
+        publishers.append(client)
+    time.sleep(1)  # let the bridge subscribe
+
+    device_ids = [f"nestbox_{i:04d}" for i in range(args.devices)]
+    # A fresh image per alert; repeated images would be deduplicated by the uploader
+    payloads = [[make_payload(d, args.image_size) for d in device_ids] for _ in range(args.alerts_per_device)]
+    total = args.devices * args.alerts_per_device
+
+    start = time.perf_counter()
+    for n in range(args.alerts_per_device):
+        for i, device_id in enumerate(device_ids):
+            publishers[i % len(publishers)].publish(f"nestbox/{device_id}/alert", payloads[n][i], qos=1)
+    while len(backend.notifications) < total and time.perf_counter() - start < args.timeout:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    done = len(backend.notifications)
+
+    for client in publishers:
+        client.loop_stop()
+        client.disconnect()
+    bridge.client.loop_stop()
+    bridge.client.disconnect()
+    bridge.stop_processing()
+
+    shutil.rmtree(os.environ["SPOOL_DIR"])
+
+    serial = total * (args.upload_ms + args.write_ms + args.notify_ms) / 1000
+    print(f"workers={workers:3d}: {done}/{total} alerts in {elapsed:6.2f} s "
+          f"-> {done / elapsed:7.1f} alerts/s (fully serial would take {serial:.1f} s), "
+          f"{backend.status_writer.commits} Firestore commits")
+
+
+def check_coalescing(args):
+    """Spools a burst of alerts from one device straight into the bridge and checks how many commits they cost."""
+    os.environ["SPOOL_DIR"] = tempfile.mkdtemp(prefix="bench-spool-")
+    backend = FakeBackend(upload_latency=args.upload_ms / 1000,
+                          write_latency=args.write_ms / 1000,
+                          notify_latency=args.notify_ms / 1000,
+                          write_window=args.write_window_ms / 1000)
+    bridge = CloudBridge(backend)
+    bridge.start_processing()
+    start = time.perf_counter()
+    for _ in range(args.burst):
+        bridge.spool.append(*spool_record(encode_alert("nestbox_burst", make_image(args.image_size), 3.9)))
+    while bridge.spool.backlog and time.perf_counter() - start < args.timeout:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    bridge.stop_processing()
+    shutil.rmtree(os.environ["SPOOL_DIR"])
+
+    writer = backend.status_writer
+    # The device's worker hands the writer one update per upload, so each window takes several of them
+    limit = math.ceil(args.burst * args.upload_ms / args.write_window_ms) + 2
+    print(f"burst of {args.burst} alerts from one device in {elapsed:.2f} s: "
+          f"{writer.updates} updates, {writer.commits} commits (limit {limit})")
+    if writer.updates != args.burst or writer.commits > limit:
+        raise SystemExit("FAIL: status writes of one device were not coalesced")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cloud bridge alert pipeline.")
+    parser.add_argument("--host", type=str, default=os.getenv("HOST_IP", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--alerts-per-device", type=int, default=4)
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--image-size", type=int, default=30000)
+    parser.add_argument("--workers", type=str, default="1,8,32", help="Comma separated worker counts to compare")
+    parser.add_argument("--upload-ms", type=float, default=50)
+    parser.add_argument("--write-ms", type=float, default=20)
+    parser.add_argument("--notify-ms", type=float, default=30)
+    parser.add_argument("--write-window-ms", type=float, default=100)
+    parser.add_argument("--burst", type=int, default=20, help="Alerts from one device for the coalescing check")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    check_coalescing(args)
+    for workers in (int(w) for w in args.workers.split(",")):
+        run(args, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,28 +5,71 @@ import json
 import base64
 import ssl
 import os
-from backends.firebase.firebase_backend import FirebaseBackend
+import asyncio
+import threading
+import time
+import uuid
+from alert_pipeline import AlertPipeline
+from alert_format import decode_spool_record, spool_record
+from alert_spool import AlertSpool
+from shard_ring import ShardAssignment
 
 class CloudBridge:
-    def __init__(self):
-        self.backend_service = FirebaseBackend(self.on_command_callback)
+    def __init__(self, backend_service=None):
+        # With BRIDGE_SHARD_COUNT > 1, several bridges share the alert stream and each
+        # owns a consistent-hash slice of the devices for commands
+        self.shard = ShardAssignment.from_env()
+        if backend_service is None:
+            from backends.firebase.firebase_backend import FirebaseBackend
+            backend_service = FirebaseBackend(self.on_command_callback, shard=self.shard)
+        self.backend_service = backend_service
+
+        spool_dir = os.getenv("SPOOL_DIR", "spool")
+        if self.shard.sharded:
+            spool_dir = os.path.join(spool_dir, f"shard-{self.shard.index}")
+        # Alerts are persisted here before paho acknowledges them, and drained into the pipeline
+        self.spool = AlertSpool(
+            spool_dir,
+            segment_size=int(os.getenv("SPOOL_SEGMENT_MB", "16")) * 1024 * 1024,
+            max_segments=int(os.getenv("SPOOL_MAX_SEGMENTS", "64")),
+            sync=os.getenv("SPOOL_SYNC", "1") == "1",
+        )
+        self.spool_report_interval = float(os.getenv("SPOOL_REPORT_S", "60"))
+        self._drainer = None
+        self._stopping = threading.Event()
+
+        self.alert_pipeline = AlertPipeline(
+            self.process_spooled_alert,
+            workers=int(os.getenv("ALERT_WORKERS", "8")),
+            queue_size=int(os.getenv("ALERT_QUEUE_SIZE", "256")),
+        )
 
         self.MQTT_BROKER = os.getenv("HOST_IP", "localhost")
         self.MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
-        self.MQTT_TOPICS = [("nestbox/+/alert", 1), ("nestbox/+/command", 1)]
+        if self.shard.sharded:
+            # MQTT v5 shared subscription: the broker hands each alert to one bridge of the group
+            self.MQTT_TOPICS = [(f"$share/{self.shard.group}/nestbox/+/alert", 1)]
+            client_id = os.getenv("MQTT_CLIENT_ID", f"mqtt_cloud_bridge_{self.shard.index}_{uuid.uuid4().hex[:8]}")
+        else:
+            self.MQTT_TOPICS = [("nestbox/+/alert", 1), ("nestbox/+/command", 1)]
+            client_id = os.getenv("MQTT_CLIENT_ID", "mqtt_cloud_bridge_local")
+        # MQTT v5 in both modes: brokers only pass user properties (the raw JPEG alert variant) to v5 clients
+        protocol = mqtt.MQTTv5
 
         self.CA_CERT_PATH = os.getenv("CA_CERT_PATH")
         self.CLIENT_CERT_PATH = os.getenv("CLIENT_CERT_PATH")
         self.CLIENT_KEY_PATH = os.getenv("CLIENT_KEY_PATH")
 
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "mqtt_cloud_bridge_local")
-        self.client.tls_set(
-            ca_certs=self.CA_CERT_PATH,
-            certfile=self.CLIENT_CERT_PATH,
-            keyfile=self.CLIENT_KEY_PATH,
-            tls_version=ssl.PROTOCOL_TLSv1_2,
-            cert_reqs=ssl.CERT_REQUIRED
-        )
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id, protocol=protocol)
+        # Without a CA the bridge talks plain MQTT, e.g. to a local test broker
+        if self.CA_CERT_PATH:
+            self.client.tls_set(
+                ca_certs=self.CA_CERT_PATH,
+                certfile=self.CLIENT_CERT_PATH,
+                keyfile=self.CLIENT_KEY_PATH,
+                tls_version=ssl.PROTOCOL_TLSv1_2,
+                cert_reqs=ssl.CERT_REQUIRED
+            )
         self.client.reconnect_delay_set(min_delay=1, max_delay=120)
 
         self.client.on_connect = self.on_connect
@@ -34,6 +77,8 @@ class CloudBridge:
         self.client.on_message = self.on_message
 
     def on_command_callback(self, command: str, device_id: str):
+        if not self.shard.owns(device_id):
+            return
         print(f"[Cloud Bridge] Command received: {command} for device {device_id}")
         topic = f"nestbox/{device_id}/command"
         print(f"[Cloud Bridge] Publishing to topic: {topic} with payload: {{'command': {command}}}")
@@ -46,20 +91,89 @@ class CloudBridge:
         else:
             print(f"Failed to connect, return code {rc}")
 
-    def process_alert(self, payload):
+    async def process_alert(self, payload):
+        """
+        Runs on the alert pipeline. The image has to be stored before anything
+        can point at it; the metadata write and the notification then run
+        concurrently. Returns the Future of the metadata write if the backend
+        buffers it: the alert is only durable once that resolves.
+        """
         print("Processing alert...")
         device_id = payload.get("device_id")
+        # Binary and MQTT v5 alerts carry the JPEG as a memoryview into the spool record
+        image_data = payload.get("image")
         image_data_b64 = payload.get("image_data")
         battery_level = payload.get("battery_level")
 
-        if not device_id or not image_data_b64:
+        if not device_id or not (image_data or image_data_b64):
             print("Invalid payload received.")
             return
 
-        image_data = base64.b64decode(image_data_b64)
-        image_url = self.backend_service.save_alert(device_id, image_data, battery_level)
+        run = self.alert_pipeline.run_blocking
+        if image_data is None:
+            # Legacy JSON alert from older firmware, spooled as received
+            try:
+                image_data = await run(base64.b64decode, image_data_b64)
+            except ValueError:
+                image_data = None
+            if not image_data:
+                # Retrying cannot fix it; done, like an undecodable record
+                print(f"Invalid image data from {device_id}.")
+                return
+        image_url = await run(self.backend_service.upload_image, device_id, image_data)
+        committed, _ = await asyncio.gather(
+            run(self.backend_service.save_alert_metadata, device_id, image_url, battery_level),
+            run(self.backend_service.send_fcm_notification, device_id, image_url),
+        )
         print(f"Alert from {device_id} processed. Image URL: {image_url}")
-        self.backend_service.send_fcm_notification(device_id, image_url)
+        return committed
+
+    async def process_spooled_alert(self, entry):
+        """Processes a spooled alert and marks it done, or hands it back to the spool on failure."""
+        record_id, alert = entry
+        try:
+            committed = await self.process_alert(alert)
+        except Exception:
+            self.spool.retry(record_id)
+            raise
+        if committed is None:
+            self.spool.ack(record_id)
+            return
+        # Settled once the batched write commits, without holding the worker: the device's next
+        # alerts reach the status writer within the same window and are merged into one write
+        committed.add_done_callback(lambda future: self._settle(record_id, future))
+
+    def _settle(self, record_id, future):
+        error = future.exception()
+        if error is None:
+            self.spool.ack(record_id)
+            return
+        print(f"[Alert spool] Metadata write for record {record_id} failed, retrying: {error}")
+        self.spool.retry(record_id)
+
+    def _drain_spool(self):
+        last_report = time.monotonic()
+        while not self._stopping.is_set():
+            if time.monotonic() - last_report >= self.spool_report_interval:
+                last_report = time.monotonic()
+                stats = self.spool.stats()
+                if stats["backlog"]:
+                    print(f"[Alert spool] {stats}")
+            entry = self.spool.next(timeout=1.0)
+            # A record taken while stopping stays pending on disk and is handed out after restart
+            if entry is None or self._stopping.is_set():
+                continue
+            record_id, record = entry
+            try:
+                alert = decode_spool_record(record)
+            except ValueError as e:
+                print(f"[Alert spool] Dropping undecodable record {record_id}: {e}")
+                self.spool.ack(record_id)
+                continue
+            # submit waits up to its timeout for room; a full queue only means the workers
+            # are busy, not that the backend failed, so no backoff
+            if not self.alert_pipeline.submit(alert["device_id"], (record_id, alert)):
+                self.spool.requeue(record_id)
 
     def on_message(self, client, userdata, msg):
         try:
@@ -68,20 +182,41 @@ class CloudBridge:
                 print(f"Ignoring message on unexpected topic: {msg.topic}")
                 return
             action = topic[2]
-            payload = json.loads(msg.payload.decode('utf-8'))
             if action == "alert":
-                self.process_alert(payload)
+                # Persisted as received before returning, i.e. before paho acknowledges the message;
+                # decoding and the backend are left to the drainer, so neither holds up MQTT
+                if not self.spool.append(*spool_record(msg.payload, getattr(msg, "properties", None))):
+                    print(f"[Alert spool] Spool full, dropping alert from {topic[1]}")
         except Exception as e:
             print(f"Error processing message: {e}")
-            print(f"Got message: {msg.payload.decode('utf-8')}")
+            print(f"Got message: {msg.payload[:200].decode('utf-8', errors='replace')}")
 
     def on_disconnect(self, client, userdata, flags, rc, properties):
         if rc != 0:
             print(f"Unexpected disconnection. Attempting to reconnect...")
 
+    def start_processing(self):
+        self._stopping.clear()
+        self.alert_pipeline.start()
+        self._drainer = threading.Thread(target=self._drain_spool, name="spool-drainer", daemon=True)
+        self._drainer.start()
+
+    def stop_processing(self):
+        # Alerts in flight are finished and acked; the rest stay in the spool for the next start.
+        # Closing the backend flushes buffered writes, whose callbacks ack, so the spool closes last
+        self._stopping.set()
+        self._drainer.join()
+        self.alert_pipeline.stop()
+        self.backend_service.close()
+        self.spool.close()
+
     def start(self):
+        self.start_processing()
         self.client.connect(self.MQTT_BROKER, self.MQTT_PORT, 60)
-        self.client.loop_forever()
+        try:
+            self.client.loop_forever()
+        finally:
+            self.stop_processing()
 
 if __name__ == "__main__":
     bridge = CloudBridge()
@@ -0,0 +1,346 @@
+"""
+Fleet-scale synthetic load generator.
+
+Simulates thousands of nest boxes publishing alerts and, optionally, a set
+of cameras streaming into the MJPEG relay with viewers attached. By default
+the cloud bridge runs in-process on a timed FakeBackend, so the report has
+end-to-end latency percentiles: publish -> metadata durably written, and
+publish -> notification sent.
+
+Alerts reach the bridge over MQTT (a local broker, devices multiplexed over
+`--connections` asyncio-driven paho clients, or one client per device with
+`--connections 0`), or with `--transport direct` straight into the bridge's
+on_message, which needs no broker at all.
+
+    python fleet_sim.py --transport direct --devices 5000 --rate 6 --arrival dawn --duration 60
+    python fleet_sim.py --devices 2000 --connections 8 --relay localhost:8000 --relay-cameras 20 --relay-viewers 3
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import struct
+import tempfile
+import time
+from types import SimpleNamespace
+
+import paho.mqtt.client as mqtt
+
+from alert_format import encode_alert
+from backends.fake.fake_backend import FakeBackend
+from backends.fake.fake_messaging import FakeMessaging
+
+SOI, EOI = b'\xff\xd8', b'\xff\xd9'
+_SEQ = struct.Struct('!Q')
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "no samples"
+    samples = sorted(samples)
+    p = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {p(0.5):8.1f} ms  p90 {p(0.9):8.1f} ms  p99 {p(0.99):8.1f} ms  max {samples[-1] * 1000:8.1f} ms"
+
+
+class ImageFactory:
+    """Unique synthetic JPEGs with log-normally distributed sizes; the alert's sequence number rides inside."""
+
+    def __init__(self, median: int, sigma: float, min_size: int, max_size: int):
+        self.median = median
+        self.sigma = sigma
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = random.randbytes(max_size)
+
+    def make(self, seq: int) -> bytes:
+        size = int(min(self.max_size, max(self.min_size, random.lognormvariate(math.log(self.median), self.sigma))))
+        body = size - len(SOI) - _SEQ.size - len(EOI)
+        start = random.randrange(0, len(self._pool) - body + 1)
+        return SOI + _SEQ.pack(seq) + self._pool[start:start + body] + EOI
+
+    @staticmethod
+    def seq_of(image) -> int:
+        return _SEQ.unpack(bytes(image[len(SOI):len(SOI) + _SEQ.size]))[0]
+
+
+class Arrivals:
+    """
+    Alert arrival times for the whole fleet. "poisson" is a homogeneous Poisson
+    process; "dawn" adds a Gaussian burst of `dawn_factor` times the base rate
+    centred `dawn_at` seconds into the run, generated by thinning.
+    """
+
+    def __init__(self, kind: str, rate: float, dawn_at: float, dawn_width: float, dawn_factor: float):
+        self.kind = kind
+        self.rate = rate
+        self.dawn_at = dawn_at
+        self.dawn_width = dawn_width
+        self.dawn_factor = dawn_factor
+
+    def rate_at(self, t: float) -> float:
+        if self.kind == "poisson":
+            return self.rate
+        return self.rate * (1 + (self.dawn_factor - 1) * math.exp(-((t - self.dawn_at) / self.dawn_width) ** 2))
+
+    def times(self, duration: float):
+        peak = self.rate if self.kind == "poisson" else self.rate * max(1.0, self.dawn_factor)
+        t = 0.0
+        while True:
+            t += random.expovariate(peak)
+            if t >= duration:
+                return
+            if random.random() * peak <= self.rate_at(t):
+                yield t
+
+
+class TimedMessaging(FakeMessaging):
+    def __init__(self, latency, on_sent):
+        super().__init__(latency)
+        self.on_sent = on_sent
+
+    def send_each(self, messages: list):
+        response = super().send_each(messages)
+        for message in messages:
+            self.on_sent(message["image_url"])
+        return response
+
+
+class TimedBackend(FakeBackend):
+    """FakeBackend that matches stored images back to publish times."""
+
+    def __init__(self, published: dict, **kwargs):
+        notify_latency = kwargs.get("notify_latency", 0.03)
+        super().__init__(**kwargs)
+        self.published = published
+        self.write_latencies = []
+        self.notify_latencies = []
+        self._url_seq = {}
+        self.messaging = TimedMessaging(notify_latency, self._notified)
+        self.notifier.transport = self.messaging
+
+    def upload_image(self, device_id: str, image_data) -> str:
+        url = super().upload_image(device_id, image_data)
+        self._url_seq[url] = ImageFactory.seq_of(image_data)
+        return url
+
+    def save_alert_metadata(self, device_id: str, image_url: str, battery_level: float):
+        committed = super().save_alert_metadata(device_id, image_url, battery_level)
+        published = self.published[self._url_seq[image_url]]
+        committed.add_done_callback(lambda _: self.write_latencies.append(time.monotonic() - published))
+        return committed
+
+    def _notified(self, image_url: str):
+        # Coalesced notifications are timed against the newest alert they carry
+        self.notify_latencies.append(time.monotonic() - self.published[self._url_seq[image_url]])
+
+
+class AsyncioHelper:
+    """Drives a paho client from an asyncio loop instead of a network thread per connection."""
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+async def connect_publishers(args, count: int) -> list:
+    loop = asyncio.get_running_loop()
+    clients = []
+    for i in range(count):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"fleet-sim-{os.getpid()}-{i}")
+        AsyncioHelper(loop, client)
+        client.connect(args.host, args.port, 60)
+        clients.append(client)
+        if i % 100 == 99:
+            await asyncio.sleep(0)  # let the loop service connections opened so far
+    return clients
+
+
+async def publish_alerts(args, bridge, published: dict) -> int:
+    device_ids = [f"nestbox_{i:05d}" for i in range(args.devices)]
+    images = ImageFactory(args.jpeg_median, args.jpeg_sigma, args.jpeg_min, args.jpeg_max)
+    arrivals = Arrivals(args.arrival, args.devices * args.rate / 3600, args.dawn_at, args.dawn_width, args.dawn_factor)
+    clients = []
+    if args.transport == "mqtt":
+        clients = await connect_publishers(args, args.devices if args.connections == 0 else args.connections)
+
+    start = time.monotonic()
+    seq = 0
+    for t in arrivals.times(args.duration):
+        delay = start + t - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        seq += 1
+        device_index = random.randrange(args.devices)
+        device_id = device_ids[device_index]
+        payload = encode_alert(device_id, images.make(seq), round(random.uniform(3.5, 4.2), 2))
+        published[seq] = time.monotonic()
+        topic = f"nestbox/{device_id}/alert"
+        if args.transport == "direct":
+            bridge.on_message(None, None, SimpleNamespace(topic=topic, payload=payload))
+        else:
+            clients[device_index % len(clients)].publish(topic, payload, qos=1)
+    # Give the last publishes time to leave before hanging up
+    await asyncio.sleep(1)
+    for client in clients:
+        client.disconnect()
+    return seq
+
+
+def synthetic_frame(size: int) -> bytes:
+    stamp = struct.pack("!d", time.time())
+    return SOI + stamp + b'\x00' * (size - len(stamp) - 4) + EOI
+
+
+async def relay_camera(host: str, port: int, device_id: str, fps: float, frame_size: int, deadline: float, stats):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((f"POST /upload_stream/{device_id} HTTP/1.1\r\nHost: {host}\r\n"
+                  "Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                  "Transfer-Encoding: chunked\r\n\r\n").encode())
+    while time.monotonic() < deadline:
+        frame = synthetic_frame(frame_size)
+        part = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(frame) + frame + b'\r\n'
+        writer.write(b'%x\r\n%s\r\n' % (len(part), part))
+        await writer.drain()
+        stats.uploaded += 1
+        await asyncio.sleep(1 / fps)
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+    writer.close()
+
+
+async def relay_viewer(host: str, port: int, device_id: str, deadline: float, stats):
+    reader, writer = await asyncio.open_connection(host, port)
+    # HTTP/1.0 keeps the body free of chunked framing
+    writer.write(f"GET /stream/{device_id} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+        while time.monotonic() < deadline:
+            # Skips the boundary and any transfer framing in front of the part's length
+            await asyncio.wait_for(reader.readuntil(b'Content-Length: '), deadline - time.monotonic())
+            length = int((await reader.readuntil(b'\r\n\r\n'))[:-4])
+            frame = await reader.readexactly(length)
+            stats.viewed += 1
+            stats.ages.append(time.time() - struct.unpack("!d", frame[2:10])[0])
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        pass
+    writer.close()
+
+
+async def drive_relay(args) -> SimpleNamespace:
+    host, port = args.relay.rsplit(":", 1)
+    stats = SimpleNamespace(uploaded=0, viewed=0, ages=[])
+    deadline = time.monotonic() + args.duration
+    tasks = []
+    for i in range(args.relay_cameras):
+        device_id = f"nestbox_{i:05d}"
+        tasks.append(relay_camera(host, int(port), device_id, args.relay_fps, args.relay_frame_size, deadline, stats))
+    await asyncio.sleep(0)
+    for i in range(args.relay_cameras):
+        for _ in range(args.relay_viewers):
+            tasks.append(relay_viewer(host, int(port), f"nestbox_{i:05d}", deadline, stats))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+async def main(args):
+    if args.transport == "direct" and args.bridge != "local":
+        raise SystemExit("--transport direct needs the in-process bridge")
+    published = {}
+    bridge = backend = None
+    if args.bridge == "local":
+        os.environ.setdefault("SPOOL_DIR", tempfile.mkdtemp(prefix="fleet-spool-"))
+        os.environ.setdefault("HOST_IP", args.host)
+        os.environ.setdefault("MQTT_PORT", str(args.port))
+        from cloud_bridge import CloudBridge
+        backend = TimedBackend(published, upload_latency=args.upload_ms / 1000, write_latency=args.write_ms / 1000,
+                               notify_latency=args.notify_ms / 1000, notify_cooldown=args.notify_cooldown)
+        # Notifications are limited by the cooldown alone, so every alert outside it is timed
+        backend.notifier.rate = backend.notifier.burst = 1e9
+        bridge = CloudBridge(backend)
+        bridge.start_processing()
+        if args.transport == "mqtt":
+            bridge.client.connect(args.host, args.port, 60)
+            bridge.client.loop_start()
+            await asyncio.sleep(1)  # let the bridge subscribe
+
+    relay_task = asyncio.create_task(drive_relay(args)) if args.relay else None
+    start = time.monotonic()
+    sent = await publish_alerts(args, bridge, published)
+    print(f"published {sent} alerts from {args.devices} devices in {time.monotonic() - start:.1f} s "
+          f"({args.arrival}, {args.transport})")
+
+    if backend is not None:
+        while len(backend.write_latencies) < sent and time.monotonic() - start < args.duration + args.timeout:
+            await asyncio.sleep(0.1)
+        if args.transport == "mqtt":
+            bridge.client.loop_stop()
+            bridge.client.disconnect()
+        bridge.stop_processing()
+        print(f"processed {len(backend.write_latencies)}/{sent}, {backend.status_writer.commits} Firestore commits, "
+              f"{len(backend.messaging.sent)} notifications in {backend.messaging.calls} batches")
+        print(f"publish -> metadata written: {percentiles(backend.write_latencies)}")
+        print(f"publish -> notification:     {percentiles(backend.notify_latencies)}")
+        print(f"uploads: {backend.image_uploader.stats()}")
+    if relay_task is not None:
+        stats = await relay_task
+        print(f"relay: {stats.uploaded} frames uploaded by {args.relay_cameras} cameras, "
+              f"{stats.viewed} received by {args.relay_cameras * args.relay_viewers} viewers")
+        print(f"relay frame age: {percentiles(stats.ages)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a fleet of nest boxes.")
+    parser.add_argument("--host", type=str, default=os.getenv("HOST_IP", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--transport", choices=["mqtt", "direct"], default="mqtt")
+    parser.add_argument("--bridge", choices=["local", "none"], default="local",
+                        help="Run the bridge in-process on a timed FakeBackend, or only publish")
+    parser.add_argument("--connections", type=int, default=4, help="MQTT connections shared by the devices, 0 for one each")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--rate", type=float, default=6, help="Alerts per device per hour")
+    parser.add_argument("--arrival", choices=["poisson", "dawn"], default="poisson")
+    parser.add_argument("--dawn-at", type=float, default=15, help="Seconds into the run the dawn burst peaks")
+    parser.add_argument("--dawn-width", type=float, default=5)
+    parser.add_argument("--dawn-factor", type=float, default=20, help="Peak rate as a multiple of the base rate")
+    parser.add_argument("--jpeg-median", type=int, default=40000)
+    parser.add_argument("--jpeg-sigma", type=float, default=0.5)
+    parser.add_argument("--jpeg-min", type=int, default=5000)
+    parser.add_argument("--jpeg-max", type=int, default=200000)
+    parser.add_argument("--upload-ms", type=float, default=50)
+    parser.add_argument("--write-ms", type=float, default=20)
+    parser.add_argument("--notify-ms", type=float, default=30)
+    parser.add_argument("--notify-cooldown", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the bridge to catch up")
+    parser.add_argument("--relay", type=str, default=None, help="host:port of an MJPEG relay to drive")
+    parser.add_argument("--relay-cameras", type=int, default=10)
+    parser.add_argument("--relay-viewers", type=int, default=2, help="Viewers per camera")
+    parser.add_argument("--relay-fps", type=float, default=10)
+    parser.add_argument("--relay-frame-size", type=int, default=40000)
+    asyncio.run(main(parser.parse_args()))
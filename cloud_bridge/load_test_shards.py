@@ -0,0 +1,111 @@
+"""
+Multi-process load test for sharded cloud bridges.
+
+Starts N CloudBridge processes (FakeBackend, MQTT v5 shared subscription)
+against a local Mosquitto (`mosquitto -p 1883`, 2.x for shared
+subscriptions), publishes alerts for many devices and reports how long the
+group takes to process them all, for each process count.
+
+    python load_test_shards.py --shards 1,2,4 --devices 200 --alerts-per-device 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import paho.mqtt.client as mqtt
+
+from alert_format import encode_alert
+
+
+def run_shard(index: int, count: int, args, processed, ready, stop):
+    os.environ.update(
+        BRIDGE_SHARD_INDEX=str(index),
+        BRIDGE_SHARD_COUNT=str(count),
+        BRIDGE_SHARE_GROUP=f"loadtest{count}",
+        HOST_IP=args.host,
+        MQTT_PORT=str(args.port),
+        SPOOL_DIR=args.spool_dir,
+        ALERT_WORKERS=str(args.workers),
+    )
+    from backends.fake.fake_backend import FakeBackend
+    from cloud_bridge import CloudBridge
+
+    backend = FakeBackend(upload_latency=args.upload_ms / 1000,
+                          write_latency=args.write_ms / 1000,
+                          notify_latency=args.notify_ms / 1000)
+    bridge = CloudBridge(backend)
+    bridge.start_processing()
+    bridge.client.connect(args.host, args.port, 60)
+    bridge.client.loop_start()
+    ready.release()
+    while not stop.is_set():
+        processed[index] = len(backend.notifications)
+        time.sleep(0.05)
+    bridge.client.loop_stop()
+    bridge.client.disconnect()
+    bridge.stop_processing()
+
+
+def run(args, count: int):
+    args.spool_dir = tempfile.mkdtemp(prefix="shard-spool-")
+    processed = multiprocessing.Array('i', count)
+    ready = multiprocessing.Semaphore(0)
+    stop = multiprocessing.Event()
+    shards = [multiprocessing.Process(target=run_shard, args=(i, count, args, processed, ready, stop))
+              for i in range(count)]
+    for process in shards:
+        process.start()
+    for _ in shards:
+        ready.acquire()
+    time.sleep(1)  # let the bridges subscribe
+
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"shard-load-pub-{random.randint(0, 1 << 30)}")
+    publisher.connect(args.host, args.port, 60)
+    publisher.loop_start()
+    device_ids = [f"nestbox_{i:05d}" for i in range(args.devices)]
+    total = args.devices * args.alerts_per_device
+    payloads = [encode_alert(device_id, random.randbytes(args.image_size), 3.9)
+                for _ in range(args.alerts_per_device) for device_id in device_ids]
+
+    start = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        publisher.publish(f"nestbox/{device_ids[i % args.devices]}/alert", payload, qos=1)
+    while sum(processed) < total and time.perf_counter() - start < args.timeout:
+        time.sleep(0.02)
+    elapsed = time.perf_counter() - start
+    done = sum(processed)
+
+    stop.set()
+    for process in shards:
+        process.join()
+    publisher.loop_stop()
+    publisher.disconnect()
+    shutil.rmtree(args.spool_dir)
+    print(f"shards={count:2d}: {done}/{total} alerts in {elapsed:6.2f} s -> {done / elapsed:7.1f} alerts/s, "
+          f"per shard {list(processed)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test sharded cloud bridges.")
+    parser.add_argument("--host", type=str, default=os.getenv("HOST_IP", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", "1883")))
+    parser.add_argument("--shards", type=str, default="1,2,4", help="Comma separated process counts to compare")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--alerts-per-device", type=int, default=5)
+    parser.add_argument("--image-size", type=int, default=30000)
+    parser.add_argument("--workers", type=int, default=8, help="Alert workers per bridge process")
+    parser.add_argument("--upload-ms", type=float, default=50)
+    parser.add_argument("--write-ms", type=float, default=20)
+    parser.add_argument("--notify-ms", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    for count in (int(c) for c in args.shards.split(",")):
+        run(args, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+import os
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over shard indexes. Each shard gets `vnodes` points
+    on the ring, so devices spread evenly and changing the shard count only
+    moves about 1/N of them to another shard.
+    """
+
+    def __init__(self, shard_count: int, vnodes: int = 128):
+        self.shard_count = shard_count
+        points = sorted((_hash(f"shard-{shard}-{v}"), shard) for shard in range(shard_count) for v in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def owner(self, device_id: str) -> int:
+        i = bisect.bisect(self._keys, _hash(device_id)) % len(self._keys)
+        return self._shards[i]
+
+
+class ShardAssignment:
+    """Which slice of the fleet this bridge instance owns."""
+
+    def __init__(self, index: int = 0, count: int = 1, group: str = "bridge"):
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} is outside 0..{count - 1}")
+        self.index = index
+        self.count = count
+        self.group = group
+        self.ring = HashRing(count)
+
+    @classmethod
+    def from_env(cls) -> "ShardAssignment":
+        return cls(
+            index=int(os.getenv("BRIDGE_SHARD_INDEX", "0")),
+            count=int(os.getenv("BRIDGE_SHARD_COUNT", "1")),
+            group=os.getenv("BRIDGE_SHARE_GROUP", "bridge"),
+        )
+
+    @property
+    def sharded(self) -> bool:
+        return self.count > 1
+
+    def owns(self, device_id: str) -> bool:
+        return not self.sharded or self.ring.owner(device_id) == self.index
@@ -75,15 +75,31 @@ static void ws_task(void *pvParameters)
                 int total_size = fb->len;
                 int chunk_count = (total_size + chunk_size - 1) / chunk_size;
 
-                // Send header: "FRAM" + size(2B) + chunk_count(2B)
-                uint8_t header[8];
-                header[0] = 'F'; header[1] = 'R'; header[2] = 'A'; header[3] = 'M';
-                header[4] = (total_size >> 8) & 0xFF;
-                header[5] = total_size & 0xFF;
-                header[6] = (chunk_count >> 8) & 0xFF;
-                header[7] = chunk_count & 0xFF;
+                uint8_t header[12];
+                int header_len;
+                if (total_size <= 0xFFFF) {
+                    // Send header: "FRAM" + size(2B) + chunk_count(2B)
+                    header[0] = 'F'; header[1] = 'R'; header[2] = 'A'; header[3] = 'M';
+                    header[4] = (total_size >> 8) & 0xFF;
+                    header[5] = total_size & 0xFF;
+                    header[6] = (chunk_count >> 8) & 0xFF;
+                    header[7] = chunk_count & 0xFF;
+                    header_len = 8;
+                } else {
+                    // Send v2 header: "FRMX" + version(1B) + reserved(1B) + chunk_count(2B) + size(4B)
+                    header[0] = 'F'; header[1] = 'R'; header[2] = 'M'; header[3] = 'X';
+                    header[4] = 2;
+                    header[5] = 0;
+                    header[6] = (chunk_count >> 8) & 0xFF;
+                    header[7] = chunk_count & 0xFF;
+                    header[8] = (total_size >> 24) & 0xFF;
+                    header[9] = (total_size >> 16) & 0xFF;
+                    header[10] = (total_size >> 8) & 0xFF;
+                    header[11] = total_size & 0xFF;
+                    header_len = 12;
+                }
 
-                esp_websocket_client_send_bin(ws_client, (const char*)header, sizeof(header), portMAX_DELAY);
+                esp_websocket_client_send_bin(ws_client, (const char*)header, header_len, portMAX_DELAY);
 
                 // Send chunks
                 for (int offset = 0; offset < total_size; offset += chunk_size) {
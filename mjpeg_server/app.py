@@ -1,34 +1,254 @@
 import os
 import logging
+import socket
 import asyncio
-from fastapi import FastAPI, Request, HTTPException, Response
-from fastapi.responses import StreamingResponse
+import time
+import urllib.parse
+import zlib
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request, HTTPException, Query, Response, WebSocket, status
+from fastapi.requests import HTTPConnection
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from mjpeg_parser import MJPEGStreamParser
+from frame_assembler import FrameAssembler, FrameProtocolError, FrameTooLargeError
+from frame_channel import FrameChannel
+from frame_history import FrameHistory
+from frame_variants import VariantCache
+from relay_auth import AuthError, DeviceCertVerifier, JWKSCache, TokenVerifier
+from relay_metrics import RelayMetrics
+from sampling_profiler import SamplingProfiler
+from frame_store import create_frame_store
+from viewer_queue import DropPolicy, ViewerQueue
+
+# --- Ingest configuration ---
+MAX_FRAME_SIZE = int(os.getenv("MAX_FRAME_SIZE", str(1024 * 1024)))
 
 # --- In-memory storage for video streams ---
-streams = {}
-# Use asyncio's Lock for safe concurrent access in an async environment
-streams_lock = asyncio.Lock()
+# One broadcast channel per device; each channel carries its own lock
+streams: dict[str, FrameChannel] = {}
+# Local channels fed from the frame store for devices uploading to another worker or node
+mirrors: dict[str, FrameChannel] = {}
+# Latest frame per device, shared across workers depending on FRAME_STORE
+frame_store = create_frame_store(MAX_FRAME_SIZE)
+FRAME_STORE_POLL_INTERVAL = float(os.getenv("FRAME_STORE_POLL_MS", "10")) / 1000
+# Send queues of the currently attached viewers, per device
+viewers: dict[str, set[ViewerQueue]] = {}
+
+# --- Viewer backpressure configuration ---
+VIEWER_POLICY = DropPolicy(os.getenv("VIEWER_POLICY", DropPolicy.LATEST.value))
+VIEWER_QUEUE_SIZE = int(os.getenv("VIEWER_QUEUE_SIZE", "4"))
+VIEWER_MAX_LAG_MS = int(os.getenv("VIEWER_MAX_LAG_MS", "500"))
+# Upper bounds for the per-viewer overrides, so a client cannot make the relay hold many frames for it
+VIEWER_MAX_QUEUE_SIZE = int(os.getenv("VIEWER_MAX_QUEUE_SIZE", "16"))
+VIEWER_MAX_LAG_LIMIT_MS = int(os.getenv("VIEWER_MAX_LAG_LIMIT_MS", "10000"))
+# Kernel send buffer of a viewer's socket. Without a cap the kernel grows it to
+# megabytes, seconds of video that the viewer's queue never gets to drop. 0 keeps autotuning.
+VIEWER_SEND_BUFFER = int(os.getenv("VIEWER_SEND_BUFFER", str(32 * 1024)))
+
+# --- Frame history configuration ---
+# Recent frames per device, kept after the uploader disconnects
+history = FrameHistory(max_frames=int(os.getenv("HISTORY_MAX_FRAMES", "50")),
+                       max_device_bytes=int(os.getenv("HISTORY_MAX_DEVICE_BYTES", str(4 * 1024 * 1024))),
+                       max_total_bytes=int(os.getenv("HISTORY_MAX_TOTAL_BYTES", str(256 * 1024 * 1024))))
+HISTORY_MAX_REPLAY_SECONDS = float(os.getenv("HISTORY_MAX_REPLAY_SECONDS", "60"))
+
+# --- Variant (downscale/re-encode) configuration ---
+variants = VariantCache(max_bytes=int(os.getenv("VARIANT_CACHE_BYTES", str(32 * 1024 * 1024))),
+                        max_workers=int(os.getenv("VARIANT_WORKERS", "2")))
+VARIANT_DEFAULT_QUALITY = int(os.getenv("VARIANT_DEFAULT_QUALITY", "70"))
+
+# --- Snapshot configuration ---
+SNAPSHOT_MAX_WAIT = float(os.getenv("SNAPSHOT_MAX_WAIT", "30"))
+SNAPSHOT_MAX_IDS = int(os.getenv("SNAPSHOT_MAX_IDS", "100"))
+# Snapshot long-polls waiting on each device; they keep remote streams mirrored like viewers do
+snapshot_waiters: dict[str, int] = {}
+
+# --- Authentication configuration ---
+# Without these, viewers and devices are let through as before, for local testing
+FIREBASE_PROJECT_ID = os.getenv("FIREBASE_PROJECT_ID")
+# PEM of the CA that signs device certificates (utilities/cert_factory.py)
+DEVICE_CA_CERT = os.getenv("DEVICE_CA_CERT")
+# Header in which the TLS-terminating proxy forwards the URL-encoded client certificate
+CLIENT_CERT_HEADER = os.getenv("CLIENT_CERT_HEADER", "x-client-cert")
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+token_verifier = (TokenVerifier(FIREBASE_PROJECT_ID, JWKSCache(), cache_size=AUTH_CACHE_SIZE)
+                  if FIREBASE_PROJECT_ID else None)
+device_verifier = (DeviceCertVerifier.from_file(DEVICE_CA_CERT, cache_size=AUTH_CACHE_SIZE)
+                   if DEVICE_CA_CERT else None)
+
+# --- Metrics configuration ---
+metrics = RelayMetrics()
+# Opt-in sampling profiler of the event loop, served at /debug/profile
+RELAY_PROFILE_HZ = float(os.getenv("RELAY_PROFILE_HZ", "0"))
+profiler = SamplingProfiler(hz=RELAY_PROFILE_HZ) if RELAY_PROFILE_HZ > 0 else None
 
 # --- Logging Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # --- FastAPI App Initialization ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if profiler:
+        profiler.start()
+    if token_verifier:
+        # Fetch the signing keys up front and keep them fresh in the background
+        token_verifier.jwks.start()
+    yield
+    if token_verifier:
+        await token_verifier.jwks.stop()
+    if profiler:
+        profiler.stop()
+    variants.close()
+    await frame_store.close()
+
+class RelayApp(FastAPI):
+    """
+    Puts the connection's transport in the scope as extensions["transport"],
+    so endpoints can tune the socket. Uvicorn does not expose it, but its
+    `send` is a method of the request cycle, which holds the transport; the
+    middleware stack wraps `send`, so this has to happen before it.
+    """
+
+    async def __call__(self, scope, receive, send):
+        transport = getattr(getattr(send, "__self__", None), "transport", None)
+        if transport is not None:
+            scope.setdefault("extensions", {})["transport"] = transport
+        await super().__call__(scope, receive, send)
 
-# --- Authentication (Placeholders) ---
-async def verify_device_certificate(request: Request):
-    # TODO: Implement mTLS client certificate verification from request headers
-    # For now, we'll allow it to pass for testing.
-    logger.debug(f"Device connected from {request.client.host}")
+app = RelayApp(lifespan=lifespan)
+
+# --- Authentication ---
+async def verify_device_certificate(request: HTTPConnection, device_id: str) -> bool:
+    """Checks the client certificate forwarded by the TLS proxy: issued by the project CA, CN=device_id."""
+    if device_verifier is None:
+        logger.debug(f"Device connected from {request.client.host}")
+        return True
+    cert = request.headers.get(CLIENT_CERT_HEADER)
+    if not cert:
+        logger.warning(f"No client certificate from {device_id} ({request.client.host})")
+        return False
+    try:
+        cert_device_id = device_verifier.verify(urllib.parse.unquote(cert))
+    except AuthError as e:
+        logger.warning(f"Rejecting certificate of {device_id}: {e}")
+        return False
+    if cert_device_id != device_id:
+        logger.warning(f"Certificate of {cert_device_id} used to upload as {device_id}")
+        return False
     return True
 
-async def verify_firebase_token(token: str):
-    # TODO: Implement Firebase JWT verification
-    return "test_user"
+async def verify_firebase_token(token: str) -> str | None:
+    """Returns the uid of a valid Firebase ID token, or None."""
+    if token_verifier is None:
+        return "test_user"
+    if not token:
+        return None
+    try:
+        claims = await token_verifier.verify(token)
+    except AuthError as e:
+        logger.info(f"Rejecting viewer token: {e}")
+        return None
+    return claims["sub"]
+
+async def require_viewer(request: Request, token: str | None = None) -> str:
+    """
+    Dependency for viewer endpoints. The ID token comes as a Bearer
+    Authorization header or, for image views that cannot set headers, ?token=.
+    """
+    authorization = request.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        token = authorization[7:].strip()
+    uid = await verify_firebase_token(token or "")
+    if uid is None:
+        raise HTTPException(status_code=401, detail="Invalid or missing Firebase ID token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return uid
 
 # --- Streaming Endpoints ---
 
+def open_channel(device_id: str) -> FrameChannel:
+    """Registers a fresh broadcast channel for an uploader, replacing any previous one."""
+    channel = FrameChannel(device_id)
+    streams[device_id] = channel
+    return channel
+
+async def close_channel(device_id: str, channel: FrameChannel):
+    """Unregisters an uploader's channel unless a newer upload already replaced it."""
+    try:
+        if streams.get(device_id) is channel:
+            del streams[device_id]
+            try:
+                await frame_store.remove(device_id)
+            except (OSError, EOFError) as e:
+                logger.warning(f"Could not remove {device_id} from the frame store: {e}")
+            device_metrics = metrics.devices.get(device_id)
+            if device_metrics is not None:
+                device_metrics.upload_ended()
+            release_metrics(device_id)
+    finally:
+        # Whatever happened above, the viewers waiting on this channel must be released
+        await channel.close()
+
+def release_metrics(device_id: str):
+    """Drops a device's metrics once it has neither an uploader nor viewers on this worker."""
+    if device_id not in streams and not viewers.get(device_id):
+        metrics.remove(device_id)
+
+async def publish_frame(device_id: str, channel: FrameChannel, frame: bytes):
+    """Stores an uploaded frame in the frame store and wakes up local viewers."""
+    try:
+        seq = await frame_store.publish(device_id, frame)
+    except (ValueError, OSError, EOFError) as e:
+        # Too large for the store, or the store is unreachable: lose this frame, not the upload
+        logger.warning(f"Dropping frame from {device_id}: {e}")
+        return
+    metrics.device(device_id).frame_received(len(frame), time.monotonic())
+    history.append(device_id, seq, frame)
+    await channel.publish(frame, seq)
+
+async def find_channel(device_id: str) -> FrameChannel | None:
+    """
+    Returns the channel viewers of a device should wait on: the uploader's own
+    channel when it uploads to this worker, otherwise a mirror of the frame store.
+    """
+    channel = streams.get(device_id) or mirrors.get(device_id)
+    if channel is not None:
+        return channel
+    if await frame_store.seq(device_id) is None:
+        return None
+    channel = FrameChannel(device_id)
+    mirrors[device_id] = channel
+    asyncio.create_task(mirror_remote_stream(device_id, channel))
+    return channel
+
+async def mirror_remote_stream(device_id: str, channel: FrameChannel):
+    """
+    Copies new frames from the frame store into a local channel while this
+    worker has viewers of a device that uploads elsewhere. Only the sequence
+    number is polled; frames are read once per new sequence.
+    """
+    logger.info(f"Mirroring remote stream for device: {device_id}")
+    try:
+        while True:
+            seq = await frame_store.seq(device_id)
+            if seq is None:
+                break
+            if seq > channel.seq:
+                result = await frame_store.latest(device_id, channel.seq)
+                if result is not None:
+                    await channel.publish(result[1], result[0])
+            await asyncio.sleep(FRAME_STORE_POLL_INTERVAL)
+            if not viewers.get(device_id) and not snapshot_waiters.get(device_id):
+                break
+    except Exception as e:
+        logger.error(f"Error while mirroring stream for {device_id}: {e}")
+    finally:
+        logger.info(f"Stopped mirroring stream for device: {device_id}")
+        if mirrors.get(device_id) is channel:
+            del mirrors[device_id]
+        await channel.close()
+
 @app.post("/upload_stream/{device_id}")
 async def upload_stream(device_id: str, request: Request):
     """
@@ -36,78 +256,386 @@ async def upload_stream(device_id: str, request: Request):
     FastAPI and Uvicorn are designed to handle this kind of long-lived,
     asynchronous request efficiently.
     """
-    if not await verify_device_certificate(request):
+    if not await verify_device_certificate(request, device_id):
         raise HTTPException(status_code=401, detail="Device certificate invalid")
 
     logger.info(f"Stream connection opened for device: {device_id}")
     
-    boundary = b'--frame'
-    buffer = b''
-    
+    parser = MJPEGStreamParser(boundary=b'--frame', max_part_size=MAX_FRAME_SIZE)
+    channel = open_channel(device_id)
+    parse_seconds = metrics.device(device_id).parse_seconds
+
     try:
         # Asynchronously iterate over the raw request body chunks
         async for chunk in request.stream():
-            buffer += chunk
-            # Process all full frames found in the buffer
-            while boundary in buffer:
-                parts = buffer.split(boundary, 1)
-                frame_part = parts[0]
-                buffer = parts[1]
-
-                # Find the start of the JPEG data
-                jpeg_start = frame_part.find(b'\r\n\r\n')
-                if jpeg_start != -1:
-                    jpeg_frame = frame_part[jpeg_start + 4:]
-                    if jpeg_frame:
-                        # Store the latest frame
-                        async with streams_lock:
-                            streams[device_id] = jpeg_frame
-                        logger.debug(f"Received frame from {device_id}, size: {len(jpeg_frame)} bytes")
+            # The parser only scans the newly arrived bytes for frame boundaries
+            start = time.perf_counter()
+            jpeg_frames = parser.feed(chunk)
+            parse_seconds.observe(time.perf_counter() - start)
+            for jpeg_frame in jpeg_frames:
+                # Store the latest frame and wake up its viewers
+                await publish_frame(device_id, channel, jpeg_frame)
+                logger.debug("Received frame from %s, size: %d bytes", device_id, len(jpeg_frame))
 
     except Exception as e:
         logger.error(f"Error while reading stream from {device_id}: {e}")
     finally:
         # Clean up when the ESP32 disconnects
         logger.info(f"Stream ended for device: {device_id}. Cleaning up.")
-        async with streams_lock:
-            if device_id in streams:
-                del streams[device_id]
-                
+        await close_channel(device_id, channel)
+
     return Response(content="Stream session finished", status_code=200)
 
-async def frame_generator(device_id: str):
+@app.websocket("/ws/device/{device_id}")
+async def ws_device(websocket: WebSocket, device_id: str):
+    """
+    Receives camera frames over WebSocket using the firmware's chunked frame
+    protocol (see frame_assembler.py). Chunks are written straight into a
+    buffer sized from the frame header, so no multipart scanning is needed.
+    """
+    if not await verify_device_certificate(websocket, device_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    logger.info(f"WebSocket stream opened for device: {device_id}")
+    assembler = FrameAssembler(max_frame_size=MAX_FRAME_SIZE)
+    channel = open_channel(device_id)
+    parse_seconds = metrics.device(device_id).parse_seconds
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                logger.debug("Ignoring text message from %s", device_id)
+                continue
+            start = time.perf_counter()
+            jpeg_frame = assembler.feed(data)
+            parse_seconds.observe(time.perf_counter() - start)
+            if jpeg_frame is not None:
+                await publish_frame(device_id, channel, jpeg_frame)
+                logger.debug("Received frame from %s, size: %d bytes", device_id, len(jpeg_frame))
+    except FrameTooLargeError as e:
+        logger.warning(f"Rejecting frame from {device_id}: {e}")
+        await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+    except FrameProtocolError as e:
+        logger.warning(f"Malformed frame from {device_id}: {e}")
+        await websocket.close(code=status.WS_1002_PROTOCOL_ERROR)
+    except Exception as e:
+        logger.error(f"Error while reading WebSocket stream from {device_id}: {e}")
+    finally:
+        logger.info(f"WebSocket stream ended for device: {device_id}. Cleaning up.")
+        await close_channel(device_id, channel)
+
+def limit_viewer_buffers(request: Request):
+    """
+    Keeps a viewer's unsent frames out of the transport and (mostly) out of the
+    kernel, so its queue is where a slow viewer backs up and drops frames.
+    """
+    transport = request.scope.get("extensions", {}).get("transport")
+    if transport is None:
+        return
+    # The server's send now waits for every write to reach the kernel
+    transport.set_write_buffer_limits(high=0)
+    sock = transport.get_extra_info("socket")
+    if sock is not None and VIEWER_SEND_BUFFER:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, VIEWER_SEND_BUFFER)
+        except OSError as e:
+            logger.warning(f"Could not limit the send buffer of a viewer: {e}")
+
+def mjpeg_part(frame: bytes, headers: bytes = b'') -> bytes:
+    # Content-Length lets clients hand the frame over without waiting for the next boundary
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: %d\r\n%s\r\n' % (len(frame), headers) + frame + b'\r\n')
+
+def variant_params(w: int | None, q: int | None) -> tuple[int | None, int] | None:
+    """Normalizes the ?w=&q= query parameters; None means the original frame."""
+    if w is None and q is None:
+        return None
+    return w, q or VARIANT_DEFAULT_QUALITY
+
+async def frame_variant(device_id: str, seq: int, frame: bytes, variant: tuple[int | None, int] | None) -> bytes:
+    if variant is None:
+        return frame
+    return await variants.get(device_id, seq, frame, *variant)
+
+async def frame_variant_or_original(device_id: str, seq: int, frame: bytes,
+                                    variant: tuple[int | None, int] | None) -> tuple[bytes, tuple | None]:
+    """(image, variant actually served): the original frame if the variant cannot be produced."""
+    try:
+        return await frame_variant(device_id, seq, frame, variant), variant
+    except Exception as e:
+        logger.warning(f"Could not transcode frame {seq} from {device_id}, sending it as is: {e}")
+        return frame, None
+
+async def frame_generator(device_id: str, queue: ViewerQueue, variant: tuple[int | None, int] | None = None):
     """
     An asynchronous generator that yields the latest frame for a device.
+    Frames go through the viewer's own bounded queue, and the next frame is
+    only taken once the previous one has drained, so a slow viewer drops
+    frames according to its policy instead of buffering them.
     """
     logger.info(f"Starting frame generator for device: {device_id}")
+    pump_task = None
     try:
-        last_frame_sent = None
+        channel = await find_channel(device_id)
+        if channel is None:
+            logger.warning(f"No active stream for device {device_id}. Viewer disconnecting.")
+            return
+        viewers.setdefault(device_id, set()).add(queue)
+        # Only devices that actually stream get metrics
+        frame_age_seconds = metrics.device(device_id).frame_age_seconds
+        # The pump sleeps until the uploader publishes a newer frame or disconnects
+        pump_task = asyncio.create_task(queue.pump(channel))
         while True:
-            frame = None
-            async with streams_lock:
-                frame = streams.get(device_id)
-
-            if frame:
-                if frame != last_frame_sent:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                    last_frame_sent = frame
-            else:
-                logger.warning(f"No active stream for device {device_id}. Viewer disconnecting.")
+            result = await queue.get()
+            if result is None:
+                logger.warning(f"Stream for device {device_id} ended. Viewer disconnecting.")
                 break
-            
-            # Use asyncio.sleep to prevent blocking the server's event loop
-            await asyncio.sleep(0.1) # ~10 FPS
+            seq, frame = result
+            try:
+                frame = await frame_variant(device_id, seq, frame, variant)
+            except Exception as e:
+                logger.warning(f"Could not transcode frame {seq} from {device_id}: {e}")
+                continue
+            frame_age_seconds.observe(time.monotonic() - queue.last_received_at)
+            yield mjpeg_part(frame)
+            # The server only waits for a write to drain on the next send; an empty
+            # one holds the next frame back in the queue until this one is out
+            yield b''
     finally:
-        logger.info(f"Frame generator stopped for device: {device_id}")
+        if pump_task:
+            pump_task.cancel()
+        device_viewers = viewers.get(device_id)
+        if device_viewers is not None and queue in device_viewers:
+            device_metrics = metrics.devices.get(device_id)
+            if device_metrics is not None:
+                device_metrics.dropped_by_closed_viewers += queue.dropped
+            device_viewers.discard(queue)
+            if not device_viewers:
+                del viewers[device_id]
+            release_metrics(device_id)
+        logger.info(f"Frame generator stopped for device: {device_id}. "
+                    f"Sent {queue.sent} frames, dropped {queue.dropped}.")
 
-@app.get("/stream/{device_id}")
-async def stream(device_id: str):
+@app.get("/stream/{device_id}", dependencies=[Depends(require_viewer)])
+async def stream(device_id: str, request: Request, policy: DropPolicy | None = None,
+                 queue_size: int | None = Query(None, ge=1, le=VIEWER_MAX_QUEUE_SIZE),
+                 max_lag_ms: int | None = Query(None, ge=1, le=VIEWER_MAX_LAG_LIMIT_MS),
+                 w: int | None = Query(None, ge=16, le=4096), q: int | None = Query(None, ge=10, le=95)):
     """
     Serves the MJPEG stream to the Android app.
+    The frame-dropping policy defaults to the server configuration and can be
+    overridden per viewer with query parameters. `w` and `q` select a
+    downscaled / re-encoded variant, e.g. ?w=320&q=60 for thumbnails.
     """
-    # TODO: Add Firebase authentication check here using a dependency
-    
-    return StreamingResponse(frame_generator(device_id),
+    queue = ViewerQueue(device_id,
+                        policy=policy or VIEWER_POLICY,
+                        max_size=VIEWER_QUEUE_SIZE if queue_size is None else queue_size,
+                        max_lag_ms=VIEWER_MAX_LAG_MS if max_lag_ms is None else max_lag_ms)
+    limit_viewer_buffers(request)
+    return StreamingResponse(frame_generator(device_id, queue, variant_params(w, q)),
+                             media_type='multipart/x-mixed-replace; boundary=frame')
+
+
+# --- Snapshot Endpoints ---
+
+async def current_snapshot(device_id: str) -> tuple[int, bytes] | None:
+    """
+    (seq, frame) of the latest frame: the live one or, with the in-process
+    store, the last recorded after the uploader left. The history only exists
+    on the worker that received the upload, so with a shared store it is not
+    consulted and every worker answers alike.
+    """
+    result = await frame_store.latest(device_id)
+    if result is not None or frame_store.shared:
+        return result
+    entry = history.nearest(device_id, time.time())
+    return (entry[1], entry[2]) if entry else None
+
+def snapshot_etag(seq: int, frame: bytes, variant: tuple[int | None, int] | None) -> str:
+    # The checksum tells frames apart across relay restarts, after which the memory store numbers from 1 again
+    tag = f'{seq}-{zlib.crc32(frame):08x}'
+    if variant is not None:
+        tag += f'-{variant[0] or 0}w{variant[1]}q'
+    return f'"{tag}"'
+
+def if_none_match(request: Request) -> set[str]:
+    header = request.headers.get("if-none-match", "")
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+async def wait_for_newer(device_id: str, after_seq: int, timeout: float) -> tuple[int, bytes] | None:
+    """Waits up to `timeout` seconds for a frame newer than `after_seq`; None if none arrived."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    snapshot_waiters[device_id] = snapshot_waiters.get(device_id, 0) + 1
+    try:
+        while (remaining := deadline - loop.time()) > 0:
+            channel = await find_channel(device_id)
+            if channel is None or channel.closed:
+                # Not uploading right now; check again for a reconnect
+                await asyncio.sleep(min(remaining, 0.5))
+                continue
+            try:
+                result = await asyncio.wait_for(channel.wait_for_frame(after_seq), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if result is not None:
+                return result
+        return None
+    finally:
+        snapshot_waiters[device_id] -= 1
+        if not snapshot_waiters[device_id]:
+            del snapshot_waiters[device_id]
+
+@app.get("/snapshot/{device_id}", dependencies=[Depends(require_viewer)])
+async def snapshot(device_id: str, request: Request, wait: float = Query(0, ge=0, le=SNAPSHOT_MAX_WAIT),
+                   w: int | None = Query(None, ge=16, le=4096), q: int | None = Query(None, ge=10, le=95)):
+    """
+    Returns the latest still image of a device, for list and grid views that
+    do not need a stream. The ETag identifies the frame; a request whose
+    If-None-Match still matches gets a 304, or with `wait` (seconds) is held
+    until a newer frame arrives. Accepts the same `w`/`q` variants as /stream.
+    """
+    current = await current_snapshot(device_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="No frames for device")
+    variant = variant_params(w, q)
+    seq, frame = current
+    etag = snapshot_etag(seq, frame, variant)
+    known = if_none_match(request)
+    if etag in known or "*" in known:
+        newer = await wait_for_newer(device_id, seq, wait) if wait > 0 else None
+        if newer is None:
+            return Response(status_code=304, headers={"ETag": etag})
+        seq, frame = newer
+    image, served = await frame_variant_or_original(device_id, seq, frame, variant)
+    return Response(content=bytes(image), media_type="image/jpeg",
+                    headers={"ETag": snapshot_etag(seq, frame, served), "X-Frame-Seq": str(seq),
+                             "Cache-Control": "no-cache"})
+
+@app.get("/snapshots", dependencies=[Depends(require_viewer)])
+async def snapshots(request: Request, ids: str, wait: float = Query(0, ge=0, le=SNAPSHOT_MAX_WAIT),
+                    w: int | None = Query(None, ge=16, le=4096), q: int | None = Query(None, ge=10, le=95)):
+    """
+    Latest still images of several devices (`ids`, comma separated) in one
+    multipart/mixed response, one part per device carrying X-Device-Id and
+    ETag. Send the ETags already held in If-None-Match: only devices with a
+    different frame are included, a 304 means none changed, and with `wait`
+    the request is held until at least one of them has a newer frame.
+    """
+    device_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if len(device_ids) > SNAPSHOT_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {SNAPSHOT_MAX_IDS} devices per request")
+    variant = variant_params(w, q)
+    known = if_none_match(request)
+    current = dict(zip(device_ids, await asyncio.gather(*(current_snapshot(d) for d in device_ids))))
+    current = {device_id: result for device_id, result in current.items() if result is not None}
+    if not current:
+        raise HTTPException(status_code=404, detail="No frames for any of the devices")
+
+    changed = {device_id: result for device_id, result in current.items()
+               if snapshot_etag(*result, variant) not in known}
+    if not changed and wait > 0:
+        waits = {asyncio.create_task(wait_for_newer(device_id, seq, wait)): device_id
+                 for device_id, (seq, _) in current.items()}
+        pending = set(waits)
+        try:
+            while pending and not changed:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                changed = {waits[task]: task.result() for task in done if task.result() is not None}
+        finally:
+            for task in pending:
+                task.cancel()
+    if not changed:
+        return Response(status_code=304)
+
+    parts = []
+    for device_id, (seq, frame) in changed.items():
+        try:
+            image = await frame_variant(device_id, seq, frame, variant)
+        except Exception as e:
+            logger.warning(f"Could not transcode frame {seq} from {device_id}: {e}")
+            continue
+        headers = b'X-Device-Id: %s\r\nETag: %s\r\nX-Frame-Seq: %d\r\n' % (
+            device_id.encode(), snapshot_etag(seq, frame, variant).encode(), seq)
+        parts.append(mjpeg_part(bytes(image), headers))
+    parts.append(b'--frame--\r\n')
+    return Response(content=b''.join(parts), media_type='multipart/mixed; boundary=frame',
+                    headers={"Cache-Control": "no-cache"})
+
+# --- History Endpoints ---
+
+@app.get("/history/{device_id}/frame", dependencies=[Depends(require_viewer)])
+async def history_frame(device_id: str, ts: float | None = None,
+                        w: int | None = Query(None, ge=16, le=4096), q: int | None = Query(None, ge=10, le=95)):
+    """
+    Returns the recorded frame received closest to `ts` (Unix seconds),
+    or the most recent one. Useful for pairing an alert with what the
+    camera saw at that moment. Accepts the same `w`/`q` variants as /stream.
+    """
+    entry = history.nearest(device_id, ts if ts is not None else time.time())
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No recorded frames for device")
+    timestamp, seq, frame = entry
+    frame, _ = await frame_variant_or_original(device_id, seq, frame, variant_params(w, q))
+    return Response(content=bytes(frame), media_type="image/jpeg",
+                    headers={"X-Frame-Timestamp": f"{timestamp:.3f}", "X-Frame-Seq": str(seq)})
+
+async def replay_generator(frames: list[tuple[float, int, bytes]], speed: float):
+    previous = None
+    for timestamp, seq, frame in frames:
+        # Reproduce the original pacing; speed 0 sends everything at once
+        if speed > 0 and previous is not None:
+            await asyncio.sleep((timestamp - previous) / speed)
+        previous = timestamp
+        yield mjpeg_part(frame, b'X-Frame-Timestamp: %.3f\r\n' % timestamp)
+
+@app.get("/history/{device_id}/replay", dependencies=[Depends(require_viewer)])
+async def history_replay(device_id: str, seconds: float = 10, until: float | None = None, speed: float = 1):
+    """
+    Replays the frames recorded during the `seconds` before `until` (Unix
+    seconds, default now) as an MJPEG stream.
+    """
+    end = until if until is not None else time.time()
+    frames = history.between(device_id, end - min(seconds, HISTORY_MAX_REPLAY_SECONDS), end)
+    if not frames:
+        raise HTTPException(status_code=404, detail="No recorded frames in that range")
+    return StreamingResponse(replay_generator(frames, speed),
                              media_type='multipart/x-mixed-replace; boundary=frame')
 
+# --- Observability Endpoints ---
+
+@app.get("/metrics")
+async def relay_metrics():
+    """Serves relay metrics in the Prometheus text exposition format."""
+    extra = {
+        "feathershield_history_bytes": ("gauge", "Bytes held by the frame history.", history.total_bytes),
+        "feathershield_history_frames": ("gauge", "Frames held by the frame history.", history.total_frames),
+        "feathershield_variant_cache_hits_total": ("counter", "Frame variants served from cache.", variants.hits),
+        "feathershield_variant_cache_misses_total": ("counter", "Frame variants transcoded.", variants.misses),
+        "feathershield_mirrored_streams": ("gauge", "Streams mirrored from the frame store.", len(mirrors)),
+    }
+    if token_verifier:
+        extra["feathershield_token_cache_hits_total"] = ("counter", "Viewer tokens found verified in cache.",
+                                                         token_verifier.hits)
+        extra["feathershield_token_cache_misses_total"] = ("counter", "Viewer tokens verified by signature.",
+                                                           token_verifier.misses)
+    if device_verifier:
+        extra["feathershield_cert_cache_hits_total"] = ("counter", "Device certificates found validated in cache.",
+                                                        device_verifier.hits)
+        extra["feathershield_cert_cache_misses_total"] = ("counter", "Device certificates validated against the CA.",
+                                                          device_verifier.misses)
+    return PlainTextResponse(metrics.render(viewers, extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile")
+async def debug_profile(reset: bool = False):
+    """Returns collapsed event-loop stacks when RELAY_PROFILE_HZ is set."""
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler disabled; set RELAY_PROFILE_HZ")
+    return PlainTextResponse(profiler.collapsed(reset=reset))
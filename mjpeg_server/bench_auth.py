@@ -0,0 +1,148 @@
+"""
+Micro-benchmark and self-check of the relay's auth caches.
+
+Mints an RSA signing key, a JWKS served from memory, Firebase-style ID
+tokens, a device CA and device certificates locally, so it needs no network
+or Firebase project. Reports the cost of a verification with a cold and a
+warm cache, and checks that bad tokens, foreign certificates and revoked
+certificates are rejected.
+
+    python bench_auth.py --tokens 200 --iterations 20000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import time
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+from relay_auth import AuthError, DeviceCertVerifier, JWKSCache, TokenVerifier
+
+PROJECT_ID = "feathershield-bench"
+KID = "bench-key"
+
+
+def mint_jwks() -> tuple[rsa.RSAPrivateKey, dict]:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key()))
+    jwk.update(kid=KID, alg="RS256", use="sig")
+    return key, {"keys": [jwk]}
+
+
+def mint_token(key, uid: str, lifetime: int = 3600, **overrides) -> str:
+    now = int(time.time())
+    claims = {"iss": f"https://securetoken.google.com/{PROJECT_ID}", "aud": PROJECT_ID, "sub": uid,
+              "iat": now, "auth_time": now, "exp": now + lifetime}
+    claims.update(overrides)
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": KID})
+
+
+def mint_cert(subject: str, issuer_name: x509.Name, signing_key, ca: bool = False):
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.datetime.now(datetime.timezone.utc)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)])
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name if ca else issuer_name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.BasicConstraints(ca=ca, path_length=0 if ca else None), critical=True)
+            .sign(key if ca else signing_key, hashes.SHA256()))
+    return cert, key
+
+
+def timed(label: str, count: int, fn):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed / count * 1e6:9.1f} us")
+
+
+def expect_rejected(label: str, fn):
+    try:
+        fn()
+    except AuthError as e:
+        print(f"rejected {label}: {e}")
+        return
+    raise SystemExit(f"FAIL: {label} was accepted")
+
+
+async def bench_tokens(args):
+    key, jwks_body = mint_jwks()
+    fetches = 0
+
+    async def fetch(url):
+        nonlocal fetches
+        fetches += 1
+        return jwks_body, {"Cache-Control": "public, max-age=19800, must-revalidate", "Age": "120"}
+
+    jwks = JWKSCache(fetch=fetch)
+    verifier = TokenVerifier(PROJECT_ID, jwks)
+    tokens = [mint_token(key, f"user-{i}") for i in range(args.tokens)]
+
+    start = time.perf_counter()
+    for token in tokens:
+        await verifier.verify(token)
+    cold = (time.perf_counter() - start) / len(tokens)
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        await verifier.verify(tokens[i % len(tokens)])
+    warm = (time.perf_counter() - start) / args.iterations
+    print(f"{'token, signature check':<34} {cold * 1e6:9.1f} us")
+    print(f"{'token, cached':<34} {warm * 1e6:9.1f} us")
+    print(f"JWKS fetches: {fetches}, cache TTL {jwks.expires_at - jwks.fetched_at:.0f} s")
+
+    other_key, _ = mint_jwks()
+    for label, token in [("expired token", mint_token(key, "late", lifetime=-60)),
+                         ("wrong audience", mint_token(key, "x", aud="other-project")),
+                         ("foreign signature", mint_token(other_key, "x")),
+                         ("garbage", "not.a.token")]:
+        try:
+            await verifier.verify(token)
+        except AuthError as e:
+            print(f"rejected {label}: {e}")
+            continue
+        raise SystemExit(f"FAIL: {label} was accepted")
+
+
+def bench_certs(args):
+    ca_cert, ca_key = mint_cert("FeatherShield Bench CA", None, None, ca=True)
+    verifier = DeviceCertVerifier(ca_cert)
+    certs = [mint_cert(f"fs32-{i:012x}", ca_cert.subject, ca_key)[0].public_bytes(serialization.Encoding.PEM)
+             for i in range(args.certs)]
+
+    start = time.perf_counter()
+    for cert in certs:
+        verifier.verify(cert)
+    print(f"{'device cert, chain check':<34} {(time.perf_counter() - start) / len(certs) * 1e6:9.1f} us")
+    index = iter(range(10 ** 9))
+    timed("device cert, cached", args.iterations, lambda: verifier.verify(certs[next(index) % len(certs)]))
+
+    other_ca, other_key = mint_cert("Someone Else", None, None, ca=True)
+    foreign = mint_cert("fs32-000000000000", other_ca.subject, other_key)[0]
+    expect_rejected("foreign certificate", lambda: verifier.verify(foreign.public_bytes(serialization.Encoding.PEM)))
+    revoked = x509.load_pem_x509_certificate(certs[0])
+    verifier.revoke(revoked.fingerprint(hashes.SHA256()))
+    expect_rejected("revoked certificate", lambda: verifier.verify(certs[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the relay's token and certificate caches.")
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--certs", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(bench_tokens(args))
+    bench_certs(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of the MJPEG upload parser.
+
+Compares the original `buffer += chunk` / `buffer.split()` loop with
+MJPEGStreamParser on a synthetic stream and reports MB/s for a single stream.
+
+    python bench_parser.py --frame-size 60000 --chunk-size 1436 --frames 300
+"""
+import argparse
+import os
+import time
+
+from mjpeg_parser import MJPEGStreamParser
+
+
+def build_stream(frame_count: int, frame_size: int, content_length: bool) -> tuple[bytes, int]:
+    # Random payload keeps the boundary from showing up inside the "JPEG" by accident
+    jpeg = b'\xff\xd8' + os.urandom(frame_size - 4).replace(b'--', b'-.') + b'\xff\xd9'
+    header = b'--frame\r\nContent-Type: image/jpeg\r\n'
+    if content_length:
+        header += b'Content-Length: %d\r\n' % len(jpeg)
+    part = header + b'\r\n' + jpeg + b'\r\n'
+    return part * frame_count + b'--frame\r\n', len(jpeg)
+
+
+def chunked(data: bytes, chunk_size: int) -> list[bytes]:
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def legacy_loop(chunks: list[bytes]) -> int:
+    boundary = b'--frame'
+    buffer = b''
+    frames = 0
+    for chunk in chunks:
+        buffer += chunk
+        while boundary in buffer:
+            parts = buffer.split(boundary, 1)
+            frame_part = parts[0]
+            buffer = parts[1]
+            jpeg_start = frame_part.find(b'\r\n\r\n')
+            if jpeg_start != -1 and frame_part[jpeg_start + 4:]:
+                frames += 1
+    return frames
+
+
+def parser_loop(chunks: list[bytes]) -> int:
+    parser = MJPEGStreamParser(boundary=b'--frame')
+    frames = 0
+    for chunk in chunks:
+        frames += len(parser.feed(chunk))
+    return frames
+
+
+def run(name: str, func, chunks: list[bytes], total_bytes: int, repeat: int):
+    best = float('inf')
+    frames = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = func(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:>8}: {total_bytes / best / 1e6:10.1f} MB/s  ({frames} frames, {best * 1000:.1f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MJPEG upload parsing.")
+    parser.add_argument("--frames", type=int, default=200, help="Frames per synthetic stream")
+    parser.add_argument("--frame-size", type=int, default=60000, help="JPEG size in bytes (VGA ~30 KB, SVGA ~60 KB)")
+    parser.add_argument("--chunk-size", type=int, default=1436, help="Size of each body chunk handed to the parser")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation, best is reported")
+    parser.add_argument("--content-length", action="store_true", help="Include Content-Length part headers")
+    args = parser.parse_args()
+
+    data, _ = build_stream(args.frames, args.frame_size, args.content_length)
+    chunks = chunked(data, args.chunk_size)
+    print(f"{args.frames} frames x {args.frame_size} B in {len(chunks)} chunks of {args.chunk_size} B")
+    run("legacy", legacy_loop, chunks, len(data), args.repeat)
+    run("parser", parser_loop, chunks, len(data), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
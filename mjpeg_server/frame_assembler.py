@@ -0,0 +1,82 @@
+import struct
+
+# v1, as sent by firmware/esp32/main/websocket.cpp:
+#   "FRAM" + size (u16, big-endian) + chunk_count (u16, big-endian)
+FRAME_MAGIC_V1 = b'FRAM'
+_HEADER_V1 = struct.Struct('!4sHH')
+
+# v2 lifts the 64 KB limit:
+#   "FRMX" + version (u8, = 2) + reserved (u8) + chunk_count (u16) + size (u32), big-endian
+FRAME_MAGIC_V2 = b'FRMX'
+FRAME_VERSION_2 = 2
+_HEADER_V2 = struct.Struct('!4sBBHI')
+
+
+class FrameProtocolError(Exception):
+    """Raised when a device sends a malformed frame."""
+
+
+class FrameTooLargeError(FrameProtocolError):
+    """Raised when a frame header announces more than the configured maximum."""
+
+
+class FrameAssembler:
+    """
+    Reassembles frames sent over WebSocket as a header message followed by
+    binary chunk messages.
+
+    The header announces the frame size, so every chunk is written straight
+    into a buffer preallocated to that size. The completed buffer is handed
+    over as-is and a fresh one is allocated for the next frame, so no frame
+    bytes are copied after they leave the socket.
+    """
+
+    def __init__(self, max_frame_size: int = 1024 * 1024):
+        self.max_frame_size = max_frame_size
+        self._buffer = None
+        self._offset = 0
+        self._chunks_left = 0
+
+    def feed(self, message: bytes) -> bytearray | None:
+        """Consumes one binary WebSocket message and returns the frame it completed, if any."""
+        if self._buffer is None:
+            self._start_frame(message)
+            return None
+
+        end = self._offset + len(message)
+        if end > len(self._buffer) or self._chunks_left == 0:
+            self.reset()
+            raise FrameProtocolError("Frame data exceeds the size announced in its header")
+        self._buffer[self._offset:end] = message
+        self._offset = end
+        self._chunks_left -= 1
+
+        if self._offset < len(self._buffer):
+            return None
+        frame = self._buffer
+        self.reset()
+        return frame
+
+    def reset(self):
+        self._buffer = None
+        self._offset = 0
+        self._chunks_left = 0
+
+    def _start_frame(self, header: bytes):
+        magic = header[:4]
+        if magic == FRAME_MAGIC_V1 and len(header) == _HEADER_V1.size:
+            _, size, chunk_count = _HEADER_V1.unpack(header)
+        elif magic == FRAME_MAGIC_V2 and len(header) == _HEADER_V2.size:
+            _, version, _, chunk_count, size = _HEADER_V2.unpack(header)
+            if version != FRAME_VERSION_2:
+                raise FrameProtocolError(f"Unsupported frame header version {version}")
+        else:
+            raise FrameProtocolError("Expected a frame header")
+
+        if size == 0 or chunk_count == 0:
+            raise FrameProtocolError("Frame header announces an empty frame")
+        if size > self.max_frame_size:
+            raise FrameTooLargeError(f"Frame of {size} bytes exceeds the {self.max_frame_size} byte limit")
+        self._buffer = bytearray(size)
+        self._offset = 0
+        self._chunks_left = chunk_count
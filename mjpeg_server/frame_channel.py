@@ -0,0 +1,45 @@
+import asyncio
+
+
+class FrameChannel:
+    """
+    Per-device broadcast channel holding the latest frame.
+
+    Every published frame gets a monotonically increasing sequence number.
+    Viewers remember the last sequence they sent and sleep on the channel's
+    condition until a newer one exists, so there is no polling and no frame
+    comparison. Each channel has its own lock, so a busy device never
+    serializes the others.
+    """
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.seq = 0
+        self.frame = None
+        self.closed = False
+        self._condition = asyncio.Condition()
+
+    async def publish(self, frame: bytes, seq: int | None = None) -> int:
+        """Publishes a frame, optionally under a sequence number assigned by the frame store."""
+        async with self._condition:
+            self.seq = seq if seq is not None else self.seq + 1
+            self.frame = frame
+            self._condition.notify_all()
+            return self.seq
+
+    async def close(self):
+        """Marks the upload as finished and wakes every waiting viewer."""
+        async with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    async def wait_for_frame(self, after_seq: int) -> tuple[int, bytes] | None:
+        """
+        Waits until a frame newer than `after_seq` is available.
+        Returns (seq, frame), or None once the channel is closed.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.seq > after_seq or self.closed)
+            if self.seq > after_seq:
+                return self.seq, self.frame
+            return None
@@ -0,0 +1,162 @@
+import time
+from collections import deque
+
+
+class DeviceHistory:
+    """
+    Fixed-capacity ring of (timestamp, seq, frame) for one device.
+
+    Entries are appended in timestamp order, so the ring can be binary
+    searched by timestamp. Appending and evicting the oldest entry are O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.bytes = 0
+        self._timestamps = [0.0] * capacity
+        self._seqs = [0] * capacity
+        self._ids = [0] * capacity
+        self._frames = [None] * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _slot(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    @property
+    def oldest_id(self) -> int:
+        return self._ids[self._start]
+
+    @property
+    def newest_timestamp(self) -> float:
+        return self._timestamps[self._slot(self._count - 1)] if self._count else 0.0
+
+    def append(self, entry_id: int, timestamp: float, seq: int, frame: bytes):
+        """Appends a frame; the caller must evict first if the ring is full."""
+        slot = self._slot(self._count)
+        self._ids[slot] = entry_id
+        self._timestamps[slot] = timestamp
+        self._seqs[slot] = seq
+        self._frames[slot] = frame
+        self._count += 1
+        self.bytes += len(frame)
+
+    def pop_oldest(self) -> int:
+        """Evicts the oldest frame and returns its size."""
+        slot = self._start
+        size = len(self._frames[slot])
+        self._frames[slot] = None
+        self._start = (self._start + 1) % self.capacity
+        self._count -= 1
+        self.bytes -= size
+        return size
+
+    def entry(self, index: int) -> tuple[float, int, bytes]:
+        slot = self._slot(index)
+        return self._timestamps[slot], self._seqs[slot], self._frames[slot]
+
+    def _bisect(self, timestamp: float) -> int:
+        """Returns the index of the first entry at or after `timestamp`."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamps[self._slot(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def nearest(self, timestamp: float) -> tuple[float, int, bytes] | None:
+        if not self._count:
+            return None
+        index = self._bisect(timestamp)
+        if index == self._count:
+            return self.entry(index - 1)
+        if index > 0 and timestamp - self._timestamps[self._slot(index - 1)] <= \
+                self._timestamps[self._slot(index)] - timestamp:
+            return self.entry(index - 1)
+        return self.entry(index)
+
+    def between(self, start: float, end: float) -> list[tuple[float, int, bytes]]:
+        first = self._bisect(start)
+        last = self._bisect(end + 1e-9)
+        return [self.entry(i) for i in range(first, last)]
+
+
+class FrameHistory:
+    """
+    Recent frames of every device, indexed by receive time.
+
+    Each device keeps at most `max_frames` frames and `max_device_bytes`
+    bytes, and all devices together at most `max_total_bytes`. When the
+    global budget is exceeded the globally oldest frame goes first; a FIFO
+    of entry ids in arrival order finds it in amortized O(1).
+    """
+
+    def __init__(self, max_frames: int = 50, max_device_bytes: int = 4 * 1024 * 1024,
+                 max_total_bytes: int = 256 * 1024 * 1024):
+        self.max_frames = max_frames
+        self.max_device_bytes = max_device_bytes
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self.total_frames = 0
+        self._devices: dict[str, DeviceHistory] = {}
+        # (entry id, device id) in arrival order; may hold ids already evicted per device
+        self._arrivals = deque()
+        self._next_id = 0
+
+    def append(self, device_id: str, seq: int, frame: bytes, timestamp: float | None = None):
+        history = self._devices.get(device_id)
+        if history is None:
+            history = self._devices[device_id] = DeviceHistory(self.max_frames)
+        # Keep the ring sorted even if the wall clock steps backwards
+        timestamp = max(timestamp or time.time(), history.newest_timestamp)
+
+        while len(history) and (len(history) == history.capacity
+                                or history.bytes + len(frame) > self.max_device_bytes):
+            self._pop_oldest(history)
+
+        self._next_id += 1
+        history.append(self._next_id, timestamp, seq, frame)
+        self._arrivals.append((self._next_id, device_id))
+        self.total_bytes += len(frame)
+        self.total_frames += 1
+
+        while self.total_bytes > self.max_total_bytes and self._evict_globally_oldest():
+            pass
+        # Per-device evictions leave stale arrivals behind; drop them before they pile up
+        if len(self._arrivals) > 2 * self.total_frames + 64:
+            self._arrivals = deque(a for a in self._arrivals if self._is_live(*a))
+
+    def _pop_oldest(self, history: DeviceHistory):
+        self.total_bytes -= history.pop_oldest()
+        self.total_frames -= 1
+
+    def _is_live(self, entry_id: int, device_id: str) -> bool:
+        history = self._devices.get(device_id)
+        return history is not None and len(history) > 0 and entry_id >= history.oldest_id
+
+    def _evict_globally_oldest(self) -> bool:
+        while self._arrivals:
+            entry_id, device_id = self._arrivals.popleft()
+            if not self._is_live(entry_id, device_id):
+                continue
+            history = self._devices[device_id]
+            self._pop_oldest(history)
+            if not len(history):
+                del self._devices[device_id]
+            return True
+        return False
+
+    def nearest(self, device_id: str, timestamp: float) -> tuple[float, int, bytes] | None:
+        """Returns (timestamp, seq, frame) of the frame received closest to `timestamp`."""
+        history = self._devices.get(device_id)
+        return history.nearest(timestamp) if history else None
+
+    def between(self, device_id: str, start: float, end: float) -> list[tuple[float, int, bytes]]:
+        """Returns the frames received between `start` and `end`, oldest first."""
+        history = self._devices.get(device_id)
+        return history.between(start, end) if history else []
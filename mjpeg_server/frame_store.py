@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+
+
+class FrameStore(ABC):
+    """
+    Where the latest frame of every uploading device lives, so that a viewer
+    can be served by a different worker (or node) than the one receiving the
+    upload. Sequence numbers are per device and only ever increase.
+    `shared` tells whether other workers see the same frames.
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def publish(self, device_id: str, frame: bytes) -> int:
+        """Stores a new frame for a device and returns its sequence number."""
+        pass
+
+    @abstractmethod
+    async def latest(self, device_id: str, after_seq: int = 0) -> tuple[int, bytes] | None:
+        """Returns (seq, frame) for the latest frame if it is newer than `after_seq`."""
+        pass
+
+    @abstractmethod
+    async def seq(self, device_id: str) -> int | None:
+        """Returns the latest sequence number, or None if the device is not uploading."""
+        pass
+
+    @abstractmethod
+    async def remove(self, device_id: str):
+        """Marks the device's upload as finished."""
+        pass
+
+    async def close(self):
+        pass
+
+
+class InProcessFrameStore(FrameStore):
+    """Process-local store. Viewers and uploaders must land on the same worker."""
+
+    def __init__(self):
+        self._frames: dict[str, tuple[int, bytes]] = {}
+        self._seqs: dict[str, int] = {}
+
+    async def publish(self, device_id: str, frame: bytes) -> int:
+        seq = self._seqs.get(device_id, 0) + 1
+        self._seqs[device_id] = seq
+        self._frames[device_id] = (seq, frame)
+        return seq
+
+    async def latest(self, device_id: str, after_seq: int = 0) -> tuple[int, bytes] | None:
+        entry = self._frames.get(device_id)
+        if entry is None or entry[0] <= after_seq:
+            return None
+        return entry
+
+    async def seq(self, device_id: str) -> int | None:
+        entry = self._frames.get(device_id)
+        return entry[0] if entry else None
+
+    async def remove(self, device_id: str):
+        self._frames.pop(device_id, None)
+
+
+# Segment header: magic, slot_count, slot_size, closed flag, latest seq
+_SHM_MAGIC = b'FSHM'
+_SHM_HEADER = struct.Struct('<4sIIIQ')
+_SHM_LATEST_OFFSET = 16
+# Slot header: version (odd while being written), seq, length
+_SLOT_HEADER = struct.Struct('<QQI4x')
+_VERSION = struct.Struct('<Q')
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to an existing segment without making this process responsible
+    for unlinking it. Before Python 3.13 attaching always registers with the
+    resource tracker; uvicorn workers share their parent's tracker, so the
+    uploader's unlink clears that registration again.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+class SharedMemoryFrameStore(FrameStore):
+    """
+    Store shared by all workers on one host.
+
+    Each uploading device owns a shared memory segment, named after a hash of
+    its id, holding a small ring of fixed-size slots. The (single) writer
+    bumps a slot's version to odd, copies the frame in, bumps it back to even
+    and then advances the segment's latest seq. Readers copy the latest slot
+    and retry if its version was odd or changed meanwhile (a seqlock), so
+    neither side ever takes a lock.
+
+    A finished upload unlinks its segment. The next upload of the device, in
+    whichever worker, numbers its frames from the host's monotonic clock in
+    microseconds, so they continue above the previous session's: that clock
+    is shared by all processes, never goes back and, like the segments, only
+    resets with a reboot.
+    """
+
+    shared = True
+
+    def __init__(self, slot_count: int = 4, slot_size: int = 256 * 1024, read_retries: int = 8):
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.read_retries = read_retries
+        self._writers: dict[str, shared_memory.SharedMemory] = {}
+        self._readers: dict[str, shared_memory.SharedMemory] = {}
+
+    @staticmethod
+    def segment_name(device_id: str) -> str:
+        return "fs_" + hashlib.sha1(device_id.encode()).hexdigest()[:20]
+
+    def _slot_offset(self, seq: int, slot_count: int, slot_size: int) -> int:
+        return _SHM_HEADER.size + (seq % slot_count) * (_SLOT_HEADER.size + slot_size)
+
+    def _open_writer(self, device_id: str) -> shared_memory.SharedMemory:
+        name = self.segment_name(device_id)
+        size = _SHM_HEADER.size + self.slot_count * (_SLOT_HEADER.size + self.slot_size)
+        # Above every seq of an earlier segment of the device, unless it published a million frames a second
+        floor = time.monotonic_ns() // 1000
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+            _SHM_HEADER.pack_into(shm.buf, 0, _SHM_MAGIC, self.slot_count, self.slot_size, 0, floor)
+        except FileExistsError:
+            # Left behind by a previous upload; keep its seq if that is higher
+            shm = shared_memory.SharedMemory(name)
+            magic, slot_count, slot_size, _, latest = _SHM_HEADER.unpack_from(shm.buf, 0)
+            if magic != _SHM_MAGIC or (slot_count, slot_size) != (self.slot_count, self.slot_size):
+                latest = 0
+            _SHM_HEADER.pack_into(shm.buf, 0, _SHM_MAGIC, self.slot_count, self.slot_size, 0, max(latest, floor))
+        self._writers[device_id] = shm
+        return shm
+
+    def _open_reader(self, device_id: str) -> shared_memory.SharedMemory | None:
+        shm = self._readers.get(device_id)
+        if shm is None:
+            try:
+                shm = _attach_untracked(self.segment_name(device_id))
+            except FileNotFoundError:
+                return None
+            self._readers[device_id] = shm
+        magic, _, _, closed, _ = _SHM_HEADER.unpack_from(shm.buf, 0)
+        if magic != _SHM_MAGIC or closed:
+            self._drop_reader(device_id)
+            return None
+        return shm
+
+    def _drop_reader(self, device_id: str):
+        shm = self._readers.pop(device_id, None)
+        if shm is not None:
+            shm.close()
+
+    async def publish(self, device_id: str, frame: bytes) -> int:
+        if len(frame) > self.slot_size:
+            raise ValueError(f"Frame of {len(frame)} bytes does not fit a {self.slot_size} byte slot")
+        shm = self._writers.get(device_id) or self._open_writer(device_id)
+        buf = shm.buf
+        seq = _VERSION.unpack_from(buf, _SHM_LATEST_OFFSET)[0] + 1
+        offset = self._slot_offset(seq, self.slot_count, self.slot_size)
+        version = _VERSION.unpack_from(buf, offset)[0]
+        _VERSION.pack_into(buf, offset, version + 1)
+        data_offset = offset + _SLOT_HEADER.size
+        buf[data_offset:data_offset + len(frame)] = frame
+        _SLOT_HEADER.pack_into(buf, offset, version + 2, seq, len(frame))
+        _VERSION.pack_into(buf, _SHM_LATEST_OFFSET, seq)
+        return seq
+
+    async def latest(self, device_id: str, after_seq: int = 0) -> tuple[int, bytes] | None:
+        shm = self._open_reader(device_id)
+        if shm is None:
+            return None
+        buf = shm.buf
+        _, slot_count, slot_size, _, _ = _SHM_HEADER.unpack_from(buf, 0)
+        for _ in range(self.read_retries):
+            latest = _VERSION.unpack_from(buf, _SHM_LATEST_OFFSET)[0]
+            if latest <= after_seq:
+                return None
+            offset = self._slot_offset(latest, slot_count, slot_size)
+            version, seq, length = _SLOT_HEADER.unpack_from(buf, offset)
+            if version & 1 or seq != latest:
+                continue
+            data_offset = offset + _SLOT_HEADER.size
+            frame = bytes(buf[data_offset:data_offset + length])
+            if _VERSION.unpack_from(buf, offset)[0] == version:
+                return seq, frame
+        return None
+
+    async def seq(self, device_id: str) -> int | None:
+        shm = self._open_reader(device_id)
+        if shm is None:
+            return None
+        return _VERSION.unpack_from(shm.buf, _SHM_LATEST_OFFSET)[0]
+
+    async def remove(self, device_id: str):
+        shm = self._writers.pop(device_id, None)
+        if shm is None:
+            return
+        struct.pack_into('<I', shm.buf, 12, 1)
+        shm.close()
+        # Readers that are still attached keep their mapping; new readers will not find it
+        shm.unlink()
+
+    async def close(self):
+        for device_id in list(self._writers):
+            await self.remove(device_id)
+        for device_id in list(self._readers):
+            self._drop_reader(device_id)
+
+
+# Socket protocol, all big-endian. Request: op (u8), device id length (u16), device id, then
+#   PUBLISH: frame length (u32) + frame  -> seq (u64)
+#   LATEST:  after_seq (u64)             -> seq (u64), frame length (u32) + frame; seq 0 if none
+#   SEQ:                                 -> seq (u64); 0 if the device is not uploading
+#   REMOVE:                              -> 0 (u64)
+OP_PUBLISH = 1
+OP_LATEST = 2
+OP_SEQ = 3
+OP_REMOVE = 4
+REQUEST_HEADER = struct.Struct('!BH')
+U32 = struct.Struct('!I')
+U64 = struct.Struct('!Q')
+LATEST_REPLY = struct.Struct('!QI')
+
+
+class SocketFrameStore(FrameStore):
+    """
+    Store kept by a frame store server (see frame_store_server.py) so that
+    several relay nodes can share devices. Requests are serialized over one
+    connection per process, which is re-established once on failure.
+    """
+
+    shared = True
+
+    def __init__(self, host: str, port: int, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _request(self, op: int, device_id: str, *body: bytes, reply=U64):
+        device = device_id.encode()
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await asyncio.wait_for(
+                            asyncio.open_connection(self.host, self.port), self.timeout)
+                    self._writer.writelines((REQUEST_HEADER.pack(op, len(device)), device, *body))
+                    await self._writer.drain()
+                    header = reply.unpack(await asyncio.wait_for(
+                        self._reader.readexactly(reply.size), self.timeout))
+                    if reply is LATEST_REPLY:
+                        frame = await asyncio.wait_for(self._reader.readexactly(header[1]), self.timeout)
+                        return header[0], frame
+                    return header[0]
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    await self._disconnect()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # Cancelled mid-request: the reply may be half read, so the connection cannot be reused
+                    await self._disconnect()
+                    raise
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def publish(self, device_id: str, frame: bytes) -> int:
+        return await self._request(OP_PUBLISH, device_id, U32.pack(len(frame)), frame)
+
+    async def latest(self, device_id: str, after_seq: int = 0) -> tuple[int, bytes] | None:
+        seq, frame = await self._request(OP_LATEST, device_id, U64.pack(after_seq), reply=LATEST_REPLY)
+        return (seq, frame) if seq else None
+
+    async def seq(self, device_id: str) -> int | None:
+        return await self._request(OP_SEQ, device_id) or None
+
+    async def remove(self, device_id: str):
+        await self._request(OP_REMOVE, device_id)
+
+    async def close(self):
+        await self._disconnect()
+
+
+def create_frame_store(max_frame_size: int) -> FrameStore:
+    """
+    Builds the frame store selected by the FRAME_STORE environment variable.
+    `max_frame_size` is the largest frame the ingest endpoints accept; shm
+    slots are sized to hold it.
+    """
+    backend = os.getenv("FRAME_STORE", "memory")
+    if backend == "memory":
+        return InProcessFrameStore()
+    if backend == "shm":
+        slot_size = int(os.getenv("FRAME_STORE_SLOT_SIZE", str(max_frame_size)))
+        if slot_size < max_frame_size:
+            raise ValueError(f"FRAME_STORE_SLOT_SIZE ({slot_size}) is smaller than MAX_FRAME_SIZE ({max_frame_size})")
+        return SharedMemoryFrameStore(slot_count=int(os.getenv("FRAME_STORE_SLOTS", "4")), slot_size=slot_size)
+    if backend == "socket":
+        host, _, port = os.getenv("FRAME_STORE_ADDR", "127.0.0.1:8780").rpartition(":")
+        return SocketFrameStore(host, int(port))
+    raise ValueError(f"Unknown FRAME_STORE backend: {backend}")
@@ -0,0 +1,73 @@
+"""
+Minimal frame store server for SocketFrameStore.
+
+Keeps the latest frame of every device in memory and answers the protocol
+described in frame_store.py. Good enough to let several relay nodes share
+devices on a LAN or to exercise the socket backend locally:
+
+    python frame_store_server.py --port 8780
+    FRAME_STORE=socket FRAME_STORE_ADDR=127.0.0.1:8780 uvicorn app:app --port 8000
+    FRAME_STORE=socket FRAME_STORE_ADDR=127.0.0.1:8780 uvicorn app:app --port 8001
+"""
+import argparse
+import asyncio
+import logging
+
+from frame_store import (
+    InProcessFrameStore, OP_LATEST, OP_PUBLISH, OP_REMOVE, OP_SEQ,
+    LATEST_REPLY, REQUEST_HEADER, U32, U64,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+store = InProcessFrameStore()
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    peer = writer.get_extra_info("peername")
+    logger.info(f"Relay connected from {peer}")
+    try:
+        while True:
+            op, device_len = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+            device_id = (await reader.readexactly(device_len)).decode()
+            if op == OP_PUBLISH:
+                length = U32.unpack(await reader.readexactly(U32.size))[0]
+                seq = await store.publish(device_id, await reader.readexactly(length))
+                writer.write(U64.pack(seq))
+            elif op == OP_LATEST:
+                after_seq = U64.unpack(await reader.readexactly(U64.size))[0]
+                entry = await store.latest(device_id, after_seq)
+                if entry is None:
+                    writer.write(LATEST_REPLY.pack(0, 0))
+                else:
+                    writer.writelines((LATEST_REPLY.pack(entry[0], len(entry[1])), entry[1]))
+            elif op == OP_SEQ:
+                writer.write(U64.pack(await store.seq(device_id) or 0))
+            elif op == OP_REMOVE:
+                await store.remove(device_id)
+                writer.write(U64.pack(0))
+            else:
+                logger.warning(f"Unknown op {op} from {peer}, closing connection")
+                break
+            await writer.drain()
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        logger.info(f"Relay disconnected: {peer}")
+        writer.close()
+
+
+async def main(host: str, port: int):
+    server = await asyncio.start_server(handle_client, host, port)
+    logger.info(f"Frame store listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame store server shared by relay nodes.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,73 @@
+import asyncio
+import io
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def transcode(frame: bytes, width: int | None, quality: int) -> bytes:
+    """Downscales (never upscales) and re-encodes a JPEG frame."""
+    with Image.open(io.BytesIO(frame)) as img:
+        if width and width < img.width:
+            size = (width, max(1, round(img.height * width / img.width)))
+            # Let the JPEG decoder do most of the scaling via DCT downsampling
+            img.draft("RGB", size)
+            img = img.resize(size, Image.BILINEAR)
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=quality)
+        return out.getvalue()
+
+
+class VariantCache:
+    """
+    Produces downscaled/re-encoded variants of device frames.
+
+    Each (device, frame seq, width, quality) variant is computed at most once:
+    concurrent requests for it await the same future, and the result is kept
+    in an LRU bounded by total bytes. The work runs in a thread pool (Pillow
+    releases the GIL while decoding and encoding), so the event loop is never
+    blocked and CPU scales with the number of variants, not viewers.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_workers: int = 2):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self._pending: dict[tuple, asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="variant")
+
+    async def get(self, device_id: str, seq: int, frame: bytes, width: int | None, quality: int) -> bytes:
+        key = (device_id, seq, width, quality)
+        variant = self._cache.get(key)
+        if variant is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return variant
+
+        future = self._pending.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.get_running_loop().run_in_executor(self._executor, transcode, frame, width, quality)
+            self._pending[key] = future
+            future.add_done_callback(lambda f: self._store(key, f))
+        # Shielded so a viewer disconnecting does not cancel the work for the others
+        return await asyncio.shield(future)
+
+    def _store(self, key: tuple, future: asyncio.Future):
+        self._pending.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        variant = future.result()
+        self._cache[key] = variant
+        self.bytes += len(variant)
+        while self.bytes > self.max_bytes and self._cache:
+            _, evicted = self._cache.popitem(last=False)
+            self.bytes -= len(evicted)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+"""
+Load test for viewer backpressure.
+
+Starts the relay in-process, drives it with one synthetic uploader and a mix
+of fast and deliberately slow viewers of the same device, then reports what
+each group received, how stale the frames were on arrival, and the
+per-viewer drop counters kept by the server. Fails if slow viewers get
+frames much staler than their own download time and queue policy explain.
+
+    python load_test.py --slow-viewers 50 --fast-viewers 5 --policy latest
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import statistics
+import struct
+import time
+
+import uvicorn
+
+import app as relay
+from mjpeg_parser import MJPEGStreamParser
+
+DEVICE_ID = "loadtest-001"
+
+
+def synthetic_frame(size: int) -> bytes:
+    # The capture time rides inside the fake JPEG so viewers can measure frame age
+    stamp = struct.pack("!d", time.time())
+    return b'\xff\xd8' + stamp + b'\x00' * (size - len(stamp) - 4) + b'\xff\xd9'
+
+
+async def uploader(port: int, fps: float, frame_size: int, duration: float):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((f"POST /upload_stream/{DEVICE_ID} HTTP/1.1\r\n"
+                  "Host: localhost\r\n"
+                  "Content-Type: multipart/x-mixed-replace; boundary=frame\r\n"
+                  "Transfer-Encoding: chunked\r\n\r\n").encode())
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = synthetic_frame(frame_size)
+        part = (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(frame)
+                + frame + b'\r\n')
+        writer.write(b'%x\r\n%s\r\n' % (len(part), part))
+        await writer.drain()
+        await asyncio.sleep(1 / fps)
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+    await reader.read()
+    writer.close()
+
+
+async def viewer(port: int, policy: str, read_delay: float, deadline: float, results: list):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if read_delay:
+        # A small receive window makes the server feel the slow reader immediately
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    # A slow viewer's own stream buffer stays small too, or it would read ahead of its pace
+    reader, writer = await asyncio.open_connection(sock=sock, limit=4096 if read_delay else 2 ** 16)
+    # HTTP/1.0 keeps the response body free of chunked framing
+    writer.write(f"GET /stream/{DEVICE_ID}?policy={policy} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b'\r\n\r\n')
+
+    parser = MJPEGStreamParser(boundary=b'--frame')
+    frames, ages = 0, []
+    while time.monotonic() < deadline and (chunk := await reader.read(4096)):
+        for frame in parser.feed(chunk):
+            frames += 1
+            ages.append((time.time() - struct.unpack("!d", frame[2:10])[0]) * 1000)
+        if read_delay:
+            await asyncio.sleep(read_delay)
+    writer.close()
+    results.append((frames, ages))
+
+
+def summarize(name: str, results: list) -> float:
+    """Prints what a group of viewers received and returns their median frame age in ms."""
+    if not results:
+        return float('nan')
+    frames = [r[0] for r in results]
+    ages = sorted(a for r in results for a in r[1])
+    p = (lambda q: ages[min(len(ages) - 1, int(q * len(ages)))]) if ages else (lambda q: float('nan'))
+    print(f"{name:>5} viewers: {len(results):4d}  frames/viewer avg {statistics.mean(frames):7.1f}  "
+          f"age p50 {p(0.5):7.1f} ms  p99 {p(0.99):7.1f} ms")
+    return p(0.5)
+
+
+def slow_age_bound(args) -> float:
+    """
+    Frame age in ms a slow viewer should stay under when its queue, not the
+    socket, is what backs up: the time to download one frame plus whatever the
+    send and receive buffers may hold at the viewer's pace, plus the wait the
+    policy allows in the queue.
+    """
+    pace = 4096 / args.slow_delay
+    in_flight = args.frame_size + 2 * relay.VIEWER_SEND_BUFFER + 4 * 4096
+    if args.policy == relay.DropPolicy.MAX_LAG.value:
+        queued = relay.VIEWER_MAX_LAG_MS
+    elif args.policy == relay.DropPolicy.DROP_OLDEST.value:
+        queued = relay.VIEWER_QUEUE_SIZE * args.frame_size / pace * 1000
+    else:
+        queued = 1000 / args.fps
+    return in_flight / pace * 1000 + queued
+
+
+async def main(args):
+    config = uvicorn.Config(relay.app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    upload_task = asyncio.create_task(uploader(args.port, args.fps, args.frame_size, args.duration))
+    await asyncio.sleep(0.5)
+    # Viewers hang up with the uploader instead of draining whatever the kernel still buffers
+    deadline = time.monotonic() + args.duration - 0.5
+    fast, slow = [], []
+    viewer_tasks = [asyncio.create_task(viewer(args.port, args.policy, 0, deadline, fast))
+                    for _ in range(args.fast_viewers)]
+    viewer_tasks += [asyncio.create_task(viewer(args.port, args.policy, args.slow_delay, deadline, slow))
+                     for _ in range(args.slow_viewers)]
+
+    # Sample the server-side counters while everything is still attached
+    await asyncio.sleep(args.duration - 1)
+    queues = list(relay.viewers.get(DEVICE_ID, ()))
+    dropped = sorted(q.dropped for q in queues)
+    pending = max((len(q._frames) for q in queues), default=0)
+
+    await upload_task
+    await asyncio.gather(*viewer_tasks)
+    server.should_exit = True
+    await server_task
+
+    print(f"policy={args.policy} fps={args.fps} frame={args.frame_size} B duration={args.duration}s")
+    summarize("fast", fast)
+    slow_age = summarize("slow", slow)
+    if dropped:
+        print(f"server drops per viewer: min {dropped[0]} median {dropped[len(dropped) // 2]} max {dropped[-1]}, "
+              f"max queued frames {pending}")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if slow:
+        bound = slow_age_bound(args)
+        if not slow_age <= bound:
+            raise SystemExit(f"FAIL: slow viewers' median frame age {slow_age:.1f} ms exceeds {bound:.1f} ms; "
+                             "frames are piling up in socket buffers instead of being dropped")
+        print(f"slow viewers' median frame age within {bound:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slow-consumer load test for /stream.")
+    parser.add_argument("--port", type=int, default=int(os.getenv("LOADTEST_PORT", "8765")))
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--frame-size", type=int, default=40000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--fast-viewers", type=int, default=5)
+    parser.add_argument("--slow-viewers", type=int, default=50)
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="Seconds a slow viewer sleeps per 4 KB read")
+    parser.add_argument("--policy", choices=[p.value for p in relay.DropPolicy], default=relay.VIEWER_POLICY.value)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+import re
+
+_SEEK_BOUNDARY = 0
+_HEADERS = 1
+_BODY = 2
+
+_HEADER_END = b'\r\n\r\n'
+_CONTENT_LENGTH_RE = re.compile(rb'(?im)^content-length:\s*(\d+)\s*$')
+
+
+class MJPEGStreamParser:
+    """
+    Incremental parser for a multipart MJPEG upload stream.
+
+    Bytes are appended to a single bytearray and every search resumes where
+    the previous one stopped, so each byte is scanned once no matter how the
+    stream is chunked. Consumed data is dropped from the front of the buffer
+    (O(1) for a bytearray), and a frame is copied out exactly once, when it is
+    handed to the caller.
+
+    When a part carries a Content-Length header the body is sliced out as soon
+    as it is complete; otherwise the body ends at the next boundary.
+    """
+
+    def __init__(self, boundary: bytes = b'--frame', max_part_size: int = 4 * 1024 * 1024,
+                 max_header_size: int = 1024):
+        self.boundary = boundary
+        self.max_part_size = max_part_size
+        self.max_header_size = max_header_size
+        self._buf = bytearray()
+        self._state = _SEEK_BOUNDARY
+        self._scan_pos = 0
+        self._content_length = None
+        self.dropped_parts = 0
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        """Appends a chunk of the stream and returns every frame it completed."""
+        self._buf += chunk
+        frames = []
+        while True:
+            if self._state == _SEEK_BOUNDARY:
+                if not self._seek_boundary():
+                    break
+            elif self._state == _HEADERS:
+                if not self._read_headers():
+                    break
+            else:
+                frame = self._read_body()
+                if frame is None:
+                    break
+                if frame:
+                    frames.append(frame)
+        return frames
+
+    def _seek_boundary(self) -> bool:
+        buf = self._buf
+        idx = buf.find(self.boundary, self._scan_pos)
+        if idx == -1:
+            # Only a partial boundary at the very end can still matter.
+            keep = len(self.boundary) - 1
+            if len(buf) > keep:
+                del buf[:len(buf) - keep]
+            self._scan_pos = 0
+            return False
+        del buf[:idx + len(self.boundary)]
+        self._scan_pos = 0
+        self._state = _HEADERS
+        return True
+
+    def _read_headers(self) -> bool:
+        buf = self._buf
+        idx = buf.find(_HEADER_END, self._scan_pos)
+        if idx == -1:
+            if len(buf) > self.max_header_size:
+                self._drop_part()
+            else:
+                self._scan_pos = max(0, len(buf) - len(_HEADER_END) + 1)
+            return False
+        match = _CONTENT_LENGTH_RE.search(bytes(buf[:idx]))
+        self._content_length = int(match.group(1)) if match else None
+        if self._content_length is not None and self._content_length > self.max_part_size:
+            self._drop_part()
+            return True
+        del buf[:idx + len(_HEADER_END)]
+        self._scan_pos = 0
+        self._state = _BODY
+        return True
+
+    def _read_body(self) -> bytes | None:
+        buf = self._buf
+        if self._content_length is not None:
+            end = self._content_length
+            if len(buf) < end:
+                return None
+            next_pos = end
+        else:
+            idx = buf.find(self.boundary, self._scan_pos)
+            if idx == -1:
+                if len(buf) > self.max_part_size:
+                    self._drop_part()
+                else:
+                    self._scan_pos = max(0, len(buf) - len(self.boundary) + 1)
+                return None
+            end = idx
+            if end >= 2 and buf[end - 2] == 0x0D and buf[end - 1] == 0x0A:
+                end -= 2
+            next_pos = idx
+
+        with memoryview(buf) as view, view[:end] as body:
+            frame = bytes(body)
+        del buf[:next_pos]
+        self._scan_pos = 0
+        self._state = _SEEK_BOUNDARY
+        return frame
+
+    def _drop_part(self):
+        """Discards an oversized or malformed part and resynchronises on the next boundary."""
+        self.dropped_parts += 1
+        self._buf.clear()
+        self._scan_pos = 0
+        self._content_length = None
+        self._state = _SEEK_BOUNDARY
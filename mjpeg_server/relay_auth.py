@@ -0,0 +1,267 @@
+import asyncio
+import email.utils
+import hashlib
+import json
+import logging
+import re
+import time
+import urllib.request
+from collections import OrderedDict
+
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509.oid import NameOID
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_JWKS_URL = "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com"
+
+
+class AuthError(Exception):
+    pass
+
+
+def cache_ttl(headers: dict[str, str], default: float) -> float:
+    """Seconds a response may be reused for, from Cache-Control max-age (minus Age) or Expires."""
+    headers = {k.lower(): v for k, v in headers.items()}
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = re.search(r"max-age=(\d+)", cache_control)
+    if match:
+        return max(0.0, int(match.group(1)) - float(headers.get("age", "0") or 0))
+    if "expires" in headers:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(headers["expires"]).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0
+    return default
+
+
+async def fetch_url(url: str) -> tuple[dict, dict[str, str]]:
+    """GETs a JSON document in a worker thread; returns (body, headers)."""
+    def get():
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return json.load(response), dict(response.headers.items())
+    return await asyncio.to_thread(get)
+
+
+class JWKSCache:
+    """
+    Signing keys from a JWKS endpoint, kept for as long as the endpoint's
+    cache headers allow and refreshed by a background task before they
+    expire, so verifying a token never waits on the network. A token signed
+    with an unknown key id triggers one early refresh, rate limited to one
+    every `min_refresh_interval` seconds. If a refresh fails the old keys
+    stay in use and the refresh is retried.
+    """
+
+    def __init__(self, url: str = FIREBASE_JWKS_URL, fetch=fetch_url, default_ttl: float = 3600,
+                 min_ttl: float = 60, min_refresh_interval: float = 30, retry_interval: float = 30):
+        self.url = url
+        self.fetch = fetch
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.retry_interval = retry_interval
+        self.keys: dict[str, object] = {}  # kid -> public key
+        self.expires_at = 0.0
+        self.fetched_at = 0.0
+        self.refreshes = 0
+        self._last_attempt = float("-inf")
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def refresh(self, force: bool = True):
+        """Fetches the keys; unless `force`, skips it if the last attempt was under `min_refresh_interval` ago."""
+        async with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_attempt < self.min_refresh_interval:
+                return
+            self._last_attempt = now
+            body, headers = await self.fetch(self.url)
+            keys = {}
+            for jwk in body.get("keys", []):
+                try:
+                    key = jwt.PyJWK(jwk)
+                except jwt.PyJWKError as e:
+                    logger.warning(f"Skipping unusable JWK {jwk.get('kid')}: {e}")
+                    continue
+                keys[key.key_id] = key.key
+            if not keys:
+                raise AuthError(f"No usable keys at {self.url}")
+            now = time.monotonic()
+            self.keys = keys
+            self.fetched_at = now
+            self.expires_at = now + max(self.min_ttl, cache_ttl(headers, self.default_ttl))
+            self.refreshes += 1
+
+    async def get_key(self, kid: str):
+        key = self.keys.get(kid)
+        if key is not None and time.monotonic() < self.expires_at:
+            return key
+        # Keys expired (no background refresh, or it keeps failing), or the key rotated in early
+        try:
+            await self.refresh(force=False)
+        except Exception as e:
+            if not self.keys:
+                raise AuthError(f"Could not fetch signing keys: {e}") from e
+            logger.warning(f"JWKS refresh failed, using cached keys: {e}")
+        key = self.keys.get(kid)
+        if key is None:
+            raise AuthError(f"Unknown signing key {kid!r}")
+        return key
+
+    async def _refresh_loop(self):
+        while True:
+            if self.keys:
+                # Refresh at 80% of the lifetime so the cache never runs dry
+                lifetime = self.expires_at - self.fetched_at
+                await asyncio.sleep(max(0.0, self.fetched_at + 0.8 * lifetime - time.monotonic()))
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"JWKS refresh failed, retrying in {self.retry_interval:.0f} s: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens. A verified token is remembered by its digest
+    until its `exp`, in an LRU of at most `cache_size` entries, so a viewer
+    reconnecting with the same token skips the signature check.
+    """
+
+    def __init__(self, project_id: str, jwks: JWKSCache, cache_size: int = 4096, leeway: float = 5):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.jwks = jwks
+        self.cache_size = cache_size
+        self.leeway = leeway
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()  # digest -> (claims, exp)
+
+    async def verify(self, token: str) -> dict:
+        """Returns the token's claims; raises AuthError if it is not a valid ID token for the project."""
+        digest = hashlib.sha256(token.encode()).digest()
+        entry = self._cache.get(digest)
+        if entry is not None:
+            if time.time() < entry[1]:
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            del self._cache[digest]
+        self.misses += 1
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise AuthError(f"Malformed token: {e}") from e
+        if header.get("alg") != "RS256":
+            raise AuthError(f"Unexpected token algorithm {header.get('alg')!r}")
+        key = await self.jwks.get_key(header.get("kid"))
+        try:
+            claims = jwt.decode(token, key, algorithms=["RS256"], audience=self.project_id, issuer=self.issuer,
+                                leeway=self.leeway, options={"require": ["exp", "iat", "sub"]})
+        except jwt.PyJWTError as e:
+            raise AuthError(f"Invalid token: {e}") from e
+        if not claims["sub"] or claims.get("auth_time", 0) > time.time() + self.leeway:
+            raise AuthError("Invalid token subject or auth_time")
+
+        self._cache[digest] = (claims, claims["exp"])
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return claims
+
+    def forget_user(self, uid: str):
+        """Drops the cached tokens of a user, e.g. after their sessions were revoked."""
+        for digest in [d for d, (claims, _) in self._cache.items() if claims["sub"] == uid]:
+            del self._cache[digest]
+
+
+class DeviceCertVerifier:
+    """
+    Verifies device client certificates against the project CA. A validated
+    certificate is remembered by a digest of the presented PEM until it
+    expires, so a reconnecting device costs a hash and a dict lookup.
+
+    Revocation: `is_revoked(cert)`, if given, is consulted on every full
+    validation; `revoke(fingerprint)` rejects a certificate by its SHA-256
+    fingerprint from then on, and `forget_device(device_id)` only evicts it
+    so its next connection is validated (and checked with `is_revoked`) again.
+    """
+
+    def __init__(self, ca_cert: x509.Certificate, cache_size: int = 4096, is_revoked=None):
+        self.ca_cert = ca_cert
+        self.cache_size = cache_size
+        self.is_revoked = is_revoked
+        self.revoked: set[bytes] = set()
+        self.hits = 0
+        self.misses = 0
+        # presented digest -> (device_id, not_after timestamp, SHA-256 fingerprint)
+        self._cache: OrderedDict[bytes, tuple[str, float, bytes]] = OrderedDict()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "DeviceCertVerifier":
+        with open(path, "rb") as f:
+            return cls(x509.load_pem_x509_certificate(f.read()), **kwargs)
+
+    def verify(self, cert_pem: str | bytes) -> str:
+        """Returns the device id (the certificate CN); raises AuthError if the certificate is not acceptable."""
+        if isinstance(cert_pem, str):
+            cert_pem = cert_pem.encode()
+        digest = hashlib.sha256(cert_pem).digest()
+        entry = self._cache.get(digest)
+        if entry is not None:
+            if time.time() < entry[1]:
+                self._cache.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            del self._cache[digest]
+        self.misses += 1
+
+        try:
+            cert = x509.load_pem_x509_certificate(cert_pem)
+        except ValueError as e:
+            raise AuthError(f"Malformed certificate: {e}") from e
+        try:
+            cert.verify_directly_issued_by(self.ca_cert)
+        except (ValueError, TypeError) as e:
+            raise AuthError(f"Certificate not issued by the project CA: {e}") from e
+        except Exception as e:
+            raise AuthError(f"Certificate signature invalid: {e}") from e
+        now = time.time()
+        if not cert.not_valid_before_utc.timestamp() <= now < cert.not_valid_after_utc.timestamp():
+            raise AuthError("Certificate expired or not yet valid")
+        fingerprint = cert.fingerprint(hashes.SHA256())
+        if fingerprint in self.revoked or (self.is_revoked is not None and self.is_revoked(cert)):
+            raise AuthError("Certificate revoked")
+        names = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        if not names:
+            raise AuthError("Certificate has no common name")
+        device_id = names[0].value
+
+        self._cache[digest] = (device_id, cert.not_valid_after_utc.timestamp(), fingerprint)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return device_id
+
+    def revoke(self, fingerprint: bytes):
+        self.revoked.add(fingerprint)
+        for digest in [d for d, entry in self._cache.items() if entry[2] == fingerprint]:
+            del self._cache[digest]
+
+    def forget_device(self, device_id: str):
+        for digest in [d for d, entry in self._cache.items() if entry[0] == device_id]:
+            del self._cache[digest]
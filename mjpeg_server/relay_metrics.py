@@ -0,0 +1,123 @@
+from bisect import bisect_left
+
+# Seconds
+PARSE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+FRAME_AGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_FPS_SMOOTHING = 0.2
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class DeviceMetrics:
+    """
+    Counters for one device. They are plain attributes updated from the event
+    loop thread only, so no locking is needed and an update costs nanoseconds.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.fps = 0.0
+        self.dropped_by_closed_viewers = 0
+        self.parse_seconds = Histogram(PARSE_BUCKETS)
+        self.frame_age_seconds = Histogram(FRAME_AGE_BUCKETS)
+        self._last_frame_at = 0.0
+
+    def frame_received(self, size: int, now: float):
+        self.frames += 1
+        self.bytes += size
+        if self._last_frame_at:
+            interval = now - self._last_frame_at
+            if interval > 0:
+                self.fps += _FPS_SMOOTHING * (1 / interval - self.fps)
+        self._last_frame_at = now
+
+    def upload_ended(self):
+        # No frames are arriving any more; do not keep reporting the last rate
+        self.fps = 0.0
+        self._last_frame_at = 0.0
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RelayMetrics:
+    """Per-device relay metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.devices: dict[str, DeviceMetrics] = {}
+
+    def device(self, device_id: str) -> DeviceMetrics:
+        metrics = self.devices.get(device_id)
+        if metrics is None:
+            metrics = self.devices[device_id] = DeviceMetrics()
+        return metrics
+
+    def remove(self, device_id: str):
+        """Forgets a device, so devices that come and go do not pile up label values."""
+        self.devices.pop(device_id, None)
+
+    def render(self, viewers: dict, extra: dict[str, tuple[str, str, float]] | None = None) -> str:
+        """
+        Renders all metrics. `viewers` maps device ids to their live ViewerQueues;
+        `extra` adds relay-wide gauges as name -> (type, help, value).
+        """
+        lines = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def per_device(name: str, kind: str, help_text: str, value):
+            family(name, kind, help_text)
+            for device_id, metrics in self.devices.items():
+                lines.append(f'{name}{{device="{_label(device_id)}"}} {value(device_id, metrics)}')
+
+        def histogram(name: str, help_text: str, attr: str):
+            family(name, "histogram", help_text)
+            for device_id, metrics in self.devices.items():
+                hist = getattr(metrics, attr)
+                label = _label(device_id)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{device="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{device="{label}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{device="{label}"}} {hist.sum}')
+                lines.append(f'{name}_count{{device="{label}"}} {hist.count}')
+
+        per_device("feathershield_ingest_frames_total", "counter",
+                   "Frames received from the device.", lambda d, m: m.frames)
+        per_device("feathershield_ingest_bytes_total", "counter",
+                   "JPEG bytes received from the device.", lambda d, m: m.bytes)
+        per_device("feathershield_ingest_fps", "gauge",
+                   "Smoothed ingest frame rate.", lambda d, m: round(m.fps, 3))
+        histogram("feathershield_parse_seconds",
+                  "Time spent parsing each received chunk.", "parse_seconds")
+        histogram("feathershield_frame_age_seconds",
+                  "Time from frame receipt until it is handed to a viewer.", "frame_age_seconds")
+        per_device("feathershield_viewers", "gauge",
+                   "Viewers currently attached.", lambda d, m: len(viewers.get(d, ())))
+        per_device("feathershield_viewer_dropped_frames_total", "counter",
+                   "Frames skipped for slow viewers.",
+                   lambda d, m: m.dropped_by_closed_viewers + sum(q.dropped for q in viewers.get(d, ())))
+
+        for name, (kind, help_text, value) in (extra or {}).items():
+            family(name, kind, help_text)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
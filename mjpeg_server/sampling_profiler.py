@@ -0,0 +1,50 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Opt-in statistical profiler for the event loop thread.
+
+    A daemon thread snapshots the target thread's Python stack `hz` times a
+    second and counts identical stacks. The result is returned in the
+    collapsed format understood by flamegraph.pl and speedscope. Overhead is
+    proportional to `hz`, not to request or frame rate.
+    """
+
+    def __init__(self, hz: float = 100, max_depth: int = 64):
+        self.interval = 1 / hz
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = Counter()
+        self._target = None
+        self._running = False
+
+    def start(self, thread_id: int | None = None):
+        self._target = thread_id or threading.get_ident()
+        self._running = True
+        threading.Thread(target=self._run, name="sampling-profiler", daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _run(self):
+        while self._running:
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self, reset: bool = False) -> str:
+        stacks = self._stacks
+        if reset:
+            self._stacks = Counter()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+
+
+class DropPolicy(str, Enum):
+    LATEST = "latest"            # Keep only the newest pending frame
+    DROP_OLDEST = "drop-oldest"  # Keep up to max_size frames, evicting the oldest
+    MAX_LAG = "max-lag"          # Like drop-oldest, but skip frames older than max_lag_ms
+
+
+class ViewerQueue:
+    """
+    Bounded send queue for a single MJPEG viewer.
+
+    Frames are pushed by a pump task as soon as the uploader publishes them and
+    pulled by the response generator as fast as the viewer's socket allows. A
+    slow viewer therefore only ever holds `max_size` frame references, never
+    slows the pump, and never affects other viewers of the same device.
+    """
+
+    def __init__(self, device_id: str, policy: DropPolicy = DropPolicy.LATEST,
+                 max_size: int = 4, max_lag_ms: int = 500):
+        self.device_id = device_id
+        self.policy = policy
+        self.max_size = 1 if policy == DropPolicy.LATEST else max(1, max_size)
+        self.max_lag_ms = max_lag_ms
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        # Monotonic time the last frame returned by get() reached this queue
+        self.last_received_at = 0.0
+        self._frames = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, seq: int, frame: bytes):
+        if len(self._frames) >= self.max_size:
+            self._frames.popleft()
+            self.dropped += 1
+        self._frames.append((time.monotonic(), seq, frame))
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self) -> tuple[int, bytes] | None:
+        """Returns the next frame to send, or None once closed and drained."""
+        while True:
+            while not self._frames:
+                if self.closed:
+                    return None
+                self._ready.clear()
+                await self._ready.wait()
+            received_at, seq, frame = self._frames.popleft()
+            # The newest frame is always sent, however old, so a stalled camera still shows its last image
+            if (self.policy == DropPolicy.MAX_LAG and self._frames
+                    and (time.monotonic() - received_at) * 1000 > self.max_lag_ms):
+                self.dropped += 1
+                continue
+            self.sent += 1
+            self.last_received_at = received_at
+            return seq, frame
+
+    async def pump(self, channel):
+        """Copies frame references from a FrameChannel into this queue until the upload ends."""
+        last_seq = 0
+        try:
+            while True:
+                result = await channel.wait_for_frame(last_seq)
+                if result is None:
+                    break
+                seq, frame = result
+                # Frames published while the pump was not scheduled were never seen by this viewer
+                if last_seq and seq > last_seq + 1:
+                    self.dropped += seq - last_seq - 1
+                last_seq = seq
+                self.put(seq, frame)
+        finally:
+            self.close()
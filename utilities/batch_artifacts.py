@@ -0,0 +1,137 @@
+# batch_artifacts.py
+"""
+Prepares NVS images and QR codes for a whole production run.
+
+    python batch_artifacts.py devices.txt --out-folder ../out --workers 8
+
+The manifest is one device ID per line (blank lines and # comments are
+ignored), or a CSV with a `device_id` column. Every device gets its own
+folder, out_folder/devices/<device_id>, holding ca.crt, client.crt,
+client.key, nvs.csv, nvs.bin and <device_id>_qr.png. A stamp file records a
+hash of the inputs, so re-running the batch only rebuilds devices whose
+certificates, ID or partition size changed.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_nvs_bin import generate_nvs_bin
+from generate_qr import generate_qr_code
+
+STAMP_FILE = ".artifacts.stamp"
+# Bump when the NVS layout or QR payload changes, to rebuild everything
+ARTIFACTS_VERSION = "1"
+CERT_FILES = ("ca.crt", "client.crt", "client.key")
+
+
+def read_manifest(path) -> list[str]:
+    with open(path, newline="") as f:
+        lines = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    if lines and "device_id" in next(csv.reader([lines[0]])):
+        return [row["device_id"].strip() for row in csv.DictReader(lines) if row["device_id"].strip()]
+    return lines
+
+
+def device_folder(out_folder, device_id) -> str:
+    return os.path.join(out_folder, "devices", device_id)
+
+
+def input_digest(folder, device_id, partition_size) -> str:
+    digest = hashlib.sha256(f"{ARTIFACTS_VERSION}\0{device_id}\0{partition_size}".encode())
+    for name in CERT_FILES:
+        with open(os.path.join(folder, name), "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def outputs_exist(folder, device_id) -> bool:
+    return all(os.path.exists(os.path.join(folder, name)) for name in ("nvs.bin", f"{device_id}_qr.png"))
+
+
+def build_device_artifacts(out_folder, device_id, partition_size="16384", force=False) -> bool:
+    """Builds one device's NVS image and QR code unless they are up to date; returns True if it built them."""
+    folder = device_folder(out_folder, device_id)
+    missing = [name for name in CERT_FILES if not os.path.exists(os.path.join(folder, name))]
+    if missing:
+        raise FileNotFoundError(f"{', '.join(missing)} missing in {folder}")
+    digest = input_digest(folder, device_id, partition_size)
+    stamp_path = os.path.join(folder, STAMP_FILE)
+    if not force and outputs_exist(folder, device_id) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if f.read().strip() == digest:
+                return False
+    generate_nvs_bin(folder, device_id, partition_size)
+    generate_qr_code(folder, device_id)
+    # Stamp last: an interrupted build leaves no stamp and is redone next run
+    with open(stamp_path, "w") as f:
+        f.write(digest)
+    return True
+
+
+def _build(job):
+    out_folder, device_id, partition_size, force = job
+    try:
+        return device_id, build_device_artifacts(out_folder, device_id, partition_size, force), None
+    except Exception as e:
+        return device_id, False, str(e)
+
+
+def issue_missing_certs(out_folder, device_ids):
+    """Issues certificates for devices that have none yet, in this process, from one cached CA."""
+    missing = [d for d in device_ids
+               if not all(os.path.exists(os.path.join(device_folder(out_folder, d), name)) for name in CERT_FILES)]
+    if not missing:
+        return 0
+    from generate_device_certs import get_cert_factory, write_device_certs
+    factory = get_cert_factory()
+    for device_id in missing:
+        write_device_certs(factory, device_folder(out_folder, device_id), device_id)
+    return len(missing)
+
+
+def build_batch(out_folder, device_ids, partition_size="16384", workers=None, force=False):
+    """Returns (built, skipped, {device_id: error})."""
+    jobs = [(out_folder, device_id, partition_size, force) for device_id in device_ids]
+    built, skipped, failed = 0, 0, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(jobs) // ((workers or os.cpu_count() or 1) * 4))
+        for device_id, did_build, error in pool.map(_build, jobs, chunksize=chunksize):
+            if error:
+                failed[device_id] = error
+            elif did_build:
+                built += 1
+            else:
+                skipped += 1
+    return built, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate NVS images and QR codes for a batch of devices.")
+    parser.add_argument("manifest", type=str, help="File with one device ID per line, or a CSV with a device_id column")
+    parser.add_argument("--out-folder", type=str, default="firmware/esp32/build", help="Path to the output folder")
+    parser.add_argument("--skip_certs", action="store_true", help="Do not issue certificates for devices without them")
+    parser.add_argument("--partition-size", type=str, default="16384", help="NVS partition size in bytes")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every device even if its inputs are unchanged")
+    args = parser.parse_args()
+
+    device_ids = list(dict.fromkeys(read_manifest(args.manifest)))
+    start = time.perf_counter()
+    if not args.skip_certs:
+        issued = issue_missing_certs(args.out_folder, device_ids)
+        if issued:
+            print(f"Issued certificates for {issued} devices")
+    built, skipped, failed = build_batch(args.out_folder, device_ids, args.partition_size, args.workers, args.force)
+    elapsed = time.perf_counter() - start
+    for device_id, error in failed.items():
+        print(f"ERROR: {device_id}: {error}")
+    print(f"{len(device_ids)} devices in {elapsed:.1f} s: {built} built, {skipped} up to date, {len(failed)} failed")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
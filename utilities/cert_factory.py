@@ -0,0 +1,146 @@
+# cert_factory.py
+import argparse
+import datetime
+import queue
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+CERT_VALIDITY_DAYS = 3650
+
+
+def generate_key(key_type: str = "rsa"):
+    """RSA 4096 by default, as the devices have always used. "ec" gives ECDSA P-256, much faster to generate."""
+    if key_type == "ec":
+        return ec.generate_private_key(ec.SECP256R1())
+    if key_type == "rsa":
+        return rsa.generate_private_key(public_exponent=65537, key_size=4096)
+    raise ValueError(f"Unsupported key type: {key_type}")
+
+
+def key_to_pem(key) -> bytes:
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                             serialization.NoEncryption())
+
+
+class CertificateAuthority:
+    """The signing CA, held in memory only; its key never touches the disk."""
+
+    def __init__(self, cert: x509.Certificate, key):
+        self.cert = cert
+        self.key = key
+        self.cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+
+    @classmethod
+    def from_pem(cls, cert_pem: bytes, key_pem: bytes) -> "CertificateAuthority":
+        return cls(x509.load_pem_x509_certificate(cert_pem), serialization.load_pem_private_key(key_pem, password=None))
+
+    @classmethod
+    def generate(cls, common_name: str = "FeatherShield Test CA", key_type: str = "ec") -> "CertificateAuthority":
+        """A throwaway self-signed CA, for tests and local brokers."""
+        key = generate_key(key_type)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(minutes=5))
+                .not_valid_after(now + datetime.timedelta(days=CERT_VALIDITY_DAYS))
+                .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+                .sign(key, hashes.SHA256()))
+        return cls(cert, key)
+
+
+class KeyPool:
+    """
+    Keeps up to `size` device keys generated ahead of time by a background
+    thread, so issuing a certificate does not wait for key generation.
+    """
+
+    def __init__(self, key_type: str = "rsa", size: int = 16):
+        self.key_type = key_type
+        self._keys = queue.Queue(maxsize=size)
+        self._thread = threading.Thread(target=self._fill, name="key-pool", daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        while True:
+            self._keys.put(generate_key(self.key_type))
+
+    def take(self):
+        try:
+            return self._keys.get_nowait()
+        except queue.Empty:
+            # Drained faster than the pool refills; generate inline rather than wait
+            return generate_key(self.key_type)
+
+
+class CertFactory:
+    """Issues device client certificates signed in-process by a cached CA."""
+
+    def __init__(self, ca: CertificateAuthority, key_type: str = "rsa", pool_size: int = 16,
+                 days: int = CERT_VALIDITY_DAYS):
+        self.ca = ca
+        self.days = days
+        self.key_pool = KeyPool(key_type, pool_size) if pool_size else None
+        self.key_type = key_type
+
+    def _sign(self, subject: x509.Name, public_key, days: int = None) -> x509.Certificate:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (x509.CertificateBuilder()
+                .subject_name(subject)
+                .issuer_name(self.ca.cert.subject)
+                .public_key(public_key)
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(minutes=5))
+                .not_valid_after(now + datetime.timedelta(days=days or self.days))
+                .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+                .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False)
+                .sign(self.ca.key, hashes.SHA256()))
+
+    def sign_csr(self, csr_pem: bytes, device_id: str, days: int = None) -> bytes:
+        """
+        Signs a PEM CSR generated on the device and returns the PEM certificate.
+        The CSR's CN must be `device_id`: the relay and broker take the device
+        identity from the certificate CN, so signing any other name would hand
+        out a certificate for a different device.
+        """
+        csr = x509.load_pem_x509_csr(csr_pem)
+        if not csr.is_signature_valid:
+            raise ValueError("CSR signature is invalid")
+        names = csr.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        if len(names) != 1 or names[0].value != device_id:
+            raise ValueError(f"CSR common name {[n.value for n in names]} does not match device id {device_id!r}")
+        # Only the CN is carried over, so nothing else the device asked for ends up in the certificate
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, device_id)])
+        return self._sign(subject, csr.public_key(), days).public_bytes(serialization.Encoding.PEM)
+
+    def issue(self, device_id: str) -> tuple[bytes, bytes]:
+        """Returns (client certificate PEM, client key PEM) for a device, with CN=device_id."""
+        key = self.key_pool.take() if self.key_pool else generate_key(self.key_type)
+        subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, device_id)])
+        cert = self._sign(subject, key.public_key())
+        return cert.public_bytes(serialization.Encoding.PEM), key_to_pem(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time certificate issuance against a throwaway local CA.")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--key-type", choices=["ec", "rsa"], default="rsa")
+    parser.add_argument("--pool-size", type=int, default=16)
+    args = parser.parse_args()
+
+    factory = CertFactory(CertificateAuthority.generate(), key_type=args.key_type, pool_size=args.pool_size)
+    time.sleep(1)  # let the pool fill
+    start = time.perf_counter()
+    for i in range(args.count):
+        factory.issue(f"fs32-{i:012x}")
+    elapsed = time.perf_counter() - start
+    print(f"Issued {args.count} {args.key_type} certificates in {elapsed:.2f} s "
+          f"({elapsed / args.count * 1000:.1f} ms each)")
@@ -0,0 +1,216 @@
+# flash_station.py
+import hashlib
+import os
+import threading
+import time
+import zlib
+
+import esptool
+from esptool.cmds import _update_image_flash_params
+from esptool.loader import ERASE_WRITE_TIMEOUT_PER_MB, timeout_per_mb
+
+FLASH_MODE = "dio"
+FLASH_FREQ = "80m"
+FLASH_SIZE = "4MB"
+FLASH_BAUD = 921600
+
+# Images that are the same on every board, relative to the firmware build folder
+COMMON_IMAGES = [
+    (0x0, "bootloader/bootloader.bin"),
+    (0x8000, "partition_table/partition-table.bin"),
+    (0x10000, "feathershield.bin"),
+]
+NVS_OFFSET = 0x9000
+
+
+class FlashImage:
+    """An image ready to send: flash header patched, padded, hashed and compressed once."""
+
+    def __init__(self, address: int, name: str, data: bytes):
+        self.address = address
+        self.name = name
+        self.data = data
+        self.md5 = hashlib.md5(data).hexdigest()
+        self.compressed = zlib.compress(data, 9)
+
+    @classmethod
+    def prepare(cls, esp, address: int, name: str, data: bytes) -> "FlashImage":
+        data = data + b"\xff" * (-len(data) % 4)
+        # Same header rewrite `esptool write-flash --flash-mode/--flash-freq/--flash-size` does
+        data = _update_image_flash_params(esp, address, FLASH_FREQ, FLASH_MODE, FLASH_SIZE, data)
+        return cls(address, name, data)
+
+
+class ImageCache:
+    """
+    The common images of a firmware build, read and compressed once per chip
+    type and shared by every worker of the station.
+    """
+
+    def __init__(self, build_folder: str):
+        self.build_folder = build_folder
+        self._images = {}  # chip name -> [FlashImage]
+        self._lock = threading.Lock()
+
+    def get(self, esp) -> list[FlashImage]:
+        with self._lock:
+            images = self._images.get(esp.CHIP_NAME)
+            if images is None:
+                images = []
+                for address, name in COMMON_IMAGES:
+                    with open(os.path.join(self.build_folder, name), "rb") as f:
+                        images.append(FlashImage.prepare(esp, address, name, f.read()))
+                self._images[esp.CHIP_NAME] = images
+            return images
+
+
+def write_image(esp, image: FlashImage):
+    """Streams an already compressed image to the flasher stub and checks the result by MD5."""
+    esp.flash_defl_begin(len(image.data), len(image.compressed), image.address)
+    decompress = zlib.decompressobj()
+    timeout = None
+    for seq, start in enumerate(range(0, len(image.compressed), esp.FLASH_WRITE_SIZE)):
+        block = image.compressed[start:start + esp.FLASH_WRITE_SIZE]
+        # The stub erases ahead while it inflates, so allow for a couple of extra 64 KiB erases
+        timeout = timeout_per_mb(ERASE_WRITE_TIMEOUT_PER_MB, len(decompress.decompress(block)) + 2 * 0x10000)
+        esp.flash_defl_block(block, seq, timeout=timeout)
+    # The stub acks blocks before writing them; this waits for the last one to land
+    esp.flash_defl_finish(reboot=False, timeout=timeout)
+    if esp.flash_md5sum(image.address, len(image.data)) != image.md5:
+        raise esptool.FatalError(f"MD5 of {image.name} does not match data in flash")
+
+
+class BoardResult:
+    def __init__(self, port: str):
+        self.port = port
+        self.device_id = None
+        self.error = None
+        self.timings = {}  # step -> seconds
+        self.written = []
+        self.skipped = []
+
+    @property
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+    def summary(self) -> str:
+        if self.error:
+            return f"{self.port}: FAILED after {self.total:.1f} s: {self.error}"
+        steps = ", ".join(f"{step} {seconds:.1f} s" for step, seconds in self.timings.items())
+        return (f"{self.port}: {self.device_id} in {self.total:.1f} s ({steps}); "
+                f"wrote {', '.join(self.written)}; unchanged {', '.join(self.skipped) or 'none'}")
+
+
+class _Timer:
+    def __init__(self, result: BoardResult, step: str):
+        self.result = result
+        self.step = step
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.result.timings[self.step] = self.result.timings.get(self.step, 0) + time.perf_counter() - self.start
+
+
+def provision_board(port: str, images: ImageCache, prepare_device, chip: str = None,
+                    baud: int = FLASH_BAUD) -> BoardResult:
+    """
+    Provisions the board on `port` over a single esptool connection: reads the
+    MAC, calls `prepare_device(device_id)` for the path of its nvs.bin, writes
+    whichever common images differ from flash and then the NVS partition.
+    """
+    result = BoardResult(port)
+    try:
+        with _Timer(result, "connect"):
+            esp = esptool.detect_chip(port)
+        with esp:
+            with _Timer(result, "connect"):
+                if chip and esp.CHIP_NAME.lower().replace("-", "") != chip.lower():
+                    raise esptool.FatalError(f"Expected {chip}, found {esp.CHIP_NAME}")
+                esp = esp.run_stub()
+                if baud > esp.ESP_ROM_BAUD:
+                    esp.change_baud(baud)
+                esptool.attach_flash(esp)
+                esp.flash_set_parameters(esptool.flash_size_bytes(FLASH_SIZE))
+                mac = esp.read_mac()
+            result.device_id = f"fs32-{''.join(f'{b:02x}' for b in mac)}"
+
+            with _Timer(result, "artifacts"):
+                nvs_path = prepare_device(result.device_id)
+                with open(nvs_path, "rb") as f:
+                    nvs = FlashImage.prepare(esp, NVS_OFFSET, "nvs.bin", f.read())
+
+            for image in images.get(esp):
+                with _Timer(result, "verify"):
+                    unchanged = esp.flash_md5sum(image.address, len(image.data)) == image.md5
+                if unchanged:
+                    result.skipped.append(image.name)
+                    continue
+                with _Timer(result, "flash"):
+                    write_image(esp, image)
+                result.written.append(image.name)
+            with _Timer(result, "flash"):
+                write_image(esp, nvs)
+            result.written.append(nvs.name)
+            esptool.reset_chip(esp, "hard-reset")
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+def port_present(port: str) -> bool:
+    from serial.tools import list_ports
+    return port in (p.device for p in list_ports.comports()) or os.path.exists(port)
+
+
+class FlashStation:
+    """
+    One worker thread per serial port. A worker provisions the board on its
+    port, then waits for it to be unplugged and the next one to appear, so a
+    technician can keep swapping boards on every port of a tray.
+    """
+
+    def __init__(self, ports: list[str], images: ImageCache, prepare_device, chip: str = None,
+                 baud: int = FLASH_BAUD, once: bool = False, poll_interval: float = 0.5):
+        self.ports = ports
+        self.images = images
+        self.prepare_device = prepare_device
+        self.chip = chip
+        self.baud = baud
+        self.once = once
+        self.poll_interval = poll_interval
+        self.results = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _wait_for(self, port: str, present: bool) -> bool:
+        while port_present(port) != present:
+            if self._stop.wait(self.poll_interval):
+                return False
+        return True
+
+    def _worker(self, port: str):
+        while self._wait_for(port, True):
+            result = provision_board(port, self.images, self.prepare_device, self.chip, self.baud)
+            with self._lock:
+                self.results.append(result)
+            print(result.summary())
+            if self.once or not self._wait_for(port, False):
+                return
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, args=(port,), name=f"flash-{port}", daemon=True)
+                   for port in self.ports]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self._stop.set()
+        return self.results
+
+    def stop(self):
+        self._stop.set()
@@ -1,12 +1,10 @@
 # generate_device_certs.py
 import os
-import shutil
-import subprocess
-import tempfile
-import uuid
 
 from google.cloud import secretmanager_v1
 
+from cert_factory import CertFactory, CertificateAuthority
+
 DEVICE_ID = "esp32-001"
 
 def access_secret_payload(project_id: str, secret_id: str, version_id: str) -> bytes:
@@ -21,12 +19,14 @@ def access_secret_payload(project_id: str, secret_id: str, version_id: str) -> b
     payload = response.payload.data
     return payload
 
-def create_file_from_secret(path: str, project_id: str, secret_id: str, version_id: str = "latest"):
-    secret_bytes = access_secret_payload(project_id, secret_id, version_id)
-    with open(path, "wb") as f:
-        f.write(secret_bytes)
+# Loaded once per session; the CA key is only ever held in memory
+_factory = None
+
+def get_cert_factory() -> CertFactory:
+    global _factory
+    if _factory is not None:
+        return _factory
 
-def generate_certs(out_folder, device_id):
     if not os.environ.get("FEATHERSHIELD_PROJECT_ID"):
         raise ValueError("FEATHERSHIELD_PROJECT_ID environment variable must be set.")
     project_id = os.environ.get("FEATHERSHIELD_PROJECT_ID")
@@ -38,25 +38,29 @@ def generate_certs(out_folder, device_id):
     if not os.environ.get("FEATHERSHIELD_CA_KEY_SECRET_ID"):
         raise ValueError("FEATHERSHIELD_CA_KEY_SECRET_ID environment variable must be set.")
     ca_key_secret_id = os.environ.get("FEATHERSHIELD_CA_KEY_SECRET_ID")
-    
-    # Generate temp folder
-    tmp_folder = tempfile.mkdtemp()
-    ca_folder = os.path.join(tmp_folder, "ca")
+
+    ca = CertificateAuthority.from_pem(
+        access_secret_payload(project_id, ca_cert_secret_id, "latest"),
+        access_secret_payload(project_id, ca_key_secret_id, "latest"),
+    )
+    # RSA unless FEATHERSHIELD_KEY_TYPE=ec; check the firmware's mbedTLS ECDSA support before switching
+    _factory = CertFactory(ca, key_type=os.environ.get("FEATHERSHIELD_KEY_TYPE", "rsa"))
+    return _factory
+
+def write_device_certs(factory: CertFactory, out_folder, device_id):
+    """Writes ca.crt, client.crt and client.key for a device into out_folder."""
     os.makedirs(out_folder, exist_ok=True)
-    os.makedirs(ca_folder, exist_ok=True)
-    create_file_from_secret(f"{os.path.join(ca_folder, 'ca.crt')}", project_id, ca_cert_secret_id)
-    create_file_from_secret(f"{os.path.join(ca_folder, 'ca.key')}", project_id, ca_key_secret_id)
-    # Copy ca.crt to out_folder as we will need to copy it to the ESP32
-    shutil.copy(f"{os.path.join(ca_folder, 'ca.crt')}", f"{os.path.join(out_folder, 'ca.crt')}")
-
-    # Generate client private key
-    subprocess.run(["openssl", "genrsa", "-out", f"{out_folder}/client.key", "4096"], check=True)
-    # Create client CSR
-    subprocess.run(["openssl", "req", "-new", "-key", f"{out_folder}/client.key", "-out", f"{tmp_folder}/client.csr", "-subj", f"/CN={device_id}"])
-    # Sign client certificate with the CA
-    subprocess.run(["openssl", "x509", "-req", "-in", f"{tmp_folder}/client.csr", "-CA", f"{ca_folder}/ca.crt", "-CAkey", f"{ca_folder}/ca.key", "-CAcreateserial", "-out", f"{out_folder}/client.crt", "-days", "3650", "-sha256"], check=True)
-    # Remove temp folder
-    shutil.rmtree(tmp_folder)
+    cert_pem, key_pem = factory.issue(device_id)
+    # ca.crt goes to the ESP32 along with the client certificate
+    with open(os.path.join(out_folder, "ca.crt"), "wb") as f:
+        f.write(factory.ca.cert_pem)
+    with open(os.path.join(out_folder, "client.crt"), "wb") as f:
+        f.write(cert_pem)
+    with open(os.path.join(out_folder, "client.key"), "wb") as f:
+        f.write(key_pem)
+
+def generate_certs(out_folder, device_id):
+    write_device_certs(get_cert_factory(), out_folder, device_id)
 
 if __name__ == "__main__":
     generate_certs("../out", DEVICE_ID)
@@ -1,56 +1,60 @@
 import csv
+import io
 import os
-import subprocess
-import sys
+
+from esp_idf_nvs_partition_gen.nvs_partition_gen import Page, nvs_open
+
+# (key, type, encoding, value); "file" values are paths relative to the device folder
+def nvs_entries(device_id):
+    return [
+        ("certs", "namespace", "", ""),
+        ("client_cert", "file", "string", "client.crt"),
+        ("client_key", "file", "string", "client.key"),
+        ("ca_cert", "file", "string", "ca.crt"),
+        ("info", "namespace", "", ""),
+        ("device_id", "data", "string", device_id),
+    ]
+
+
+def encode_nvs(out_folder, device_id, partition_size="16384") -> bytes:
+    """
+    Builds the NVS partition image in-process with the encoder behind ESP-IDF's
+    nvs_partition_gen.py, so no interpreter is spawned per device.
+    """
+    # Same reservation as nvs_partition_gen.py: the last page is kept free for the NVS
+    input_size = int(partition_size, 0) - Page.PAGE_PARAMS["max_size"]
+    output = io.BytesIO()
+    with nvs_open(output, input_size, Page.VERSION2) as nvs:
+        for key, datatype, encoding, value in nvs_entries(device_id):
+            if datatype == "namespace":
+                nvs.write_namespace(key)
+                continue
+            if datatype == "file":
+                with open(os.path.join(out_folder, value), "rb") as f:
+                    value = f.read()
+            nvs.write_entry(key, value, encoding)
+    return output.getvalue()
 
 
 def generate_nvs_bin(out_folder, device_id, partition_size="16384") -> str:
     csv_file_path = os.path.join(out_folder, f"nvs.csv")
     bin_file_path = os.path.join(out_folder, f"nvs.bin")
 
+    # Kept alongside the binary so it can be regenerated with the ESP-IDF tool if needed
     with open(csv_file_path, mode="w", newline="") as csv_file:
         writer = csv.writer(csv_file)
         writer.writerow(["key", "type", "encoding", "value"])
-        writer.writerow(["certs", "namespace", "", ""])
-        writer.writerow(["client_cert", "file", "string", "client.crt"])
-        writer.writerow(["client_key", "file", "string", "client.key"])
-        writer.writerow(["ca_cert", "file", "string", "ca.crt"])
-        writer.writerow(["info", "namespace", "", ""])
-        writer.writerow(["device_id", "data", "string", device_id])
-    print(f"Generated NVS CSV at {csv_file_path}")
-
-    idf_path = os.getenv("IDF_PATH")
-    if not idf_path:
-        raise EnvironmentError("IDF_PATH environment variable is not set. "
-                            "Please source the ESP-IDF export script (e.g., 'get_idf' or '. ./export.sh').")
-    
-    nvs_tool_path = os.path.join(idf_path, "components", "nvs_flash", "nvs_partition_generator", "nvs_partition_gen.py")
-    command = [
-        sys.executable,
-        nvs_tool_path,
-        "generate",
-        os.path.basename(csv_file_path), # Use basename as we run from out_folder
-        os.path.basename(bin_file_path),
-        partition_size
-    ]
-    try:
-        print(f"Running command: {' '.join(command)}")
-        # We must run the command from the output directory so the tool can find the certificate files
-        result = subprocess.run(command, check=True, cwd=out_folder, capture_output=True, text=True)
-        if not os.path.exists(bin_file_path):
-            print(result.stderr)
-            raise FileNotFoundError(f"NVS binary file was not created at {bin_file_path}")
-        print(result.stdout)
-        print(f"Successfully generated NVS binary at {bin_file_path}")
-    except subprocess.CalledProcessError as e:
-        print("ERROR: Failed to generate NVS binary.")
-        print(f"STDOUT:\n{e.stdout}")
-        print(f"STDERR:\n{e.stderr}")
-        raise e
-
+        writer.writerows(nvs_entries(device_id))
 
+    data = encode_nvs(out_folder, device_id, partition_size)
+    # Write then rename, so a concurrent reader never sees a partial image
+    tmp_path = bin_file_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, bin_file_path)
+    print(f"Generated NVS binary at {bin_file_path}")
     return csv_file_path
 
 if __name__ == "__main__":
-    generate_nvs_bin("../out")
-    print(f"Generated NVS CSV")
\ No newline at end of file
+    generate_nvs_bin("../out", "esp32-001")
+    print(f"Generated NVS CSV")
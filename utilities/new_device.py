@@ -1,12 +1,9 @@
 import argparse
-from generate_device_certs import generate_certs
-from generate_qr import generate_qr_code
-from utilities.generate_nvs_bin import generate_nvs_bin
+from batch_artifacts import CERT_FILES, build_device_artifacts, device_folder
+from flash_station import FLASH_BAUD, FlashStation, ImageCache, provision_board
+from generate_device_certs import generate_certs, get_cert_factory
 import os
-import shlex
-import subprocess
-import uuid
-import esptool
+import shutil
 
 def get_mac_address_from_module(esp) -> str | None:
     """
@@ -27,45 +24,66 @@ def get_device_id(esp) -> str:
     device_id = f"fs32-{mac.replace(':', '')}"
     return device_id
 
+def use_existing_certs(out_folder, folder):
+    """
+    For --skip_certs: the device folder must already hold the certificates.
+    Any that are missing are copied from out_folder, where they were kept
+    before each device got its own folder.
+    """
+    missing = [name for name in CERT_FILES if not os.path.exists(os.path.join(folder, name))]
+    not_found = [name for name in missing if not os.path.exists(os.path.join(out_folder, name))]
+    if not_found:
+        raise FileNotFoundError(f"--skip_certs: {', '.join(not_found)} not found in {folder} or {out_folder}")
+    os.makedirs(folder, exist_ok=True)
+    for name in missing:
+        shutil.copy2(os.path.join(out_folder, name), os.path.join(folder, name))
+
+def prepare_device_folder(out_folder, device_id, skip_certs=False) -> str:
+    """Generates a device's certificates, NVS image and QR code in its own folder and returns the nvs.bin path."""
+    folder = device_folder(out_folder, device_id)
+    if skip_certs:
+        use_existing_certs(out_folder, folder)
+    else:
+        generate_certs(folder, device_id)
+    build_device_artifacts(out_folder, device_id)
+    return os.path.join(folder, "nvs.bin")
+
 def main():
     parser = argparse.ArgumentParser(description="Provision a new device.")
     parser.add_argument("--out-folder", type=str, default="firmware/esp32/build", help="Path to the output folder")
     parser.add_argument("--skip_certs", action="store_true", help="Skip certificate generation")
     parser.add_argument("--port", type=str, default="COM4", help="Serial port for flashing (e.g., COM1 or /dev/ttyUSB0)")
-    parser.add_argument("--baud", type=int, default=115200, help="Baud rate for flashing")
+    parser.add_argument("--ports", type=str, help="Station mode: comma separated serial ports to provision concurrently")
+    parser.add_argument("--once", action="store_true", help="Station mode: provision one board per port, then exit")
+    parser.add_argument("--baud", type=int, default=FLASH_BAUD, help="Baud rate negotiated for flashing")
     parser.add_argument("--chip", type=str, default="esp32s3", help="Chip type (e.g., esp32, esp32s2, esp32s3)")
     args = parser.parse_args()
     out_folder = args.out_folder
 
-    print(f"Connecting to {args.port} via esptool module...")
-    with esptool.detect_chip(args.port) as esp:
-        esp.connect()
-        device_id = get_device_id(esp)
-    print(f"Using device ID: {device_id}")
-
     if not args.skip_certs:
-        generate_certs(out_folder, device_id)
-    generate_nvs_bin(out_folder, device_id)
-    generate_qr_code(out_folder, device_id)
+        # Fetch the CA before the workers start, so they all share one factory
+        get_cert_factory()
+    images = ImageCache(out_folder)
 
-    print("Flashing device...")
-    addr_data = [
-        (0x0, f"{out_folder}/bootloader/bootloader.bin"),
-        (0x10000, f"{out_folder}/feathershield.bin"),
-        (0x8000, f"{out_folder}/partition_table/partition-table.bin"),
-        (0x9000, f"{out_folder}/nvs.bin"),
-    ]
-    use_esptool_module = False
-    if use_esptool_module == True:
- 
-        with esptool.detect_chip(args.port) as esp:
-            esp.connect()
-            esptool.write_flash(esp, addr_data, flash_mode="dio", flash_freq="80m", flash_size="4MB", compress=True)
-    else:
-        addr_data_str = " ".join(f"0x{addr:02x} {path}" for addr, path in addr_data)
-        command = f"esptool -p {args.port} -b {args.baud} --before default-reset --after hard-reset --chip {args.chip} write-flash --flash-mode dio --flash-freq 80m --flash-size 4MB {addr_data_str} --compress"
-        subprocess.run(shlex.split(command), check=True)
+    def prepare_device(device_id):
+        print(f"Using device ID: {device_id}")
+        return prepare_device_folder(out_folder, device_id, args.skip_certs)
+
+    if args.ports:
+        ports = [port.strip() for port in args.ports.split(",") if port.strip()]
+        print(f"Station watching {', '.join(ports)}; Ctrl+C to stop")
+        station = FlashStation(ports, images, prepare_device, chip=args.chip, baud=args.baud, once=args.once)
+        results = station.run()
+        failed = [r for r in results if r.error]
+        print(f"Provisioned {len(results) - len(failed)} boards, {len(failed)} failed")
+        return
+
+    print(f"Connecting to {args.port} via esptool module...")
+    result = provision_board(args.port, images, prepare_device, chip=args.chip, baud=args.baud)
+    print(result.summary())
+    if result.error:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()